@@ -1,19 +1,28 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import requests, re
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
 import streamlit.components.v1 as components
 from datetime import date
+from collections import OrderedDict
+
+import pandas as pd
+
+import base_iw58
+import cubo_iw58
+import sql_iw58
+import metricas_iw58
+import periodo_iw58
+from metricas_iw58 import METRICAS, etapa
+from graficos_iw58 import pedir_cards, resolver_cards
+from relatorio_iw58 import gerar_pdf, FilaRelatorios, PdfParcial, figuras_dos_cards
 
 # ======================================================
 # CONFIG
 # ======================================================
 st.set_page_config(page_title="Dashboard Notas – AM x AS", layout="wide")
+T0_RERUN = time.perf_counter()  # etapa "rerun" (registrada no fim do script)
 
 # ======================================================
 # CSS (visual do dashboard + organização)
@@ -183,447 +192,103 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# ======================================================
-# CONSTANTES / CORES
-# ======================================================
-MESES_PT = {
-    1: "JANEIRO", 2: "FEVEREIRO", 3: "MARÇO", 4: "ABRIL",
-    5: "MAIO", 6: "JUNHO", 7: "JULHO", 8: "AGOSTO",
-    9: "SETEMBRO", 10: "OUTUBRO", 11: "NOVEMBRO", 12: "DEZEMBRO"
-}
-MESES_ORDEM = [MESES_PT[i] for i in range(1, 13)]
-
-COR_PROC = "#2e7d32"
-COR_IMP  = "#c62828"
-COR_OUT  = "#546e7a"
-COR_TOT  = "#fcba03"
-
 # ======================================================
 # HELPERS (colunas / validação)
 # ======================================================
-def achar_coluna(df, palavras):
-    for col in df.columns:
-        for p in palavras:
-            if p in col:
-                return col
-    return None
-
-def validar_estrutura(df):
-    obrig = {
-        "ESTADO/UF": ["ESTADO", "LOCALIDADE", "UF"],
-        "RESULTADO": ["RESULTADO"],
-        "TIPO": ["TIPO"],
-        "DATA": ["DATA"],
-    }
-    faltando = [nome for nome, alts in obrig.items() if not achar_coluna(df, alts)]
-    if faltando:
-        st.error("Estrutura da base incompatível. Faltando: " + ", ".join(faltando))
+def validar_estrutura(colunas):
+    try:
+        base_iw58.validar_colunas(colunas)
+    except base_iw58.EstruturaIncompativel as e:
+        st.error(str(e))
         st.stop()
 
-def _extrair_drive_id(url: str):
-    # formatos comuns de links do Drive:
-    # https://drive.google.com/uc?id=FILEID
-    # https://drive.google.com/file/d/FILEID/view?usp=sharing
-    m = re.search(r"[?&]id=([a-zA-Z0-9-_]+)", url)
-    if m:
-        return m.group(1)
-    m = re.search(r"/file/d/([a-zA-Z0-9-_]+)", url)
-    if m:
-        return m.group(1)
-    return None
-
-def _drive_direct_download(url: str) -> str:
+@st.cache_resource(show_spinner=False)
+def atualizador_base(fontes) -> base_iw58.AtualizadorBase:
     """
-    Converte link do Google Drive para link de download direto.
-    - Se já for uc?id=... mantém.
-    - Se for /file/d/... converte para uc?id=...
+    Worker único (por processo) que mantém a base carregada e atualizada a cada 10 min.
+    - fontes: link(s) do Drive / abas que compõem a base (FONTES_BASE)
+    - O parse pesado só acontece quando o arquivo muda (snapshot local em base_iw58)
+    - As consultas dos cards vêm do motor (MOTOR_BASE), montado junto com cada versão
+      nova (ou atualizado pelo delta, quando só entraram/mudaram notas):
+      - "pandas": cubo de agregação (cubo_iw58), publicado uma vez em memória
+        compartilhada (/dev/shm) e lido por todos os processos sem cópia
+      - "sqlite": banco local com filtros/agregações em SQL (sql_iw58) — memória
+        por processo limitada e cold start imediato
+    - Nenhuma sessão paga download/parse no rerun: todas leem a última versão boa
     """
-    did = _extrair_drive_id(url)
-    if did:
-        return f"https://drive.google.com/uc?id={did}"
-    return url
-
-def _bytes_is_html(raw: bytes) -> bool:
-    head = raw[:800].lstrip().lower()
-    return head.startswith(b"<!doctype html") or b"<html" in head
-
-def _bytes_is_xlsx(raw: bytes) -> bool:
-    # XLSX é um ZIP: começa com "PK"
-    return raw[:2] == b"PK"
+    if MOTOR_BASE == "sqlite":
+        motor = sql_iw58.MotorSQL(sql_iw58.caminho_banco(fontes))
+    else:
+        motor = cubo_iw58.MotorCubo(cubo_iw58.raiz_compartilhada(fontes))
+    return base_iw58.AtualizadorBase(fontes, intervalo=600, motor=motor)
 
-@st.cache_data(ttl=600, show_spinner="🔄 Carregando base (XLSX/CSV)...")
-def carregar_base(url_original: str) -> pd.DataFrame:
+def carregar_base(fontes) -> base_iw58.VersaoBase:
     """
-    Carrega base do Google Drive (preferencialmente XLSX).
-    - Se a resposta vier como XLSX, lê via pd.read_excel(engine='openpyxl')
-    - Se vier como CSV, lê via pd.read_csv com detecção de encoding
+    Retorna a última versão boa da base (df, info e cubo).
+    - info: status do download (304/inalterado/alterado), bytes e tempos
     - Se vier HTML, mostra erro de permissão/link
     """
-    url = _drive_direct_download(url_original)
-
-    r = requests.get(url, timeout=60)
-    r.raise_for_status()
-    raw = r.content
-
-    if _bytes_is_html(raw):
-        raise RuntimeError("URL retornou HTML (provável permissão/link). No Drive: 'Qualquer pessoa com o link' (Visualizador).")
-
-    # ✅ Preferência: XLSX
-    if _bytes_is_xlsx(raw):
-        # Se quiser escolher aba, troque sheet_name (ex.: 0 ou "Plan1")
-        df = pd.read_excel(BytesIO(raw), sheet_name=0, engine="openpyxl")
-        df.columns = df.columns.astype(str).str.upper().str.strip()
-        return df
-
-    # fallback: CSV
-    for enc in ["utf-8-sig", "utf-8", "cp1252", "latin1"]:
-        try:
-            df = pd.read_csv(BytesIO(raw), sep=None, engine="python", encoding=enc)
-            df.columns = df.columns.astype(str).str.upper().str.strip()
-            return df
-        except UnicodeDecodeError:
-            continue
-
-    df = pd.read_csv(BytesIO(raw), sep=None, engine="python", encoding="utf-8", encoding_errors="replace")
-    df.columns = df.columns.astype(str).str.upper().str.strip()
-    return df
-
-def _titulo_plotly(fig, titulo: str, uf: str):
-    uf_txt = uf if uf != "TOTAL" else "TODOS"
-    fig.update_layout(
-        title=f"{titulo} • {uf_txt}",
-        title_x=0.0,
-        title_font=dict(size=14, color="#FFFFFF", family="Arial Black")
-    )
-    return fig
+    with st.spinner("🔄 Carregando base (XLSX/CSV)..."), etapa("obter_base"):
+        return atualizador_base(fontes).obter()
 
 # ======================================================
-# GRÁFICOS AUXILIARES
+# CARDS (agregados + figuras de um filtro)
 # ======================================================
-def donut_resultado(df_base):
-    proc = df_base["_RES_"].str.contains("PROCED", na=False).sum()
-    imp  = df_base["_RES_"].str.contains("IMPROCED", na=False).sum()
-    dados = pd.DataFrame({"Resultado": ["Procedente", "Improcedente"], "QTD": [proc, imp]})
-    fig = px.pie(
-        dados, names="Resultado", values="QTD", hole=0.62,
-        template="plotly_white",
-        color="Resultado",
-        color_discrete_map={"Procedente": COR_PROC, "Improcedente": COR_IMP}
-    )
-    fig.update_layout(height=260, margin=dict(l=10, r=10, t=60, b=10), legend_title_text="")
-    fig.update_traces(textinfo="percent+value")
-    return fig
+MEMO_CARDS_MAX = 16  # combinações de filtro guardadas por sessão (LRU)
+MAX_CARDS_PARALELOS = 4  # threads que montam os cards de um filtro
 
-def barh_contagem(df_base, col_dim, titulo, uf):
-    if col_dim is None or df_base.empty:
-        return None
-
-    dados = (
-        df_base
-        .groupby(col_dim)
-        .size()
-        .reset_index(name="QTD")
-        .sort_values("QTD")
-    )
-
-    if dados.empty:
-        return None
+@st.cache_resource(show_spinner=False)
+def pool_cards() -> ThreadPoolExecutor:
+    """Threads do processo (compartilhadas entre sessões) para montar os cards em paralelo."""
+    return ThreadPoolExecutor(max_workers=MAX_CARDS_PARALELOS, thread_name_prefix="cards")
 
-    total = int(dados["QTD"].sum())
-    total_fmt = f"{total:,}".replace(",", ".")
-
-    fig = px.bar(
-        dados,
-        x="QTD",
-        y=col_dim,
-        orientation="h",
-        text="QTD",
-        template="plotly_white"
-    )
-
-    fig.update_layout(
-        height=300,
-        margin=dict(l=10, r=10, t=70, b=10),
-        showlegend=False,
-    )
+def calcular_cards(cubo_periodo, uf_sel, chave_periodo=None):
+    """
+    Cards de um período + UF (graficos_iw58.pedir_cards): {nome: Future}, montados em
+    paralelo no pool do processo. As figuras não são alteradas depois (memo da sessão).
+    """
+    return pedir_cards(cubo_periodo, uf_sel, COL_REGIONAL, COL_MOTIVO, pool_cards(), chave_periodo)
 
-    # 🔥 Oculta eixo X (escala) — mantém apenas os valores nas barras
-    fig.update_xaxes(visible=False, showticklabels=False, ticks="", showgrid=False, zeroline=False)
+def mostrar_grafico(nome, fig):
+    """st.plotly_chart medido como a etapa "render:<nome>" (serialização da figura)."""
+    with etapa(f"render:{nome}"):
+        st.plotly_chart(fig, use_container_width=True)
 
-    fig.update_traces(textposition="outside", cliponaxis=False)
-    fig.update_yaxes(title_text="")
+ESPERA_PDF = 20  # segundos que o clique em "Gerar PDF" espera antes de liberar a tela
 
-    # ✅ TOTAL DO GRÁFICO (único)
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=0.98, y=1.12,
-        text=f"TOTAL: {total_fmt}",
-        showarrow=False,
-        font=dict(size=13, color=COR_TOT, family="Arial Black"),
-        align="right"
-    )
+@st.cache_resource(show_spinner=False)
+def fila_relatorios() -> FilaRelatorios:
+    """Fila única (por processo) de PDFs sob demanda, com cache por versão + filtro."""
+    return FilaRelatorios()
 
-    return _titulo_plotly(fig, titulo, uf)
+def memo_sessao(chave, calcular, limite=MEMO_CARDS_MAX):
+    """
+    LRU por sessão (st.session_state): mesmo filtro + mesma versão da base
+    reaproveita agregados e figuras (ex.: clique em download/print, vai-e-volta de UF).
+    - Cards com falha (Future com exceção) não ficam no memo: o próximo rerun recalcula
+    """
+    memo = st.session_state.setdefault("_memo_cards", OrderedDict())
+    if chave in memo and any(t.done() and t.exception() is not None for t in memo[chave].values()):
+        del memo[chave]
+    if chave in memo:
+        memo.move_to_end(chave)
+        return memo[chave]
+    valor = calcular()
+    memo[chave] = valor
+    while len(memo) > limite:
+        memo.popitem(last=False)
+    return valor
 
 # ======================================================
-# ACUMULADO MENSAL (gráfico + tabelinha + boquinhas + total direito)
+# CARREGAMENTO (XLSX no Drive)
 # ======================================================
-def acumulado_mensal_fig_e_tabela(df_base, col_data):
-    base = df_base.dropna(subset=[col_data]).copy()
-    if base.empty:
-        return None, None
-
-    # =========================
-    # Preparação dos dados
-    # =========================
-    base["MES_NUM"] = base[col_data].dt.month
-    base["MÊS"] = base["MES_NUM"].map(MESES_PT)
-
-    base["_CLASSE_"] = "OUTROS"
-    base.loc[base["_RES_"].str.contains("PROCED", na=False), "_CLASSE_"] = "PROCEDENTE"
-    base.loc[base["_RES_"].str.contains("IMPROCED", na=False), "_CLASSE_"] = "IMPROCEDENTE"
-
-    classes = ["PROCEDENTE", "IMPROCEDENTE", "OUTROS"]
-
-    # =========================
-    # Contagem bruta por mês/classe
-    # =========================
-    dados_raw = (
-        base.groupby(["MES_NUM", "MÊS", "_CLASSE_"])
-        .size()
-        .reset_index(name="QTD")
-    )
-
-    # =========================
-    # Garante 12 meses + todas classes (para não “sumir” mês sem dado)
-    # =========================
-    meses_df = pd.DataFrame({"MES_NUM": list(range(1, 13))})
-    meses_df["MÊS"] = meses_df["MES_NUM"].map(MESES_PT)
-
-    grid = (
-        meses_df.assign(_k=1)
-        .merge(pd.DataFrame({"_CLASSE_": classes}).assign(_k=1), on="_k")
-        .drop(columns="_k")
-    )
-
-    dados = (
-        grid.merge(dados_raw, on=["MES_NUM", "MÊS", "_CLASSE_"], how="left")
-        .fillna({"QTD": 0})
-    )
-    dados["QTD"] = dados["QTD"].astype(int)
-
-    # =========================
-    # Percentuais (labels nas barras)
-    # =========================
-    total_mes = dados.groupby("MES_NUM")["QTD"].transform("sum")
-    denom = total_mes.replace(0, 1)  # evita divisão por zero em meses zerados
-    dados["PCT"] = ((dados["QTD"] / denom) * 100).round(0).astype(int)
-
-    dados["LABEL"] = ""
-    mask_p = dados["_CLASSE_"] == "PROCEDENTE"
-    mask_i = dados["_CLASSE_"] == "IMPROCEDENTE"
-    dados.loc[mask_p, "LABEL"] = dados.loc[mask_p, "PCT"].astype(str) + "%"
-    dados.loc[mask_i, "LABEL"] = dados.loc[mask_i, "PCT"].astype(str) + "%"
-
-    # =========================
-    # Tabela (valores por mês)
-    # =========================
-    tab = (
-        dados.pivot_table(
-            index=["MES_NUM", "MÊS"],
-            columns="_CLASSE_",
-            values="QTD",
-            aggfunc="sum",
-            fill_value=0
-        )
-        .reset_index()
-        .sort_values("MES_NUM")
-    )
-
-    for c in classes:
-        if c not in tab.columns:
-            tab[c] = 0
-
-    tab["TOTAL"] = tab["PROCEDENTE"] + tab["IMPROCEDENTE"] + tab["OUTROS"]
-    tabela_final = tab[["MÊS", "IMPROCEDENTE", "PROCEDENTE", "TOTAL"]].copy()
-
-    # =========================
-    # Gráfico principal (barras)
-    # =========================
-    fig = px.bar(
-        dados.sort_values("MES_NUM"),
-        x="MÊS",
-        y="QTD",
-        color="_CLASSE_",
-        barmode="stack",
-        text="LABEL",
-        category_orders={
-            "MÊS": MESES_ORDEM,
-            "_CLASSE_": ["PROCEDENTE", "IMPROCEDENTE", "OUTROS"],
-        },
-        color_discrete_map={
-            "PROCEDENTE": COR_PROC,
-            "IMPROCEDENTE": COR_IMP,
-            "OUTROS": COR_OUT,
-        },
-        template="plotly_dark",
-    )
-
-    fig.update_traces(textposition="outside", cliponaxis=False)
-
-    # 🔥 Remove eixo Y (lado esquerdo)
-    fig.update_yaxes(visible=False, showgrid=False, zeroline=False, showticklabels=False, title_text="")
-
-    # =========================
-    # Layout (b grande para caber a “tabelinha”)
-    # =========================
-    fig.update_layout(
-        height=520,
-        showlegend=False,  # vamos usar “boquinhas”
-        margin=dict(l=120, r=170, t=50, b=190),
-        xaxis_title="",
-        yaxis_title="",
-    )
-
-    # =====================================================
-    # CONTROLES (posição da tabelinha e espaçamentos)
-    # =====================================================
-    def _fmt_int(v: int) -> str:
-        return f"{int(v):,}".replace(",", ".")
-
-    # ✅ (AJUSTE AQUI)
-    # - y_base: sobe/desce a tabelinha e as boquinhas
-    # - dy: espaçamento entre as 3 linhas (você pediu 0.055)
-    y_base = -0.23
-    dy = 0.055
-
-    # =====================================================
-    # LINHAS-GUIA (estilo tabela) — 3 linhas horizontais
-    # =====================================================
-    line_style = dict(color="rgba(255,255,255,0.25)", width=1)
-
-    for k in range(3):
-        y_line = y_base - (k * dy)
-        fig.add_shape(
-            type="line", xref="paper", yref="paper",
-            x0=0, x1=1, y0=y_line, y1=y_line,
-            line=line_style
-        )
-
-    # =====================================================
-    # “TABELINHA” abaixo de cada mês (só números, cores)
-    # =====================================================
-    for _, r in tab.iterrows():
-        mes = r["MÊS"]
-        p = _fmt_int(r["PROCEDENTE"])
-        i = _fmt_int(r["IMPROCEDENTE"])
-        t = _fmt_int(r["TOTAL"])
-
-        fig.add_annotation(
-            x=mes, xref="x",
-            yref="paper", y=y_base,
-            text=f"<span style='font-family:monospace;font-size:14px;color:{COR_PROC};'><b>{p}</b></span>",
-            showarrow=False, align="center",
-        )
-        fig.add_annotation(
-            x=mes, xref="x",
-            yref="paper", y=y_base - dy,
-            text=f"<span style='font-family:monospace;font-size:14px;color:{COR_IMP};'><b>{i}</b></span>",
-            showarrow=False, align="center",
-        )
-        fig.add_annotation(
-            x=mes, xref="x",
-            yref="paper", y=y_base - (2 * dy),
-            text=f"<span style='font-family:monospace;font-size:14px;color:{COR_TOT};'><b>{t}</b></span>",
-            showarrow=False, align="center",
-        )
-
-    # =====================================================
-    # LEGENDA “boquinhas” (alinhada com a tabelinha)
-    # =====================================================
-    # ✅ (AJUSTE AQUI)
-    # - x_leg: mais negativo = mais para esquerda
-    # - y_leg: sobe/desce (use junto com y_base para alinhar perfeito)
-    x_leg = -0.08
-    y_leg = y_base  # mesma altura da linha verde
-
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=x_leg, y=y_leg,
-        text=(f"<span style='color:{COR_PROC};font-size:16px'>■</span> "
-              "<span style='color:white;font-size:14px'><b>PROCEDENTE</b></span>"),
-        showarrow=False, align="left",
-    )
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=x_leg, y=y_leg - dy,
-        text=(f"<span style='color:{COR_IMP};font-size:16px'>■</span> "
-              "<span style='color:white;font-size:14px'><b>IMPROCEDENTE</b></span>"),
-        showarrow=False, align="left",
-    )
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=x_leg, y=y_leg - (2 * dy),
-        text=("<span style='color:#fcba03;font-size:16px'>■</span> "
-              "<span style='color:white;font-size:14px'><b>TOTAL</b></span>"),
-        showarrow=False, align="left",
-    )
-
-    # =====================================================
-    # TOTAL GERAL (quadrado à direita) - 3 linhas (TOTAL / PROCEDENTE / IMPROCEDENTE)
-    # =====================================================
-    total_geral = int(tab["TOTAL"].sum())
-    total_proc  = int(tab["PROCEDENTE"].sum())
-    total_imp   = int(tab["IMPROCEDENTE"].sum())
-
-    total_geral_fmt = f"{total_geral:,}".replace(",", ".")
-    total_proc_fmt  = f"{total_proc:,}".replace(",", ".")
-    total_imp_fmt   = f"{total_imp:,}".replace(",", ".")
-
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=1.10, y=0.55,
-        text=(
-            "<span style='font-size:12px;color:#fcba03'><b>TOTAL</b></span><br>"
-            f"<span style='font-size:18px;color:#fcba03'><b>{total_geral_fmt}</b></span><br><br>"
-            f"<span style='font-size:12px;color:{COR_PROC}'><b>PROCEDENTE</b></span><br>"
-            f"<span style='font-size:16px;color:{COR_PROC}'><b>{total_proc_fmt}</b></span><br><br>"
-            f"<span style='font-size:12px;color:{COR_IMP}'><b>IMPROCEDENTE</b></span><br>"
-            f"<span style='font-size:16px;color:{COR_IMP}'><b>{total_imp_fmt}</b></span>"
-        ),
-        showarrow=False,
-        align="left",
-        bgcolor="rgba(0,0,0,0.45)",
-        bordercolor="#fcba03",
-        borderwidth=1,
-        borderpad=10,
-    )
-
-    return fig, tabela_final
-
-# ======================================================
-# HTML (Notas por localidade)
-# ======================================================
-def resumo_por_localidade_html(df_base, col_local, selecionado, top_n=12):
-    if col_local is None or df_base.empty:
-        return ""
-    s = df_base[col_local].dropna().astype(str).str.upper()
-    vc = s.value_counts().reset_index()
-    vc.columns = ["LOCAL", "QTD"]
-    if len(vc) > top_n:
-        outros = int(vc.iloc[top_n:]["QTD"].sum())
-        vc = vc.iloc[:top_n].copy()
-        vc.loc[len(vc)] = ["OUTROS", outros]
-    linhas = []
-    sel = str(selecionado).upper()
-    for _, r in vc.iterrows():
-        loc = r["LOCAL"]
-        qtd = int(r["QTD"])
-        active = (sel != "TOTAL" and loc == sel)
-        cls = "loc-row active" if active else "loc-row"
-        qtd_fmt = f"{qtd:,}".replace(",", ".")
-        linhas.append(f'<div class="{cls}"><span>{loc}</span><span>{qtd_fmt}</span></div>')
-    return "\n".join(linhas)
+# motor das consultas: "pandas" (cubo em memória) ou "sqlite" (banco local)
+MOTOR_BASE = os.environ.get("IW58_MOTOR", "pandas")
+# ⚠️ Use o link do Drive do arquivo XLSX (qualquer pessoa com o link - visualizador)
+URL_BASE = "https://drive.google.com/uc?id=1VadynN01W4mNRLfq8ABZAaQP8Sfim5tb"
+# Base dividida (um arquivo por mês/regional, ou várias abas): liste todas as fontes.
+# Cada item é um link ou {"url": link, "abas": ["2024", "2025"]} — ver base_iw58._normalizar_fontes
+FONTES_BASE = [URL_BASE]
 
 # ======================================================
 # BOTÃO ATUALIZAR BASE
@@ -631,283 +296,339 @@ def resumo_por_localidade_html(df_base, col_local, selecionado, top_n=12):
 colA, colB = st.columns([1, 6])
 with colA:
     if st.button("🔄 Atualizar base"):
-        st.cache_data.clear()
-        st.rerun()
+        # só agenda uma atualização imediata no worker (não limpa cache de ninguém, não
+        # prende a sessão): a nova versão entra num próximo rerun, quando o ciclo terminar
+        atualizador_base(FONTES_BASE).agendar()
+        st.toast("🔄 Atualização agendada — a nova versão aparece ao recarregar a página.")
 with colB:
     st.caption("Use quando atualizar o arquivo no Drive (XLSX).")
 
-# ======================================================
-# CARREGAMENTO (XLSX no Drive)
-# ======================================================
-# ⚠️ Use o link do Drive do arquivo XLSX (qualquer pessoa com o link - visualizador)
-URL_BASE = "https://drive.google.com/uc?id=1VadynN01W4mNRLfq8ABZAaQP8Sfim5tb"
-
-df = carregar_base(URL_BASE)
-validar_estrutura(df)
-
-COL_ESTADO    = achar_coluna(df, ["ESTADO", "LOCALIDADE", "UF"])
-COL_RESULTADO = achar_coluna(df, ["RESULTADO"])
-COL_TIPO      = achar_coluna(df, ["TIPO"])
-COL_MOTIVO    = achar_coluna(df, ["MOTIVO"])
-COL_REGIONAL  = achar_coluna(df, ["REGIONAL"])
-COL_DATA      = achar_coluna(df, ["DATA"])
+try:
+    base = carregar_base(FONTES_BASE)
+except base_iw58.EstruturaIncompativel as e:  # nenhuma versão boa ainda: mostra o que falta
+    validar_estrutura(e.colunas)
+info_carga = base.info
+# todos os cards respondem a partir de fatias do cubo (DIA × UF × AMAS × CLASSE × REGIONAL × MOTIVO),
+# pedidas ao motor (cubo em memória ou SQL)
+consulta = base.consulta
+# mapeamento de colunas resolvido uma vez por versão da base (base_iw58.preparar_base)
+COLUNAS = info_carga["colunas"]
+validar_estrutura(COLUNAS)
+
+STATUS_CARGA = {
+    "304": "inalterada (304)",
+    "inalterado": "inalterada (hash igual)",
+    "alterado": "atualizada",
+    "offline": "sem conexão — usando snapshot local",
+    "banco": "carregada do banco local",
+    "compartilhado": "carregada da memória compartilhada",
+}
+with colB:
+    if atualizador_base(FONTES_BASE).erro is not None:
+        st.warning(f"Última atualização falhou ({atualizador_base(FONTES_BASE).erro}). Exibindo a última versão carregada.")
+    _kb = info_carga["bytes"] / 1024
+    _mem = info_carga.get("memoria") or {}
+    _mem_txt = (
+        f" • base {_mem['depois'] / 2**20:,.1f} MB (sem compactar: {_mem['antes'] / 2**20:,.1f} MB)"
+        if _mem.get("antes") else ""
+    )
+    st.caption(
+        (f"Base {STATUS_CARGA.get(info_carga['status'], info_carga['status'])} às {info_carga['atualizado_em'][-8:]} • "
+         f"{_kb:,.0f} KB baixados • download {info_carga['t_download']:.2f}s • "
+         f"leitura {info_carga['t_parse']:.2f}s • {info_carga['linhas']:,} linhas").replace(",", ".")
+        + _mem_txt.replace(",", "X").replace(".", ",").replace("X", ".")
+    )
+    _datas = info_carga.get("datas") or {}
+    if _datas.get("invalidas"):
+        _ex = ", ".join(f"“{e}”" for e in _datas.get("exemplos", [])[:3])
+        st.caption(
+            f"⚠️ {_datas['invalidas']:,} linhas com DATA ilegível ficam fora dos filtros de período".replace(",", ".")
+            + (f" (ex.: {_ex})" if _ex else "")
+        )
 
-df[COL_DATA] = pd.to_datetime(df[COL_DATA], errors="coerce", dayfirst=True)
-df["_TIPO_"] = df[COL_TIPO].astype(str).str.upper().str.strip()
-df["_RES_"]  = df[COL_RESULTADO].astype(str).str.upper().str.strip()
+# dimensões do cubo (None quando a coluna não existe na base → card "sem dados")
+COL_MOTIVO    = "MOTIVO" if COLUNAS["motivo"] else None
+COL_REGIONAL  = "REGIONAL" if COLUNAS["regional"] else None
 
 # ======================================================
 # SELETORES (Ano • Mensal/Semanal • Calendário • Semana)
 # - Semana: segunda a sexta (ISO week)
+# - Tudo abaixo da carga roda em fragmentos (st.fragment): trocar ano/período/semana
+#   reexecuta só painel_periodo; trocar de UF, só painel_uf (ver PAINEL)
 # ======================================================
-anos_disponiveis = sorted(df[COL_DATA].dropna().dt.year.unique().astype(int).tolist())
-ano_padrao = anos_disponiveis[-1] if anos_disponiveis else None
+def seletores_periodo(consulta):
+    """
+    Seletores de período e fatia do cubo correspondente.
+    - Retorna (ano_sel, ano_txt, data_ini, data_fim, cubo_periodo)
+    """
+    dias_base = consulta.dias()  # dias com nota, ordenados
+    anos_disponiveis = sorted(dias_base.year.unique().astype(int).tolist())
 
-c_sel1, c_sel2, c_sel3, c_sel4 = st.columns([1.0, 1.3, 2.2, 2.0], gap="medium")
+    c_sel1, c_sel2, c_sel3, c_sel4 = st.columns([1.0, 1.3, 2.2, 2.0], gap="medium")
 
-with c_sel1:
-    ano_sel = st.selectbox(
-        "Ano",
-        options=anos_disponiveis if anos_disponiveis else ["—"],
-        index=(len(anos_disponiveis) - 1) if anos_disponiveis else 0,
-        key="ano_sel",
-    )
-    if ano_sel == "—":
-        ano_sel = None
-
-with c_sel2:
-    modo_periodo = st.segmented_control(
-        "Período",
-        options=["Mensal", "Semanal"],
-        default=st.session_state.get("modo_periodo", "Mensal"),
-        key="modo_periodo",
-    )
+    with c_sel1:
+        ano_sel = st.selectbox(
+            "Ano",
+            options=anos_disponiveis if anos_disponiveis else ["—"],
+            index=(len(anos_disponiveis) - 1) if anos_disponiveis else 0,
+            key="ano_sel",
+        )
+        if ano_sel == "—":
+            ano_sel = None
+
+    with c_sel2:
+        modo_periodo = st.segmented_control(
+            "Período",
+            options=["Mensal", "Semanal"],
+            default=st.session_state.get("modo_periodo", "Mensal"),
+            key="modo_periodo",
+        )
 
-df_ano = df if ano_sel is None else df[df[COL_DATA].dt.year == int(ano_sel)].copy()
-ano_txt = str(ano_sel) if ano_sel else "—"
-
-if not df_ano.empty and df_ano[COL_DATA].notna().any():
-    _min_d = df_ano[COL_DATA].min().date()
-    _max_d = df_ano[COL_DATA].max().date()
-else:
-    _min_d = date.today()
-    _max_d = date.today()
-
-with c_sel3:
-    data_ini, data_fim = st.date_input(
-        "Filtro por calendário (início/fim)",
-        value=(st.session_state.get("data_ini", _min_d), st.session_state.get("data_fim", _max_d)),
-        min_value=_min_d,
-        max_value=_max_d,
-        key="range_calendario",
-    )
+    # dias ordenados: limites do ano por busca binária
+    if ano_sel is not None:
+        ano_ini, ano_fim = periodo_iw58.limites_ano(int(ano_sel))
+        dias_ano = dias_base[
+            dias_base.searchsorted(pd.Timestamp(ano_ini)):dias_base.searchsorted(pd.Timestamp(ano_fim), side="right")
+        ]
+    else:
+        dias_ano = dias_base
+    ano_txt = str(ano_sel) if ano_sel else "—"
 
-with c_sel4:
-    semana_sel = None
-    if modo_periodo == "Semanal" and not df_ano.empty:
-        semanas_disp = sorted(df_ano[COL_DATA].dropna().dt.isocalendar().week.unique().astype(int).tolist())
-        opcoes_sem = ["Todas"] + [f"S{w:02d}" for w in semanas_disp]
-        semana_sel = st.selectbox("Semana (S01..S53)", opcoes_sem, index=0, key="semana_sel")
+    if ano_sel is not None and len(dias_ano):
+        _min_d = dias_ano[0].date()
+        _max_d = dias_ano[-1].date()
+    else:
+        _min_d = date.today()
+        _max_d = date.today()
+
+    with c_sel3:
+        data_ini, data_fim = st.date_input(
+            "Filtro por calendário (início/fim)",
+            value=(st.session_state.get("data_ini", _min_d), st.session_state.get("data_fim", _max_d)),
+            min_value=_min_d,
+            max_value=_max_d,
+            key="range_calendario",
+        )
 
-# aplica filtro semanal (ISO seg(1) a sex(5))
-if modo_periodo == "Semanal" and semana_sel and semana_sel != "Todas" and ano_sel is not None:
-    w = int(str(semana_sel).replace("S", ""))
-    try:
-        data_ini = date.fromisocalendar(int(ano_sel), w, 1)  # segunda
-        data_fim = date.fromisocalendar(int(ano_sel), w, 5)  # sexta
-        st.caption(f"Semana {semana_sel}: {data_ini.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')} (seg–sex)")
-    except ValueError:
-        st.warning("Semana inválida para este ano (ISO). Usando o filtro por calendário.")
+    with c_sel4:
+        semana_sel = None
+        if modo_periodo == "Semanal" and len(dias_ano):
+            opcoes_sem = ["Todas"] + periodo_iw58.semanas_do_ano(dias_ano, int(ano_sel))
+            semana_sel = st.selectbox("Semana (S01..S53)", opcoes_sem, index=0, key="semana_sel")
 
-# aplica filtro por calendário (inclusive)
-df_periodo = df_ano.copy()
-if not df_periodo.empty and df_periodo[COL_DATA].notna().any():
-    _dini = pd.to_datetime(data_ini)
-    _dfim = pd.to_datetime(data_fim) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
-    df_periodo = df_periodo[(df_periodo[COL_DATA] >= _dini) & (df_periodo[COL_DATA] <= _dfim)].copy()
+    # aplica filtro semanal (semana ISO inteira, seg(1) a sex(5) — mesma regra do lote)
+    semana_inteira = False
+    if modo_periodo == "Semanal" and semana_sel and semana_sel != "Todas" and ano_sel is not None:
+        try:
+            per = periodo_iw58.periodo_semana(int(ano_sel), semana_sel)
+            data_ini, data_fim, semana_inteira = per["ini"], per["fim"], True
+            st.caption(f"Semana {semana_sel}: {data_ini.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')} (seg–sex)")
+        except ValueError:
+            st.warning("Semana inválida para este ano (ISO). Usando o filtro por calendário.")
+
+    # aplica filtro por calendário (inclusive, dentro do ano) — DIA do cubo já é a data sem hora
+    with etapa("filtro_periodo") as _m:
+        if ano_sel is None:
+            cubo_periodo = consulta.fatia()
+        elif semana_inteira:
+            cubo_periodo = consulta.fatia(data_ini, data_fim)
+        else:
+            cubo_periodo = consulta.fatia(*periodo_iw58.recortar_ano(data_ini, data_fim, int(ano_sel)))
+        _m["linhas"] = len(cubo_periodo)
+    return ano_sel, ano_txt, data_ini, data_fim, cubo_periodo
 
 # ======================================================
 # "ABAS" UF
 # ======================================================
-ufs = sorted(df[COL_ESTADO].dropna().astype(str).str.upper().unique().tolist())
-ufs = ["TOTAL"] + ufs
-if "uf_sel" not in st.session_state:
-    st.session_state.uf_sel = "TOTAL"
-uf_sel = st.segmented_control(label="", options=ufs, default=st.session_state.uf_sel)
-st.session_state.uf_sel = uf_sel
-
-df_filtro = df_periodo if uf_sel == "TOTAL" else df_periodo[df_periodo[COL_ESTADO].astype(str).str.upper() == uf_sel]
-df_am = df_filtro[df_filtro["_TIPO_"].str.contains("AM", na=False)]
-df_as = df_filtro[df_filtro["_TIPO_"].str.contains("AS", na=False)]
+def abas_uf(consulta):
+    """Abas de UF (TOTAL + UFs da versão); retorna a UF selecionada."""
+    # UFs da versão (calculadas uma vez pelo motor; cubo: códigos do categórico UF)
+    ufs = ["TOTAL"] + consulta.ufs()
+    if "uf_sel" not in st.session_state:
+        st.session_state.uf_sel = "TOTAL"
+    uf_sel = st.segmented_control(label="", options=ufs, default=st.session_state.uf_sel)
+    st.session_state.uf_sel = uf_sel
+    return uf_sel
 
 # ======================================================
 # 6 BLOCOS (CARDS)
 # ======================================================
-row1 = st.columns([1.09, 1.15, 1.15], gap="large")
-
-with row1[0]:
-    total = len(df_filtro); am = len(df_am); az = len(df_as)
-    total_fmt = f"{total:,}".replace(",", ".")
-    am_fmt    = f"{am:,}".replace(",", ".")
-    as_fmt    = f"{az:,}".replace(",", ".")
-    st.markdown(
-        f"""
-        <div class="card">
-          <div class="card-title">ACUMULADO DE NOTAS AM / AS • {ano_txt}</div>
-          <div class="kpi-row">
-            <div class="kpi-big">{total_fmt}</div>
-            <div class="kpi-mini">
-              <div class="lbl">AM</div>
-              <div class="val">{am_fmt}</div>
+def blocos_cards(cards, ano_txt):
+    """Os 6 blocos do topo; cada um espera só o próprio card (pedir_cards) antes de desenhar."""
+    row1 = st.columns([1.09, 1.15, 1.15], gap="large")
+
+    with row1[0]:
+        total = cards["total"].result(); am = cards["am"].result(); az = cards["as"].result()
+        localidade_html = cards["localidade_html"].result()
+        total_fmt = f"{total:,}".replace(",", ".")
+        am_fmt    = f"{am:,}".replace(",", ".")
+        as_fmt    = f"{az:,}".replace(",", ".")
+        st.markdown(
+            f"""
+            <div class="card">
+              <div class="card-title">ACUMULADO DE NOTAS AM / AS • {ano_txt}</div>
+              <div class="kpi-row">
+                <div class="kpi-big">{total_fmt}</div>
+                <div class="kpi-mini">
+                  <div class="lbl">AM</div>
+                  <div class="val">{am_fmt}</div>
+                </div>
+                <div class="kpi-mini">
+                  <div class="lbl">AS</div>
+                  <div class="val">{as_fmt}</div>
+                </div>
+              </div>
+              <div style="margin-top:14px; text-align:left;">
+                <div style="font-weight:950;color:#0b2b45;margin-bottom:8px;text-transform:uppercase;">
+                  Notas por localidade
+                </div>
+                {localidade_html}
+              </div>
             </div>
-            <div class="kpi-mini">
-              <div class="lbl">AS</div>
-              <div class="val">{as_fmt}</div>
-            </div>
-          </div>
-          <div style="margin-top:14px; text-align:left;">
-            <div style="font-weight:950;color:#0b2b45;margin-bottom:8px;text-transform:uppercase;">
-              Notas por localidade
-            </div>
-            {resumo_por_localidade_html(df_periodo, COL_ESTADO, uf_sel, top_n=12)}
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+            """,
+            unsafe_allow_html=True
+        )
 
-with row1[1]:
-    st.markdown('<div class="card"><div class="card-title">ACUMULADO ANUAL – AM</div>', unsafe_allow_html=True)
-    if df_am.empty:
-        st.info("Sem dados AM.")
-    else:
-        fig = donut_resultado(df_am)
-        fig = _titulo_plotly(fig, "ACUMULADO ANUAL – AM", uf_sel)
-        st.plotly_chart(fig, use_container_width=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+    with row1[1]:
+        st.markdown('<div class="card"><div class="card-title">ACUMULADO ANUAL – AM</div>', unsafe_allow_html=True)
+        fig = cards["fig_am"].result()
+        if fig is None:
+            st.info("Sem dados AM.")
+        else:
+            mostrar_grafico("fig_am", fig)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with row1[2]:
+        st.markdown('<div class="card"><div class="card-title">ACUMULADO ANUAL – AS</div>', unsafe_allow_html=True)
+        fig = cards["fig_as"].result()
+        if fig is None:
+            st.info("Sem dados AS.")
+        else:
+            mostrar_grafico("fig_as", fig)
+        st.markdown("</div>", unsafe_allow_html=True)
 
-with row1[2]:
-    st.markdown('<div class="card"><div class="card-title">ACUMULADO ANUAL – AS</div>', unsafe_allow_html=True)
-    if df_as.empty:
-        st.info("Sem dados AS.")
-    else:
-        fig = donut_resultado(df_as)
-        fig = _titulo_plotly(fig, "ACUMULADO ANUAL – AS", uf_sel)
-        st.plotly_chart(fig, use_container_width=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+    row2 = st.columns([1, 1.3, 1.3], gap="large")
 
-row2 = st.columns([1, 1.3, 1.3], gap="large")
+    with row2[0]:
+        st.markdown('<div class="card"><div class="card-title">IMPROCEDÊNCIAS POR REGIONAL – NOTA AM</div>', unsafe_allow_html=True)
+        fig = cards["fig_regional_am"].result()
+        if fig is not None:
+            mostrar_grafico("fig_regional_am", fig)
+        else:
+            st.info("Sem improcedências (AM) por regional.")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with row2[1]:
+        st.markdown('<div class="card"><div class="card-title">MOTIVOS DE IMPROCEDÊNCIAS – NOTA AM</div>', unsafe_allow_html=True)
+        fig = cards["fig_motivo_am"].result()
+        if fig is not None:
+            mostrar_grafico("fig_motivo_am", fig)
+        else:
+            st.info("Sem motivos (AM).")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with row2[2]:
+        st.markdown('<div class="card"><div class="card-title">MOTIVOS DE IMPROCEDÊNCIAS – NOTA AS</div>', unsafe_allow_html=True)
+        fig = cards["fig_motivo_as"].result()
+        if fig is not None:
+            mostrar_grafico("fig_motivo_as", fig)
+        else:
+            st.info("Sem motivos (AS).")
+        st.markdown("</div>", unsafe_allow_html=True)
 
-with row2[0]:
-    st.markdown('<div class="card"><div class="card-title">IMPROCEDÊNCIAS POR REGIONAL – NOTA AM</div>', unsafe_allow_html=True)
-    base_imp_am = df_am[df_am["_RES_"].str.contains("IMPROCED", na=False)]
-    fig = barh_contagem(base_imp_am, COL_REGIONAL, "IMPROCEDÊNCIAS POR REGIONAL – NOTA AM", uf_sel)
-    if fig is not None:
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("Sem improcedências (AM) por regional.")
-    st.markdown("</div>", unsafe_allow_html=True)
+# ======================================================
+# ACUMULADO MENSAL
+# ======================================================
+def bloco_mensal(cards):
+    """Gráfico e tabela mensais (abaixo da dobra: últimos a serem esperados)."""
+    st.markdown('<div class="card"><div class="card-title">ACUMULADO MENSAL DE NOTAS AM – AS</div>', unsafe_allow_html=True)
 
-with row2[1]:
-    st.markdown('<div class="card"><div class="card-title">MOTIVOS DE IMPROCEDÊNCIAS – NOTA AM</div>', unsafe_allow_html=True)
-    base_imp_am = df_am[df_am["_RES_"].str.contains("IMPROCED", na=False)]
-    fig = barh_contagem(base_imp_am, COL_MOTIVO, "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AM", uf_sel)
-    if fig is not None:
-        st.plotly_chart(fig, use_container_width=True)
+    fig_mensal, tabela_mensal = cards["mensal"].result()
+
+    if fig_mensal is not None:
+        mostrar_grafico("fig_mensal", fig_mensal)
     else:
-        st.info("Sem motivos (AM).")
+        st.info("Sem dados mensais (DATA vazia/ inválida).")
+
     st.markdown("</div>", unsafe_allow_html=True)
 
-with row2[2]:
-    st.markdown('<div class="card"><div class="card-title">MOTIVOS DE IMPROCEDÊNCIAS – NOTA AS</div>', unsafe_allow_html=True)
-    base_imp_as = df_as[df_as["_RES_"].str.contains("IMPROCED", na=False)]
-    fig = barh_contagem(base_imp_as, COL_MOTIVO, "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AS", uf_sel)
-    if fig is not None:
-        st.plotly_chart(fig, use_container_width=True)
+    # tabela no final (valores mensais)
+    st.markdown('<div class="card"><div class="card-title">TABELA — VALORES MENSAIS</div>', unsafe_allow_html=True)
+    if tabela_mensal is not None:
+        st.dataframe(tabela_mensal, use_container_width=True, hide_index=True)
     else:
-        st.info("Sem motivos (AS).")
+        st.info("Sem tabela mensal para exibir.")
     st.markdown("</div>", unsafe_allow_html=True)
 
 # ======================================================
-# ACUMULADO MENSAL
-# ======================================================
-st.markdown('<div class="card"><div class="card-title">ACUMULADO MENSAL DE NOTAS AM – AS</div>', unsafe_allow_html=True)
-
-fig_mensal, tabela_mensal = acumulado_mensal_fig_e_tabela(df_filtro, COL_DATA)
-
-if fig_mensal is not None:
-    fig_mensal = _titulo_plotly(fig_mensal, "ACUMULADO MENSAL DE NOTAS AM – AS", uf_sel)
-    st.plotly_chart(fig_mensal, use_container_width=True)
-else:
-    st.info("Sem dados mensais (DATA vazia/ inválida).")
-
-st.markdown("</div>", unsafe_allow_html=True)
-
-# ======================================================
-# TABELA NO FINAL
-# ======================================================
-st.markdown('<div class="card"><div class="card-title">TABELA — VALORES MENSAIS</div>', unsafe_allow_html=True)
-if tabela_mensal is not None:
-    st.dataframe(tabela_mensal, use_container_width=True, hide_index=True)
-else:
-    st.info("Sem tabela mensal para exibir.")
-st.markdown("</div>", unsafe_allow_html=True)
-
-# ======================================================
-# PDF (relatório)
-# ======================================================
-def gerar_pdf(df_tabela, ano_ref, uf_sel, df_filtro_ref, df_am_ref, df_as_ref):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
-    styles = getSampleStyleSheet()
-    elementos = []
-    elementos.append(Paragraph(f"<b>DASHBOARD NOTAS AM x AS – {ano_ref}</b>", styles["Title"]))
-    elementos.append(Spacer(1, 12))
-    elementos.append(Paragraph(f"<b>UF selecionada:</b> {uf_sel}", styles["Normal"]))
-    elementos.append(Spacer(1, 12))
-
-    total = len(df_filtro_ref); am = len(df_am_ref); az = len(df_as_ref)
-    elementos.append(Paragraph(
-        f"<b>Total de Notas:</b> {total}<br/>"
-        f"<b>AM:</b> {am} &nbsp;&nbsp; <b>AS:</b> {az}",
-        styles["Normal"]
-    ))
-    elementos.append(Spacer(1, 14))
-
-    if df_tabela is not None and not df_tabela.empty:
-        data = [df_tabela.columns.tolist()] + df_tabela.values.tolist()
-        tabela = Table(data, repeatRows=1)
-        tabela.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
-            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
-            ("ALIGN", (1,1), (-1,-1), "CENTER"),
-            ("FONT", (0,0), (-1,0), "Helvetica-Bold"),
-            ("BOTTOMPADDING", (0,0), (-1,0), 8),
-            ("TOPPADDING", (0,0), (-1,0), 8),
-        ]))
-        elementos.append(Paragraph("<b>Resumo Mensal</b>", styles["Heading2"]))
-        elementos.append(Spacer(1, 8))
-        elementos.append(tabela)
-
-    doc.build(elementos)
-    buffer.seek(0)
-    return buffer
-
-pdf_buffer = gerar_pdf(
-    df_tabela=tabela_mensal,
-    ano_ref=ano_txt,
-    uf_sel=uf_sel,
-    df_filtro_ref=df_filtro,
-    df_am_ref=df_am,
-    df_as_ref=df_as,
-)
+# EXPORTAR PDF (sob demanda, gerado em segundo plano)
+# - Nada de ReportLab no rerun: o PDF só é montado no clique, na FilaRelatorios,
+#   e fica em cache por versão da base + filtro (mesmo filtro = download imediato)
+# - Os 6 gráficos entram como imagem (kaleido, renderizados no servidor)
+# ======================================================
+def exportar_pdf(cards, chave_periodo, uf_sel, ano_txt):
+    """Botão "Gerar PDF" + download; só resolve todos os cards no clique."""
+    chave_pdf = ("pdf",) + chave_periodo + (uf_sel,)
+    tarefa_pdf = fila_relatorios().tarefa(chave_pdf)
+    if tarefa_pdf is None and st.button("📄 Gerar PDF"):
+        cards = resolver_cards(cards)
+        tarefa_pdf = fila_relatorios().pedir(
+            chave_pdf, gerar_pdf,
+            df_tabela=cards["tabela_mensal"],
+            ano_ref=ano_txt,
+            uf_sel=uf_sel,
+            total=cards["total"],
+            am=cards["am"],
+            az=cards["as"],
+            figuras=figuras_dos_cards(cards),
+            chave_figuras=chave_pdf,
+        )
 
-st.download_button(
-    label="📄 Exportar PDF",
-    data=pdf_buffer,
-    file_name=f"IW58_Dashboard_{ano_txt}_{uf_sel}.pdf",
-    mime="application/pdf"
-)
+    if tarefa_pdf is not None:
+        if not tarefa_pdf.done():
+            with st.spinner("📄 Gerando PDF..."):
+                wait([tarefa_pdf], timeout=ESPERA_PDF)
+        if not tarefa_pdf.done():
+            st.info("📄 PDF em geração — o botão de download aparece na próxima atualização da tela.")
+        elif tarefa_pdf.exception() is not None:
+            st.error(f"Falha ao gerar o PDF: {tarefa_pdf.exception()}")
+        else:
+            if isinstance(tarefa_pdf.result(), PdfParcial):
+                st.warning(f"📄 PDF sem os gráficos ({tarefa_pdf.result().motivo[:200]}) — gere de novo para tentar incluí-los.")
+            st.download_button(
+                label="📄 Exportar PDF",
+                data=tarefa_pdf.result(),
+                file_name=f"IW58_Dashboard_{ano_txt}_{uf_sel}.pdf",
+                mime="application/pdf"
+            )
+
+# ======================================================
+# PAINEL (fragmentos com dependências explícitas)
+# - base (script inteiro) → painel_periodo (ano/período/semana) → painel_uf (UF)
+# - Cada fragmento recebe só o que depende de cima; um widget reexecuta apenas o
+#   próprio fragmento (e os de dentro), não a carga, o topo nem o print
+# - Cards: pedidos ao pool de uma vez e desenhados na ordem da tela, cada um assim
+#   que fica pronto — o topo aparece sem esperar o mensal/tabela
+# ======================================================
+@st.fragment
+def painel_uf(consulta, cubo_periodo, chave_periodo, ano_txt):
+    """UF + cards + mensal + PDF de um período; a troca de UF só reexecuta este fragmento."""
+    with etapa("fragmento_uf", linhas=len(cubo_periodo)):
+        uf_sel = abas_uf(consulta)
+        # chave = versão da base + filtro efetivo (modo/semana já resolvidos em data_ini/data_fim)
+        cards = memo_sessao(chave_periodo + (uf_sel,), lambda: calcular_cards(cubo_periodo, uf_sel, chave_periodo))
+        blocos_cards(cards, ano_txt)
+        bloco_mensal(cards)
+        exportar_pdf(cards, chave_periodo, uf_sel, ano_txt)
+
+@st.fragment
+def painel_periodo(consulta, versao):
+    """Seletores de período + painel_uf; trocar o período só reexecuta este fragmento."""
+    with etapa("fragmento_periodo"):
+        ano_sel, ano_txt, data_ini, data_fim, cubo_periodo = seletores_periodo(consulta)
+        painel_uf(consulta, cubo_periodo, (versao, ano_sel, data_ini, data_fim), ano_txt)
+
+painel_periodo(consulta, info_carga["versao"])
 
 # ======================================================
 # EXPORTAR DASHBOARD (PRINT PARA PDF) - OPÇÃO A
@@ -942,3 +663,78 @@ components.html(
     """,
     height=0
 )
+
+# ======================================================
+# DESEMPENHO (painel admin + /metrics)
+# - IW58_PAINEL_ADMIN=1: expander com tempos/linhas/memória por etapa (metricas_iw58)
+# - IW58_METRICAS_PORTA=9108: GET /metrics no formato do Prometheus (um por processo)
+# ======================================================
+PAINEL_ADMIN = os.environ.get("IW58_PAINEL_ADMIN") == "1"
+PORTA_METRICAS = os.environ.get("IW58_METRICAS_PORTA")
+
+def gauges_base(atualizador):
+    """Gauges avulsos da última versão boa (linhas, bytes, memória) para o /metrics."""
+    try:
+        info = atualizador.obter(timeout=0).info
+    except Exception:
+        return {}
+    memoria = info.get("memoria") or {}
+    return {
+        "iw58_base_linhas": info.get("linhas"),
+        "iw58_base_bytes_download": info.get("bytes"),
+        "iw58_base_memoria_bytes": memoria.get("depois"),
+        "iw58_base_atualizacao_falhou": int(atualizador.erro is not None),
+    }
+
+@st.cache_resource(show_spinner=False)
+def servidor_metricas(porta, _atualizador):
+    """Servidor /metrics único por processo; None se a porta já estiver em uso."""
+    host = os.environ.get("IW58_METRICAS_HOST", "127.0.0.1")
+    try:
+        return metricas_iw58.servir_prometheus(int(porta), host, extras=lambda: gauges_base(_atualizador))
+    except OSError:
+        return None
+
+if PORTA_METRICAS:
+    servidor_metricas(PORTA_METRICAS, atualizador_base(FONTES_BASE))
+
+if PAINEL_ADMIN:
+    with st.expander("⚙️ Desempenho"):
+        resumo = METRICAS.resumo()
+        if not resumo:
+            st.info("Nenhuma etapa medida ainda.")
+        else:
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "ETAPA": nome,
+                        "EXECUÇÕES": e["execucoes"],
+                        "MÉDIA (ms)": round(1000 * e["segundos"] / e["execucoes"], 1),
+                        "MÁX (ms)": round(1000 * e["maximo"], 1),
+                        "ÚLTIMO (ms)": round(1000 * e["ultimo"], 1),
+                        "LINHAS": e["linhas"],
+                        "MEMÓRIA (MB)": None if e["memoria"] is None else round(e["memoria"] / 2**20, 1),
+                        "ERROS": e["erros"],
+                    }
+                    for nome, e in sorted(resumo.items())
+                ]),
+                use_container_width=True, hide_index=True,
+            )
+            st.caption("Últimos eventos")
+            eventos = pd.DataFrame(METRICAS.eventos()[:50])
+            eventos["em"] = pd.to_datetime(eventos["em"], unit="s").dt.strftime("%H:%M:%S")
+            st.dataframe(eventos, use_container_width=True, hide_index=True)
+        colM1, colM2 = st.columns([1, 1])
+        with colM1:
+            st.download_button(
+                label="📈 Métricas (Prometheus)",
+                data=metricas_iw58.texto_prometheus(extras=gauges_base(atualizador_base(FONTES_BASE))),
+                file_name="iw58_metricas.txt",
+                mime="text/plain",
+            )
+        with colM2:
+            if st.button("🧹 Zerar métricas"):
+                METRICAS.limpar()
+                st.rerun()
+
+METRICAS.registrar("rerun", time.perf_counter() - T0_RERUN)
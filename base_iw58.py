@@ -0,0 +1,1110 @@
+"""
+Carregamento da base IW58 (Google Drive → DataFrame) com snapshot local.
+
+- Base em uma ou várias fontes (arquivos e/ou abas), baixadas em paralelo;
+  cada fonte tem seu snapshot e só a que mudou é reprocessada
+- Baixa o arquivo do Drive (XLSX preferencialmente, CSV como fallback) em streaming
+  para um arquivo temporário; só são lidas as colunas que o dashboard usa
+- CSV: encoding e separador detectados uma vez por amostra, parse único no engine C
+- O primeiro parse grava um snapshot colunar tipado (Arrow/Feather) em disco
+- Nas cargas seguintes o download é condicional (ETag/Last-Modified); se o
+  servidor não respeitar, compara o hash do conteúdo. Sem mudança, lê o snapshot
+  via memory-map em vez de reprocessar o XLSX com openpyxl
+- Base já preparada no snapshot: mapeamento de colunas, DATA em datetime e
+  _TIPO_ / _RES_ / _UF_ normalizados como categóricos
+- DATA: formato dominante inferido por amostra (texto ou serial do Excel) e lido de uma
+  vez; só o que foge dele cai no parser genérico. Datas ilegíveis são contadas
+  (_DATA_INVALIDA_, info["datas"]) e o formato fica no meta da fonte para a próxima carga
+- Base compactada (compactar_base): só as colunas que o dashboard lê, texto repetido
+  como categórico e números no menor tipo; memória antes/depois em info["memoria"]
+- Classificação pronta: _AMAS_ (AM/AS/OUTRO) e _CLASSE_ (PROCEDENTE/IMPROCEDENTE/OUTROS)
+- Base ordenada por DATA (NaT no fim): filtros de período viram busca binária (fatiar_por_data)
+- AtualizadorBase: thread em segundo plano que mantém a última versão boa em memória
+  (base + consultas de um motor plugável: cubo_iw58 em pandas ou sql_iw58 em SQLite)
+- Extração que só cresce: só as notas novas/alteradas são preparadas (chave da nota
+  ou hash da linha) e o cubo é atualizado pelo delta
+- O snapshot sobrevive a restart do servidor (cold start também usa o snapshot)
+- Etapas da carga (download, parse, datas, preparação, snapshot, motor) medidas em
+  metricas_iw58
+"""
+import codecs
+import csv
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import threading
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import requests
+from pandas.api.types import union_categoricals
+
+import metricas_iw58
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # sem pyarrow: snapshot em pickle (mais lento, mas funciona)
+    feather = None
+
+# engine="calamine" do pandas (leitor XLSX em Rust), se instalado
+TEM_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+
+# ======================================================
+# CONFIG
+# ======================================================
+# ⚠️ Pasta do snapshot: fora do repositório em produção (ex.: IW58_CACHE_DIR=/var/cache/iw58)
+DIR_SNAPSHOT = os.environ.get(
+    "IW58_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_iw58"),
+)
+# ⚠️ Suba este número sempre que mudar o que vai dentro do snapshot (força reprocessar)
+VERSAO_SNAPSHOT = 11
+TAM_BLOCO_DOWNLOAD = 1 << 20
+# download fica em memória até este tamanho; acima disso vai para arquivo temporário
+LIMITE_DOWNLOAD_MEMORIA = 32 << 20
+TAM_BLOCO_LINHAS = 50_000  # leitura XLSX em streaming
+TAM_AMOSTRA_CSV = 64 << 10  # amostra para detectar o separador do CSV
+SEPARADORES_CSV = ";,\t|"
+MAX_FONTES_PARALELAS = 4  # downloads/parses simultâneos quando a base tem várias fontes
+# status da carga combinada: o mais "forte" entre as fontes
+PRIORIDADE_STATUS = ["alterado", "offline", "inalterado", "304"]
+# ciclo do AtualizadorBase que falhou: nova tentativa em 5 s, 10 s, 20 s... até 2 min
+# (o intervalo normal só volta depois de um ciclo bem-sucedido)
+RETENTATIVA_INICIAL = 5
+RETENTATIVA_MAXIMA = 120
+
+# ======================================================
+# HELPERS (colunas / Drive / bytes)
+# ======================================================
+def achar_coluna(df, palavras):
+    for col in df.columns:
+        for p in palavras:
+            if p in col:
+                return col
+    return None
+
+def _extrair_drive_id(url: str):
+    # formatos comuns de links do Drive:
+    # https://drive.google.com/uc?id=FILEID
+    # https://drive.google.com/file/d/FILEID/view?usp=sharing
+    m = re.search(r"[?&]id=([a-zA-Z0-9-_]+)", url)
+    if m:
+        return m.group(1)
+    m = re.search(r"/file/d/([a-zA-Z0-9-_]+)", url)
+    if m:
+        return m.group(1)
+    return None
+
+def _drive_direct_download(url: str) -> str:
+    """
+    Converte link do Google Drive para link de download direto.
+    - Se já for uc?id=... mantém.
+    - Se for /file/d/... converte para uc?id=...
+    """
+    did = _extrair_drive_id(url)
+    if did:
+        return f"https://drive.google.com/uc?id={did}"
+    return url
+
+def _bytes_is_html(raw: bytes) -> bool:
+    head = raw[:800].lstrip().lower()
+    return head.startswith(b"<!doctype html") or b"<html" in head
+
+def _bytes_is_xlsx(raw: bytes) -> bool:
+    # XLSX é um ZIP: começa com "PK"
+    return raw[:2] == b"PK"
+
+def _cabeca(arquivo, n: int = 800) -> bytes:
+    """Primeiros bytes do arquivo (para detectar XLSX/HTML) sem perder a posição."""
+    arquivo.seek(0)
+    head = arquivo.read(n)
+    arquivo.seek(0)
+    return head
+
+# ======================================================
+# PARSE (XLSX / CSV)
+# ======================================================
+def _normalizar_nomes(nomes) -> list:
+    """
+    Nomes de coluna em maiúsculas/sem espaços, como o pandas entregaria
+    (vazio → "UNNAMED: i"; repetidos → "X", "X.1", ...).
+    """
+    vistos = {}
+    saida = []
+    for i, nome in enumerate(nomes):
+        nome = f"Unnamed: {i}" if nome is None else str(nome)
+        nome = nome.upper().strip()
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        saida.append(nome)
+    return saida
+
+def _coluna_util(nome: str) -> bool:
+    """Projeção: só colunas que achar_coluna pode resolver (COLUNAS_BASE) + a chave da nota."""
+    return nome in COLUNAS_CHAVE or any(p in nome for palavras in COLUNAS_BASE.values() for p in palavras)
+
+def _ler_xlsx_calamine(arquivo, aba=0) -> pd.DataFrame:
+    # calamine (Rust) lê muito mais rápido que openpyxl; projeção via usecols
+    df = pd.read_excel(
+        arquivo, sheet_name=aba, engine="calamine",
+        usecols=lambda c: _coluna_util(str(c).upper().strip()),
+    )
+    df.columns = _normalizar_nomes(df.columns)
+    return df
+
+def _ler_xlsx_streaming(arquivo, aba=0, datas: dict = None) -> pd.DataFrame:
+    """
+    Lê a aba (nome ou índice) linha a linha (openpyxl read-only), guardando só as colunas úteis.
+    - Monta blocos de TAM_BLOCO_LINHAS linhas; a DATA já vira datetime64 em cada bloco
+      (_DATA_INVALIDA_ marca as ilegíveis; `datas`: relatório da fonte, ver _converter_datas)
+    - Linhas totalmente vazias no fim da aba são descartadas (igual ao pd.read_excel)
+    """
+    wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        planilha = wb[aba] if isinstance(aba, str) else wb.worksheets[aba]
+        linhas = planilha.iter_rows(values_only=True)
+        nomes = _normalizar_nomes(next(linhas, None) or ())
+        idx = [i for i, nome in enumerate(nomes) if _coluna_util(nome)]
+        nomes = [nomes[i] for i in idx]
+        col_data = achar_coluna(pd.DataFrame(columns=nomes), COLUNAS_BASE["data"])
+
+        def _bloco(valores):
+            parte = pd.DataFrame(dict(zip(nomes, valores)), columns=nomes)
+            if col_data is not None:
+                parte[col_data], parte["_DATA_INVALIDA_"] = _converter_datas(parte[col_data], datas)
+            return parte
+
+        partes = []
+        valores = [[] for _ in idx]
+        n_lidas = ultima_nao_vazia = 0
+        for linha in linhas:
+            n_lidas += 1
+            if any(v is not None for v in linha):
+                ultima_nao_vazia = n_lidas
+            for col, i in zip(valores, idx):
+                col.append(linha[i] if i < len(linha) else None)
+            if len(valores[0] if valores else ()) >= TAM_BLOCO_LINHAS:
+                partes.append(_bloco(valores))
+                valores = [[] for _ in idx]
+        if not partes or (valores and valores[0]):
+            partes.append(_bloco(valores))
+    finally:
+        wb.close()
+
+    df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+    return df.iloc[:ultima_nao_vazia].reset_index(drop=True)
+
+def _detectar_encoding(arquivo) -> str:
+    """
+    Encoding do CSV numa única passada pelos bytes (sem re-parse por tentativa).
+    - BOM → utf-8-sig; UTF-8 válido do início ao fim → utf-8
+    - senão cp1252 (export do Excel/SAP); bytes indefinidos no cp1252 → latin1
+    """
+    arquivo.seek(0)
+    if arquivo.read(3) == codecs.BOM_UTF8:
+        return "utf-8-sig"
+    arquivo.seek(0)
+    dec = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while bloco := arquivo.read(TAM_BLOCO_DOWNLOAD):
+            dec.decode(bloco)
+        dec.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    arquivo.seek(0)
+    dec = codecs.getincrementaldecoder("cp1252")()
+    try:
+        while bloco := arquivo.read(TAM_BLOCO_DOWNLOAD):
+            dec.decode(bloco)
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin1"
+
+def _sniff_csv(arquivo):
+    """
+    Detecta (encoding, separador, nomes das colunas) a partir de uma amostra.
+    Retorna nomes já normalizados (_normalizar_nomes).
+    """
+    enc = _detectar_encoding(arquivo)
+    arquivo.seek(0)
+    amostra = arquivo.read(TAM_AMOSTRA_CSV).decode(enc, errors="ignore")
+    arquivo.seek(0)
+    linhas = amostra.splitlines()
+    if len(amostra) >= TAM_AMOSTRA_CSV and len(linhas) > 1:
+        linhas = linhas[:-1]  # última linha da amostra pode estar cortada
+    amostra = "\n".join(linhas)
+    try:
+        sep = csv.Sniffer().sniff(amostra, delimiters=SEPARADORES_CSV).delimiter
+    except csv.Error:
+        # sniff falha em arquivos muito simples: usa o separador mais frequente no cabeçalho
+        cab = linhas[0] if linhas else ""
+        sep = max(SEPARADORES_CSV, key=cab.count)
+    cabecalho = next(csv.reader(linhas[:1], delimiter=sep), [])
+    return enc, sep, _normalizar_nomes(cabecalho)
+
+def _ler_csv(arquivo) -> pd.DataFrame:
+    """
+    CSV com encoding/separador já conhecidos: um único parse no engine C,
+    só com as colunas úteis e todas como texto.
+    """
+    enc, sep, nomes = _sniff_csv(arquivo)
+    idx = [i for i, nome in enumerate(nomes) if _coluna_util(nome)]
+    df = pd.read_csv(
+        arquivo, sep=sep, encoding=enc, engine="c",
+        usecols=idx, dtype={i: str for i in idx},
+    )
+    df.columns = [nomes[i] for i in idx]
+    return df
+
+def _ler_arquivo(arquivo, aba=0, datas: dict = None) -> pd.DataFrame:
+    """
+    Converte o arquivo baixado (file-like) em DataFrame.
+    - aba: nome ou índice da aba (XLSX); CSV ignora
+    - datas: relatório de datas da fonte (só o XLSX em streaming converte a DATA na leitura)
+    - XLSX: calamine se instalado; senão openpyxl read-only em streaming
+      (em ambos, só as colunas que o dashboard usa)
+    - CSV: encoding/separador detectados uma vez (_sniff_csv), parse no engine C
+    """
+    # ✅ Preferência: XLSX
+    if _bytes_is_xlsx(_cabeca(arquivo)):
+        if TEM_CALAMINE:
+            return _ler_xlsx_calamine(arquivo, aba)
+        return _ler_xlsx_streaming(arquivo, aba, datas)
+
+    # fallback: CSV
+    return _ler_csv(arquivo)
+
+# ======================================================
+# PREPARAÇÃO (colunas / datas / categorias)
+# ======================================================
+# palavras-chave de cada coluna usada pelo dashboard (achar_coluna: 1ª que contiver)
+COLUNAS_BASE = {
+    "estado":    ["ESTADO", "LOCALIDADE", "UF"],
+    "resultado": ["RESULTADO"],
+    "tipo":      ["TIPO"],
+    "motivo":    ["MOTIVO"],
+    "regional":  ["REGIONAL"],
+    "data":      ["DATA"],
+}
+# texto com até esta fração de valores distintos vira categórico (compactar_base)
+LIMITE_CATEGORIA = 0.5
+# chave da nota (nome exato: "TIPO NOTA" não é chave); sem ela, a linha inteira é a chave
+COLUNAS_CHAVE = ["NOTA", "Nº NOTA", "N° NOTA", "NUMERO NOTA", "NÚMERO NOTA"]
+# formatos das exportações IW58 (texto), o mais comum primeiro; o resto cai no parser genérico
+FORMATOS_DATA = ["%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M"]
+# célula de data gravada como número (serial do Excel: dias desde 1899-12-30)
+SERIAL_EXCEL = "serial_excel"
+FAIXA_SERIAL_EXCEL = (1, 2958465)  # 1900-01-01 .. 9999-12-31
+AMOSTRA_DATAS = 500  # valores não vazios (espalhados pela coluna) usados para inferir o formato
+MAX_EXEMPLOS_DATA = 5  # datas ilegíveis guardadas como exemplo no relatório da fonte
+
+# Classificação (ordem = precedência: a 1ª regra cujo trecho aparece no valor vence)
+# - IMPROCED vem antes de PROCED porque "IMPROCEDENTE" também contém "PROCED"
+# - AM vem antes de AS: um tipo que contenha os dois (ex.: "AM/AS") conta como AM
+REGRAS_AMAS = [("AM", "AM"), ("AS", "AS")]
+REGRAS_CLASSE = [("IMPROCED", "IMPROCEDENTE"), ("PROCED", "PROCEDENTE")]
+AMAS = ["AM", "AS", "OUTRO"]
+CLASSES = ["PROCEDENTE", "IMPROCEDENTE", "OUTROS"]
+
+# colunas sem as quais o dashboard não monta (nome exibido → chave de COLUNAS_BASE)
+COLUNAS_OBRIGATORIAS = {"ESTADO/UF": "estado", "RESULTADO": "resultado", "TIPO": "tipo", "DATA": "data"}
+
+class EstruturaIncompativel(ValueError):
+    """Base sem coluna obrigatória (COLUNAS_OBRIGATORIAS); `colunas` = mapeamento encontrado."""
+
+    def __init__(self, colunas: dict, faltando: list):
+        super().__init__("Estrutura da base incompatível. Faltando: " + ", ".join(faltando))
+        self.colunas = colunas
+        self.faltando = faltando
+
+def mapear_colunas(df) -> dict:
+    return {chave: achar_coluna(df, palavras) for chave, palavras in COLUNAS_BASE.items()}
+
+def validar_colunas(colunas: dict):
+    """Levanta EstruturaIncompativel se faltar coluna obrigatória no mapeamento."""
+    faltando = [nome for nome, chave in COLUNAS_OBRIGATORIAS.items() if not colunas.get(chave)]
+    if faltando:
+        raise EstruturaIncompativel(colunas, faltando)
+
+def _ler_formato(s: pd.Series, formato: str) -> pd.Series:
+    """Lê a coluna num formato explícito (vetorizado); o que não casar vira NaT."""
+    if formato != SERIAL_EXCEL:
+        return pd.to_datetime(s, format=formato, errors="coerce")
+    # só números de verdade: texto numérico ("45000", "2024") fica para os outros formatos
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        num = pd.to_numeric(s, errors="coerce")
+    elif isinstance(s.dtype, pd.StringDtype):  # texto (padrão do pandas 3 / CSV): nenhum serial
+        num = pd.Series(np.nan, index=s.index)
+    else:
+        numero = s.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)),
+                       na_action="ignore")
+        num = pd.to_numeric(s.where(numero.eq(True)), errors="coerce")
+    num = num.where(num.between(*FAIXA_SERIAL_EXCEL))
+    return pd.to_datetime(num, unit="D", origin="1899-12-30").dt.round("s").astype("datetime64[us]")
+
+def inferir_formato_data(s: pd.Series, preferido: str = None):
+    """
+    Formato dominante da coluna de datas, por uma amostra (AMOSTRA_DATAS valores não vazios).
+    - Candidatos: FORMATOS_DATA + SERIAL_EXCEL; vence o que ler mais valores da amostra
+      (o 1º que ler a amostra inteira encerra a busca)
+    - preferido: formato já visto na fonte (cache), testado primeiro
+    - None: nenhum candidato lê a amostra (tudo vai para o parser genérico)
+    """
+    valores = s.dropna()
+    if len(valores) > AMOSTRA_DATAS:
+        valores = valores.iloc[np.linspace(0, len(valores) - 1, AMOSTRA_DATAS).astype(int)]
+    if valores.empty:
+        return preferido
+    candidatos = FORMATOS_DATA + [SERIAL_EXCEL]
+    if preferido in candidatos:
+        candidatos = [preferido] + [f for f in candidatos if f != preferido]
+    melhor, lidos_melhor = None, 0
+    for formato in candidatos:
+        lidos = int(_ler_formato(valores, formato).notna().sum())
+        if lidos == len(valores):
+            return formato
+        if lidos > lidos_melhor:
+            melhor, lidos_melhor = formato, lidos
+    return melhor
+
+def _datas_invalidas(s: pd.Series, conv: pd.Series) -> np.ndarray:
+    # DATA preenchida que não virou data (texto vazio / só espaços não conta)
+    invalidas = (conv.isna() & s.notna()).to_numpy(copy=True)
+    if invalidas.any():
+        invalidas[invalidas] = s[invalidas].astype(str).str.strip().to_numpy() != ""
+    return invalidas
+
+def _converter_datas(s: pd.Series, datas: dict = None):
+    """
+    Converte a coluna de datas para datetime64.
+    - Já datetime (XLSX com células de data): mantém
+    - Caminho rápido: formato dominante inferido da amostra (inferir_formato_data)
+      aplicado à coluna inteira de uma vez (vetorizado, formato explícito)
+    - Só as linhas fora dele passam pelos outros formatos (cada um só no que sobrou) e,
+      no fim, pelo parser genérico (dayfirst) valor a valor: o resultado não depende das
+      outras linhas (base inteira ou delta dão o mesmo)
+    - datas: relatório da fonte (opcional), atualizado aqui — "formato" entra como o já
+      visto na fonte e sai como o usado; "fora_do_formato", "invalidas" e "exemplos"
+      (algumas datas ilegíveis) acumulam entre chamadas (blocos / abas)
+    Retorna (datas convertidas, máscara das linhas com DATA ilegível → NaT).
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s, np.zeros(len(s), dtype=bool)
+    datas = datas if datas is not None else {}
+    formato = inferir_formato_data(s, datas.get("formato"))
+    datas["formato"] = formato
+    if formato is not None:
+        conv = _ler_formato(s, formato)
+    else:
+        conv = pd.Series(pd.NaT, index=s.index, dtype="datetime64[us]")
+    resto = conv.isna() & s.notna()
+    datas["fora_do_formato"] = datas.get("fora_do_formato", 0) + int(resto.sum())
+    for outro in FORMATOS_DATA + [SERIAL_EXCEL]:
+        if not resto.any():
+            break
+        if outro != formato:
+            conv[resto] = _ler_formato(s[resto], outro)
+            resto = conv.isna() & s.notna()
+    if resto.any():
+        conv[resto] = pd.to_datetime(s[resto], errors="coerce", dayfirst=True, format="mixed")
+
+    invalidas = _datas_invalidas(s, conv)
+    if invalidas.any():
+        datas["invalidas"] = datas.get("invalidas", 0) + int(invalidas.sum())
+        exemplos = datas.setdefault("exemplos", [])
+        for valor in s[invalidas].astype(str).unique()[:MAX_EXEMPLOS_DATA]:
+            if len(exemplos) < MAX_EXEMPLOS_DATA and valor not in exemplos:
+                exemplos.append(valor)
+    return conv, invalidas
+
+def _categoria_normalizada(s: pd.Series, strip: bool = True) -> pd.Series:
+    """
+    Texto em maiúsculas (e sem espaços) como categórico.
+    Normaliza só os valores distintos (factorize) em vez de linha a linha.
+    """
+    codigos, unicos = pd.factorize(s)
+    norm = pd.Index(unicos).astype(str).str.upper()
+    if strip:
+        norm = norm.str.strip()
+    categorias = norm.unique()
+    novos = categorias.get_indexer(norm)[codigos]
+    novos[codigos < 0] = -1
+    return pd.Series(pd.Categorical.from_codes(novos, categories=categorias), index=s.index, name=s.name)
+
+def _classificar(s: pd.Series, regras, rotulos) -> pd.Series:
+    """
+    Classifica um categórico já normalizado usando só os valores distintos.
+    - regras: [(trecho, rótulo)] em ordem de precedência
+    - rotulos: categorias do resultado; o último é o padrão (nenhuma regra / vazio)
+    """
+    def _rotulo(valor):
+        for trecho, rotulo in regras:
+            if trecho in valor:
+                return rotulo
+        return rotulos[-1]
+
+    # posição extra no fim = padrão; código -1 (vazio) cai nela
+    mapa = np.array(
+        [rotulos.index(_rotulo(v)) for v in s.cat.categories] + [len(rotulos) - 1],
+        dtype=np.int8,
+    )
+    codigos = mapa[s.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=rotulos), index=s.index, name=s.name)
+
+def preparar_base(df: pd.DataFrame, datas: dict = None):
+    """
+    Base pronta para o dashboard (feita uma vez por versão, antes do snapshot).
+    - Resolve o mapeamento de colunas (COLUNAS_BASE)
+    - DATA vira datetime64 (_converter_datas); _DATA_INVALIDA_ marca as linhas com DATA
+      preenchida mas ilegível (ficam NaT); `datas`: relatório de datas da fonte
+    - _TIPO_ / _RES_: TIPO e RESULTADO em maiúsculas e sem espaços (categórico)
+    - _UF_: ESTADO/UF em maiúsculas (categórico), usado nas abas e no filtro de UF
+    - _AMAS_ / _CLASSE_: classificação de tipo e resultado (REGRAS_AMAS / REGRAS_CLASSE)
+    - Linhas ordenadas por DATA (NaT no fim) para fatiar_por_data
+    Retorna (df, colunas).
+    """
+    colunas = mapear_colunas(df)
+    if colunas["data"] is not None:
+        with metricas_iw58.etapa("converter_datas", linhas=len(df)) as m:
+            datas = datas if datas is not None else {}
+            df[colunas["data"]], invalidas = _converter_datas(df[colunas["data"]], datas)
+            m["formato"] = datas.get("formato")
+        if "_DATA_INVALIDA_" not in df.columns:  # XLSX em streaming já marca na leitura
+            df["_DATA_INVALIDA_"] = invalidas
+        df = df.sort_values(colunas["data"], kind="stable", na_position="last").reset_index(drop=True)
+    if colunas["tipo"] is not None:
+        df["_TIPO_"] = _categoria_normalizada(df[colunas["tipo"]])
+        df["_AMAS_"] = _classificar(df["_TIPO_"], REGRAS_AMAS, AMAS)
+    if colunas["resultado"] is not None:
+        df["_RES_"] = _categoria_normalizada(df[colunas["resultado"]])
+        df["_CLASSE_"] = _classificar(df["_RES_"], REGRAS_CLASSE, CLASSES)
+    if colunas["estado"] is not None:
+        df["_UF_"] = _categoria_normalizada(df[colunas["estado"]], strip=False)
+    return df, colunas
+
+def _concatenar_colunas(lista_colunas) -> dict:
+    # mapeamento da base combinada: para cada chave, o nome da 1ª fonte que a tem
+    colunas = {}
+    for cols in lista_colunas:
+        for chave, nome in cols.items():
+            if colunas.get(chave) is None:
+                colunas[chave] = nome
+    return colunas
+
+def _padronizar_colunas(df: pd.DataFrame, cols: dict, colunas: dict) -> pd.DataFrame:
+    # renomeia as colunas mapeadas de uma fonte (cols) para os nomes da base combinada
+    renomear = {nome: colunas[chave] for chave, nome in cols.items() if nome is not None and nome != colunas[chave]}
+    return df.rename(columns=renomear) if renomear else df
+
+def _como_categoria(s: pd.Series, dfs, col: str) -> pd.Series:
+    # parte ainda em texto: vira categórico com as categorias de todas as partes (na ordem
+    # de aparição, como union_categoricals), para a união não depender do tipo das categorias
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    valores = [
+        d[col].cat.categories if isinstance(d[col].dtype, pd.CategoricalDtype) else d[col].dropna().unique()
+        for d in dfs
+    ]
+    categorias = pd.unique(np.concatenate([np.asarray(v, dtype=object) for v in valores]))
+    return pd.Series(pd.Categorical(s, categories=categorias), index=s.index, name=s.name)
+
+def _concatenar_bases(partes):
+    """
+    Junta bases já preparadas (preparar_base) de várias fontes/abas.
+    - Colunas mapeadas com nomes diferentes (ex.: "DATA" × "DATA CRIAÇÃO") são unificadas
+    - Categóricos continuam categóricos (union_categoricals), com DATA reordenada (NaT no fim)
+    - Coluna categórica em alguma parte e texto em outra (ex.: delta pequeno que não passou
+      em LIMITE_CATEGORIA, fontes de cardinalidade diferente) também sai categórica
+    Recebe [(df, colunas)] e retorna (df, colunas).
+    """
+    if len(partes) == 1:
+        return partes[0]
+    colunas = _concatenar_colunas([cols for _, cols in partes])
+    dfs = [_padronizar_colunas(df, cols, colunas) for df, cols in partes]
+
+    categoricas = [
+        col for col in dfs[0].columns
+        if all(col in d.columns for d in dfs)
+        and any(isinstance(d[col].dtype, pd.CategoricalDtype) for d in dfs)
+    ]
+    unidas = {col: union_categoricals([_como_categoria(d[col], dfs, col) for d in dfs]) for col in categoricas}
+    df = pd.concat(dfs, ignore_index=True)
+    for col, valores in unidas.items():
+        df[col] = valores
+    if "_DATA_INVALIDA_" in df.columns:  # fonte sem DATA: nenhuma linha inválida
+        df["_DATA_INVALIDA_"] = df["_DATA_INVALIDA_"].eq(True)
+    if colunas["data"] is not None:
+        df = df.sort_values(colunas["data"], kind="stable", na_position="last").reset_index(drop=True)
+    return df, colunas
+
+def _impressao_linhas(bruto: pd.DataFrame, fonte: str = ""):
+    """
+    Impressão digital de cada linha lida (antes da preparação).
+    - _HASH_: hash do conteúdo da linha (detecta nota alterada)
+    - _CHAVE_: hash de (fonte, nº da nota, ocorrência); sem coluna de nota, usa o
+      próprio conteúdo — a ocorrência separa notas/linhas repetidas
+    - fonte: arquivo + aba (ver _carregar_fonte) — a mesma nota em duas fontes/abas
+      tem chaves diferentes (o motor SQL apaga o delta pela chave)
+    Retorna (chave, conteudo) como arrays uint64.
+    """
+    conteudo = pd.util.hash_pandas_object(bruto, index=False).to_numpy()
+    col_chave = next((c for c in bruto.columns if c in COLUNAS_CHAVE), None)
+    if col_chave is not None:
+        base = pd.util.hash_pandas_object(bruto[col_chave].astype(str), index=False).to_numpy()
+    else:
+        base = conteudo
+    ocorrencia = pd.Series(base).groupby(base, sort=False).cumcount().to_numpy()
+    id_fonte = pd.util.hash_pandas_object(pd.Series([fonte]), index=False).iloc[0]
+    chave = pd.util.hash_pandas_object(
+        pd.DataFrame({"fonte": np.full(len(base), id_fonte), "base": base, "n": ocorrencia}), index=False
+    ).to_numpy()
+    return chave, conteudo
+
+def _preparar_brutos(brutos, datas: dict = None) -> tuple:
+    """
+    Prepara (preparar_base + compactar_base) as abas lidas, já com _CHAVE_/_HASH_,
+    e junta tudo. Retorna (df, colunas, bytes da base antes da compactação).
+    """
+    partes = []
+    antes = 0
+    for bruto in brutos:
+        df, colunas = preparar_base(bruto, datas)
+        df, relatorio = compactar_base(_tipar_colunas(df), colunas)
+        partes.append((df, colunas))
+        antes += relatorio["antes"]
+    df, colunas = _concatenar_bases(partes)
+    return df, colunas, antes
+
+def _aplicar_delta(anterior: pd.DataFrame, colunas_ant: dict, brutos, datas: dict = None):
+    """
+    Atualiza a base anterior com o que mudou no arquivo novo (extração só cresce).
+    - brutos: abas lidas do arquivo novo, com _CHAVE_/_HASH_
+    - Só as linhas novas ou alteradas passam por preparar_base
+    - Se alguma linha anterior sumiu do arquivo, não é um acréscimo: retorna None
+      (quem chama reprocessa tudo)
+    Retorna (df, colunas, mais, menos): mais = linhas preparadas que entraram,
+    menos = linhas anteriores que saíram (versão antiga das notas alteradas).
+    """
+    chave_ant = anterior["_CHAVE_"].to_numpy()
+    chave_nova = np.concatenate([b["_CHAVE_"].to_numpy() for b in brutos])
+    if not np.isin(chave_ant, chave_nova).all():
+        return None
+
+    pos = pd.Index(chave_ant).get_indexer(chave_nova)
+    hash_ant = anterior["_HASH_"].to_numpy()
+    hash_novo = np.concatenate([b["_HASH_"].to_numpy() for b in brutos])
+    entram = (pos < 0) | (hash_ant[pos] != hash_novo)
+    if not entram.any():  # mesmo conteúdo (ex.: arquivo salvo de novo)
+        return anterior, colunas_ant, anterior.iloc[:0], anterior.iloc[:0]
+    saem = np.zeros(len(anterior), dtype=bool)
+    saem[pos[entram & (pos >= 0)]] = True
+
+    inicio = np.cumsum([0] + [len(b) for b in brutos])
+    deltas = [b[entram[ini:ini + len(b)]] for b, ini in zip(brutos, inicio)]
+    deltas = [d for d in deltas if len(d)]
+    mais, colunas_mais, _ = _preparar_brutos(deltas, datas)
+    menos = anterior[saem]
+    df, colunas = _concatenar_bases([(anterior[~saem], colunas_ant), (mais, colunas_mais)])
+    mais = _padronizar_colunas(mais, colunas_mais, colunas)
+    return df, colunas, mais, menos
+
+def fatiar_por_data(df: pd.DataFrame, col: str, ini=None, fim=None) -> pd.DataFrame:
+    """
+    Linhas com `col` entre ini e fim (datas inclusivas) por busca binária.
+    ⚠️ df precisa estar ordenado por `col` com NaT no fim (preparar_base / cubo_iw58).
+    - ini/fim None: sem limite daquele lado (fim None inclui as linhas sem data)
+    Retorna fatia posicional (iloc): sem máscara booleana e sem cópia dos dados.
+    """
+    datas = df[col]
+    a = datas.searchsorted(pd.Timestamp(ini), side="left") if ini is not None else 0
+    b = datas.searchsorted(pd.Timestamp(fim) + pd.Timedelta(days=1), side="left") if fim is not None else len(df)
+    return df.iloc[a:b]
+
+def _memoria(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+def compactar_base(df: pd.DataFrame, colunas: dict):
+    """
+    Reduz a base preparada ao que o dashboard lê, nos tipos mais compactos.
+    - ESTADO/TIPO/RESULTADO originais saem quando _UF_/_TIPO_/_RES_ já existem
+      (`colunas` continua registrando o nome original)
+    - Colunas que nada lê (fora de `colunas` e das internas _X_) saem
+    - Texto com poucos valores distintos (LIMITE_CATEGORIA) → categórico
+    - Números → menor tipo que cabe; DATA já é datetime64 (preparar_base)
+    Retorna (df, {"antes": bytes, "depois": bytes}).
+    """
+    antes = _memoria(df)
+    derivadas = {"estado": "_UF_", "tipo": "_TIPO_", "resultado": "_RES_"}
+    usadas = {
+        nome for chave, nome in colunas.items()
+        if nome is not None and derivadas.get(chave) not in df.columns
+    }
+    df = df[[c for c in df.columns if c in usadas or (c.startswith("_") and c.endswith("_"))]]
+    for col in df.columns:
+        s = df[col]
+        if col in ("_CHAVE_", "_HASH_", "_DATA_INVALIDA_") or isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(s):
+            df[col] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s):
+            df[col] = pd.to_numeric(s, downcast="float")
+        elif not pd.api.types.is_datetime64_any_dtype(s) and s.nunique() <= LIMITE_CATEGORIA * len(s):
+            df[col] = s.astype("category")
+    return df, {"antes": antes, "depois": _memoria(df)}
+
+def _tipar_colunas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Deixa o DataFrame serializável em formato colunar (tipos homogêneos).
+    - Colunas texto com tipos misturados (ex.: 123 e "ABC") viram texto
+    """
+    for col in df.columns:
+        s = df[col]
+        if s.dtype != object:
+            continue
+        tipo = pd.api.types.infer_dtype(s, skipna=True)
+        if tipo.startswith("mixed"):
+            df[col] = s.where(s.isna(), s.astype(str))
+    return df
+
+# ======================================================
+# SNAPSHOT (disco)
+# ======================================================
+def _caminhos_snapshot(url: str, abas=(0,)):
+    # um snapshot por fonte (arquivo + abas lidas): prefixo dos dados + meta
+    chave = hashlib.sha1(f"{url}|{list(abas)}".encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(DIR_SNAPSHOT, f"base_{chave}")
+    return base, f"{base}.json"
+
+def _caminho_dados(prefixo: str, sha: str) -> str:
+    # dados de cada versão num arquivo próprio: o meta aponta (meta["dados"]) para o dele
+    ext = "arrow" if feather is not None else "pkl"
+    return f"{prefixo}_{sha[:16]}.{ext}"
+
+def _ler_meta(caminho_meta: str) -> dict:
+    try:
+        with open(caminho_meta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _gravar_snapshot(df: pd.DataFrame, meta: dict, caminho_dados: str, caminho_meta: str):
+    """
+    Grava dados + metadados de forma atômica (tmp + os.replace), segura com vários
+    processos gravando a mesma fonte (workers do Streamlit, lote_iw58 ao lado do app):
+    - tmp por processo (.tmp<pid>): ninguém escreve no tmp de outro
+    - caminho_dados é da versão (_caminho_dados); o meta, que aponta para ele, é
+      trocado por último — o sha do meta sempre corresponde aos dados que ele indica
+    - Dados de versões antigas são apagados (fica a anterior: quem ainda a lê termina)
+    """
+    pasta = os.path.dirname(caminho_dados)
+    os.makedirs(pasta, exist_ok=True)
+    tmp_dados = f"{caminho_dados}.tmp{os.getpid()}"
+    if feather is not None:
+        # sem compressão: permite memory-map na leitura
+        feather.write_feather(df.reset_index(drop=True), tmp_dados, compression="uncompressed")
+    else:
+        df.to_pickle(tmp_dados)
+    os.replace(tmp_dados, caminho_dados)
+
+    anterior = _ler_meta(caminho_meta).get("dados")
+    meta = {**meta, "dados": os.path.basename(caminho_dados)}
+    tmp_meta = f"{caminho_meta}.tmp{os.getpid()}"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_meta, caminho_meta)
+
+    # mantém a versão gravada, a anterior e a que o meta indica agora (outro processo
+    # pode ter publicado depois deste)
+    manter = {meta["dados"], anterior, _ler_meta(caminho_meta).get("dados")}
+    prefixo = os.path.basename(caminho_meta)[:-len(".json")]
+    for nome in os.listdir(pasta):
+        antigo = nome.startswith(f"{prefixo}_") or nome in (f"{prefixo}.arrow", f"{prefixo}.pkl")
+        if antigo and nome not in manter and ".tmp" not in nome:
+            try:
+                os.remove(os.path.join(pasta, nome))
+            except OSError:
+                pass
+
+def _ler_snapshot(caminho_dados: str) -> pd.DataFrame:
+    if feather is not None:
+        return feather.read_table(caminho_dados, memory_map=True).to_pandas()
+    return pd.read_pickle(caminho_dados)
+
+# ======================================================
+# DOWNLOAD (condicional + hash em streaming)
+# ======================================================
+def _baixar(url: str, meta: dict):
+    """
+    Baixa o arquivo com requisição condicional (If-None-Match / If-Modified-Since).
+    O corpo vai direto para um SpooledTemporaryFile (memória até
+    LIMITE_DOWNLOAD_MEMORIA, depois disco), com hash calculado no caminho.
+    Retorna (status, arquivo, sha256, headers, bytes baixados):
+    - "304": servidor confirmou que não mudou (arquivo = None, 0 bytes)
+    - "inalterado": veio o corpo inteiro, mas o hash é igual ao do snapshot (arquivo = None)
+    - "alterado": conteúdo novo (arquivo na posição 0 — quem chama fecha)
+    """
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = requests.get(url, headers=headers, timeout=60, stream=True)
+    try:
+        if r.status_code == 304:
+            return "304", None, None, r.headers, 0
+        r.raise_for_status()
+
+        sha = hashlib.sha256()
+        arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_DOWNLOAD_MEMORIA)
+        baixados = 0
+        for bloco in r.iter_content(chunk_size=TAM_BLOCO_DOWNLOAD):
+            sha.update(bloco)
+            arquivo.write(bloco)
+            baixados += len(bloco)
+    finally:
+        r.close()
+
+    sha = sha.hexdigest()
+    if meta.get("sha256") == sha:
+        arquivo.close()
+        return "inalterado", None, sha, r.headers, baixados
+    arquivo.seek(0)
+    return "alterado", arquivo, sha, r.headers, baixados
+
+# ======================================================
+# CARGA
+# ======================================================
+def _normalizar_fontes(fontes):
+    """
+    Manifesto de fontes → [(url, abas)].
+    - fontes: um link, ou lista de links e/ou {"url": link, "abas": [nome ou índice, ...]}
+    - Sem "abas": só a 1ª aba (CSV tem uma "aba" só: abas a mais são ignoradas na leitura)
+    """
+    if isinstance(fontes, str):
+        fontes = [fontes]
+    saida = []
+    for fonte in fontes:
+        if isinstance(fonte, str):
+            saida.append((fonte, (0,)))
+        else:
+            saida.append((fonte["url"], tuple(fonte.get("abas") or (0,))))
+    return saida
+
+def chave_fontes(fontes) -> str:
+    """Chave curta de um manifesto de fontes: bancos (sql_iw58) e cubo compartilhado (cubo_iw58) por base."""
+    return hashlib.sha1(json.dumps(_normalizar_fontes(fontes), default=str).encode("utf-8")).hexdigest()[:16]
+
+def _carregar_fonte(url_original: str, abas=(0,)):
+    """
+    Baixa uma fonte e, se o conteúdo mudou, reprocessa e grava o snapshot dela.
+    - Se o arquivo novo só acrescentou/alterou notas, aplica o delta sobre o snapshot
+      (info["delta"]); senão reprocessa tudo
+    - O formato de DATA inferido fica no meta do snapshot (chave = arquivo + abas) e é
+      o primeiro testado na próxima leitura da fonte; info["datas"]: formato e linhas com
+      DATA ilegível (ver _converter_datas)
+    Retorna (df, info): df só vem quando a fonte foi reprocessada (status "alterado");
+    nos outros casos o snapshot em info["caminho"] é a versão vigente.
+    """
+    t0 = time.perf_counter()
+    url = _drive_direct_download(url_original)
+    prefixo, caminho_meta = _caminhos_snapshot(url, abas)
+    meta = _ler_meta(caminho_meta)
+    caminho_dados = os.path.join(DIR_SNAPSHOT, meta["dados"]) if meta.get("dados") else ""
+    tem_snapshot = (
+        meta.get("formato") == VERSAO_SNAPSHOT
+        and os.path.exists(caminho_dados)
+    )
+    meta_cond = meta if tem_snapshot else {}
+
+    info = {"url": url, "caminho": caminho_dados, "status": None, "bytes": 0, "t_download": 0.0, "t_parse": 0.0}
+    try:
+        with metricas_iw58.etapa("download"):
+            status, arquivo, sha, headers, info["bytes"] = _baixar(url, meta_cond)
+    except requests.RequestException:
+        if not tem_snapshot:
+            raise
+        status, arquivo, sha, headers = "offline", None, None, {}
+    info["t_download"] = time.perf_counter() - t0
+    info["status"] = status
+
+    df = None
+    if status == "alterado":
+        with arquivo:
+            tamanho = arquivo.seek(0, os.SEEK_END)
+            if _bytes_is_html(_cabeca(arquivo)):
+                raise RuntimeError("URL retornou HTML (provável permissão/link). No Drive: 'Qualquer pessoa com o link' (Visualizador).")
+            # CSV tem uma "aba" só: abas a mais no manifesto repetiriam as mesmas linhas
+            if not _bytes_is_xlsx(_cabeca(arquivo)):
+                abas = abas[:1]
+
+            t1 = time.perf_counter()
+            datas = {"formato": (meta.get("datas") or {}).get("formato")}
+            brutos = []
+            for aba in abas:
+                with metricas_iw58.etapa("parse") as m:
+                    bruto = _ler_arquivo(arquivo, aba, datas)
+                    m["linhas"] = len(bruto)
+                bruto["_CHAVE_"], bruto["_HASH_"] = _impressao_linhas(bruto, f"{url}#{aba}")
+                brutos.append(bruto)
+            # extração que só cresce: prepara só as linhas novas/alteradas sobre o snapshot
+            with metricas_iw58.etapa("preparar") as m:
+                delta = _aplicar_delta(_ler_snapshot(caminho_dados), meta["colunas"], brutos, datas) if tem_snapshot else None
+                if delta is None:
+                    df, colunas, mem_antes = _preparar_brutos(brutos, datas)
+                m["linhas"] = len(df) if delta is None else len(delta[2])
+            if delta is not None:
+                df, colunas, mais, menos = delta
+                info["delta"] = {"de": meta["sha256"], "mais": mais, "menos": menos}
+                # "antes" do delta: proporcional ao da carga completa anterior
+                mem_antes = round(meta["memoria"]["antes"] * len(df) / max(meta["linhas"], 1))
+                # exemplos das linhas que ficaram (as novas primeiro)
+                datas["exemplos"] = list(dict.fromkeys(
+                    datas.get("exemplos", []) + (meta.get("datas") or {}).get("exemplos", [])
+                ))[:MAX_EXEMPLOS_DATA]
+            info["t_parse"] = time.perf_counter() - t1
+        meta = {
+            "formato": VERSAO_SNAPSHOT,
+            "url": url,
+            "abas": list(abas),
+            "sha256": sha,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "bytes": tamanho,
+            "linhas": int(len(df)),
+            "colunas": colunas,
+            "memoria": {"antes": mem_antes, "depois": _memoria(df)},
+            "datas": {
+                "formato": datas.get("formato"),
+                "invalidas": int(df["_DATA_INVALIDA_"].sum()) if "_DATA_INVALIDA_" in df.columns else 0,
+                "exemplos": datas.get("exemplos", []),
+            },
+            "gerado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        info["caminho"] = _caminho_dados(prefixo, sha)
+        with metricas_iw58.etapa("snapshot_gravar", linhas=len(df)):
+            _gravar_snapshot(df, meta, info["caminho"], caminho_meta)
+
+    info["versao"] = meta.get("sha256")
+    info["colunas"] = meta.get("colunas", {})
+    info["linhas"] = int(meta.get("linhas", 0))
+    info["memoria"] = meta.get("memoria")
+    info["datas"] = meta.get("datas")
+    return df, info
+
+def _versao_combinada(versoes) -> str:
+    # versão da base = combinação das versões das fontes (qualquer fonte nova → versão nova)
+    return hashlib.sha256("|".join(v or "" for v in versoes).encode("utf-8")).hexdigest()
+
+def _combinar_deltas(deltas, infos, colunas) -> dict:
+    """
+    Delta da base combinada: {"de": versão anterior, "mais": linhas que entraram,
+    "menos": linhas que saíram}, com as colunas nos nomes da base combinada.
+    """
+    def _juntar(lado):
+        partes = [(d[lado], i["colunas"]) for d, i in zip(deltas, infos) if d is not None]
+        df, cols = _concatenar_bases(partes)
+        return _padronizar_colunas(df, cols, colunas)
+
+    return {
+        "de": _versao_combinada(d["de"] if d is not None else i["versao"] for d, i in zip(deltas, infos)),
+        "mais": _juntar("mais"),
+        "menos": _juntar("menos"),
+    }
+
+def carregar_base(fontes, versao_atual: str = None):
+    """
+    Carrega a base do Google Drive (preferencialmente XLSX), usando o snapshot local
+    de cada fonte sempre que o conteúdo do arquivo dela não mudou.
+    - fontes: um link ou um manifesto (ver _normalizar_fontes) — base dividida por
+      mês/regional em vários arquivos e/ou várias abas
+    - As fontes são baixadas/processadas em paralelo (threads); só a fonte que mudou
+      é reprocessada, as demais vêm do snapshot (memory-map) e tudo é concatenado
+    - Se vier HTML, mostra erro de permissão/link
+    - Se o download falhar e existir snapshot, usa o snapshot (última versão boa)
+    - versao_atual: versão que o chamador já tem em memória; se nenhuma fonte
+      mudou, nem os snapshots são lidos e df volta como None
+    - info["delta"]: presente quando só entraram/mudaram notas (ver _combinar_deltas),
+      para atualizar agregados sem refazê-los
+    - Manifesto sem nenhuma fonte: ValueError
+    - Base sem coluna obrigatória: EstruturaIncompativel (antes de qualquer motor montar
+      consultas sobre ela)
+    Retorna (df, info) — info traz status do download, bytes e tempos (e info["fontes"]).
+    """
+    t0 = time.perf_counter()
+    fontes = _normalizar_fontes(fontes)
+    if not fontes:
+        raise ValueError("Nenhuma fonte da base configurada (informe um link ou um manifesto com ao menos uma fonte).")
+    with ThreadPoolExecutor(max_workers=min(len(fontes), MAX_FONTES_PARALELAS)) as pool:
+        resultados = list(pool.map(lambda fonte: _carregar_fonte(*fonte), fontes))
+    infos = [info for _, info in resultados]
+    deltas = [i.pop("delta", None) for i in infos]
+
+    versao = _versao_combinada(i["versao"] for i in infos)
+    info = {
+        "status": next((s for s in PRIORIDADE_STATUS if any(i["status"] == s for i in infos)), None),
+        "bytes": sum(i["bytes"] for i in infos),
+        "t_download": max(i["t_download"] for i in infos),  # em paralelo: vale a mais lenta
+        "t_parse": max(i["t_parse"] for i in infos),
+        "versao": versao,
+        # memória da base em pandas antes/depois da compactação (compactar_base)
+        "memoria": {
+            lado: sum(i["memoria"][lado] for i in infos if i.get("memoria"))
+            for lado in ("antes", "depois")
+        },
+        # linhas com DATA preenchida mas ilegível (NaT: ficam fora dos filtros de período)
+        "datas": {
+            "invalidas": sum((i.get("datas") or {}).get("invalidas", 0) for i in infos),
+            "exemplos": [e for i in infos for e in (i.get("datas") or {}).get("exemplos", [])][:MAX_EXEMPLOS_DATA],
+        },
+        "fontes": infos,
+    }
+
+    if versao_atual is not None and versao_atual == versao:
+        df = None
+        info["colunas"] = _concatenar_colunas([i["colunas"] for i in infos])
+        info["linhas"] = sum(i["linhas"] for i in infos)
+    else:
+        t1 = time.perf_counter()
+        partes = [
+            (df if df is not None else _ler_snapshot(i["caminho"]), i["colunas"])
+            for df, i in resultados
+        ]
+        df, info["colunas"] = _concatenar_bases(partes)
+        info["t_parse"] += time.perf_counter() - t1
+        info["linhas"] = int(len(df))
+        # toda fonte alterada veio por delta: os agregados podem ser atualizados em vez de refeitos
+        if any(deltas) and all(d is not None or i["status"] != "alterado" for d, i in zip(deltas, infos)):
+            info["delta"] = _combinar_deltas(deltas, infos, info["colunas"])
+
+    validar_colunas(info["colunas"])
+    info["t_total"] = time.perf_counter() - t0
+    return df, info
+
+# ======================================================
+# ATUALIZAÇÃO EM SEGUNDO PLANO
+# ======================================================
+@dataclass(frozen=True)
+class VersaoBase:
+    """
+    Uma versão completa da base: tudo é trocado junto (nunca alterado in-place).
+    - consulta: consultas do dashboard montadas pelo motor (ex.: cubo_iw58.ConsultaCubo)
+    - df: base preparada (None quando o motor não guarda a base em memória)
+    """
+    df: pd.DataFrame
+    info: dict
+    consulta: object = None
+
+class AtualizadorBase:
+    """
+    Mantém a base carregada e atualizada fora do caminho da requisição.
+    - Uma thread (daemon) chama carregar_base(fontes) a cada `intervalo` segundos
+    - A nova versão é montada inteira "ao lado" e trocada de uma vez (double buffer):
+      quem lê sempre recebe a última versão boa, sem espera
+    - motor: monta as consultas de cada versão nova (cubo_iw58.MotorCubo, sql_iw58.MotorSQL)
+      - montar(df, info) / atualizar(consulta, info, mais, menos) quando a carga veio
+        por delta (custo proporcional ao delta)
+      - restaurar(): versão já persistida pelo motor (cold start sem esperar a carga)
+      - guardar_base: se a VersaoBase mantém o DataFrame em memória
+    - Se uma atualização falhar, a versão anterior continua valendo (erro fica em .erro)
+      e o worker tenta de novo logo (RETENTATIVA_INICIAL, dobrando até RETENTATIVA_MAXIMA)
+      em vez de esperar o `intervalo` — sem versão boa, obter() não fica preso ao erro
+    ⚠️ Os DataFrames são compartilhados entre sessões: não altere in-place.
+    """
+
+    def __init__(self, fontes, intervalo: float = 600, motor=None):
+        self.fontes = fontes
+        self.intervalo = intervalo
+        self.motor = motor
+        self.erro = None
+        self._atual = None          # VersaoBase — só é trocada, nunca alterada
+        restaurado = motor.restaurar() if motor is not None else None
+        if restaurado is not None:
+            info, consulta = restaurado
+            self._atual = VersaoBase(None, info, consulta)
+        self._geracao = 0           # nº de ciclos de atualização concluídos
+        self._em_andamento = False
+        self._cond = threading.Condition()
+        self._acordar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="iw58-atualizador", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        retentativa = RETENTATIVA_INICIAL
+        while True:
+            self._atualizar()
+            if self.erro is None:
+                espera, retentativa = self.intervalo, RETENTATIVA_INICIAL
+            else:  # rede/Drive fora, base incompleta...: tenta de novo em pouco tempo
+                espera, retentativa = min(retentativa, self.intervalo), min(retentativa * 2, RETENTATIVA_MAXIMA)
+            self._acordar.wait(espera)
+            self._acordar.clear()
+
+    def _atualizar(self):
+        with self._cond:
+            self._em_andamento = True
+        atual = self._atual
+        try:
+            with metricas_iw58.etapa("carregar_base") as m:
+                df, info = carregar_base(self.fontes, versao_atual=atual.info["versao"] if atual else None)
+                m["linhas"] = info.get("linhas")
+            info["atualizado_em"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            delta = info.pop("delta", None)
+            if df is None:  # mesma versão: reaproveita base e consultas
+                novo = VersaoBase(atual.df, info, atual.consulta)
+            elif self.motor is None:
+                novo = VersaoBase(df, info)
+            else:
+                if (
+                    delta is not None and atual is not None
+                    and atual.consulta is not None and atual.info["versao"] == delta["de"]
+                ):
+                    with metricas_iw58.etapa("motor_atualizar", linhas=len(delta["mais"]) + len(delta["menos"])):
+                        consulta = self.motor.atualizar(atual.consulta, info, delta["mais"], delta["menos"])
+                else:
+                    with metricas_iw58.etapa("motor_montar", linhas=len(df)):
+                        consulta = self.motor.montar(df, info)
+                novo = VersaoBase(df if self.motor.guardar_base else None, info, consulta)
+        except Exception as e:  # mantém a última versão boa
+            erro, novo = e, None
+        else:
+            erro = None
+
+        with self._cond:
+            self.erro = erro
+            if novo is not None:
+                self._atual = novo
+            self._geracao += 1
+            self._em_andamento = False
+            self._cond.notify_all()
+
+    def obter(self, timeout: float = None) -> VersaoBase:
+        """Retorna a última versão boa (VersaoBase); na 1ª carga espera o worker."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._geracao > 0 or self._atual is not None, timeout)
+            if self._atual is None:
+                raise self.erro or TimeoutError("Base ainda não carregada.")
+            return self._atual
+
+    def agendar(self, esperar: float = None):
+        """
+        Pede uma atualização imediata (sem limpar caches de ninguém).
+        - esperar: segundos para aguardar o ciclo terminar (None = não espera)
+        """
+        with self._cond:
+            # ciclo já em andamento pode ter começado antes do pedido: espera o próximo
+            alvo = self._geracao + (2 if self._em_andamento else 1)
+            self._acordar.set()
+            if esperar:
+                self._cond.wait_for(lambda: self._geracao >= alvo, esperar)
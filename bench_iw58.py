@@ -0,0 +1,277 @@
+"""
+Benchmark do pipeline do dashboard IW58 (headless, sem servidor Streamlit).
+
+Uso:
+    python bench_iw58.py
+    python bench_iw58.py --linhas 10000 100000 --formatos xlsx csv --memoria
+    python bench_iw58.py --saida bench_novo.json --comparar bench_antigo.json
+
+- gerar_base_sintetica: extrato IW58 realista (UFs, regionais, motivos, datas e sujeira)
+- Cada etapa do app.py é cronometrada isoladamente (parse, preparação, cubo,
+  filtros, gráficos, HTML, PDF)
+- --memoria: pico de memória por etapa via tracemalloc (rodada extra, fora do tempo)
+- Saída: relatório JSON (etapa × tamanho × formato) para comparar versões;
+  padrão .cache_iw58/bench_iw58.json (pasta do snapshot, ignorada pelo git)
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import base_iw58
+import cubo_iw58
+from graficos_iw58 import (
+    donut_resultado, barh_contagem, acumulado_mensal_fig_e_tabela, resumo_por_localidade_html,
+)
+from relatorio_iw58 import gerar_pdf
+
+# ======================================================
+# CONFIG
+# ======================================================
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000, 5_000_000]
+LIMITE_LINHAS_XLSX = 1_048_575  # 1 linha de cabeçalho + limite do Excel
+
+UFS_PADRAO = ["BA", "SE", "AL", "PE", "PB", "RN", "CE", "PI", "MA"]
+REGIONAIS_PADRAO = ["NORTE", "SUL", "LESTE", "OESTE", "CENTRO", "METROPOLITANA"]
+MOTIVOS_PADRAO = [
+    "MEDIDOR OK", "LEITURA CONFIRMADA", "CLIENTE AUSENTE", "ACESSO IMPEDIDO",
+    "SEM IRREGULARIDADE", "CONSUMO COMPATÍVEL", "ENDEREÇO NÃO LOCALIZADO", "OUTROS",
+]
+
+# ======================================================
+# BASE SINTÉTICA
+# ======================================================
+def gerar_base_sintetica(
+    linhas: int,
+    ufs=None,
+    regionais=None,
+    motivos=None,
+    inicio: str = "2023-01-01",
+    dias: int = 730,
+    sujeira: float = 0.02,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Extrato IW58 sintético com as colunas que o dashboard procura + colunas que ele ignora.
+    - sujeira: fração de linhas com valores "sujos" (minúsculas/espaços, datas em texto
+      dd/mm/aaaa ou dd/mm/aaaa HH:MM, datas inválidas, resultado vazio)
+    """
+    rng = np.random.default_rng(seed)
+    ufs = ufs or UFS_PADRAO
+    regionais = regionais or REGIONAIS_PADRAO
+    motivos = motivos or MOTIVOS_PADRAO
+
+    tipo = rng.choice(["AM", "AS"], linhas, p=[0.6, 0.4]).astype(object)
+    resultado = rng.choice(
+        ["PROCEDENTE", "IMPROCEDENTE", "EM ANÁLISE", None], linhas, p=[0.45, 0.35, 0.15, 0.05]
+    ).astype(object)
+    motivo = np.where(resultado == "IMPROCEDENTE", rng.choice(motivos, linhas), None).astype(object)
+    datas = (
+        pd.Timestamp(inicio)
+        + pd.to_timedelta(rng.integers(0, dias, linhas), unit="D")
+        + pd.to_timedelta(rng.integers(7 * 60, 19 * 60, linhas), unit="min")
+    )
+
+    df = pd.DataFrame({
+        "Nota": np.arange(linhas, dtype=np.int64) + 300_000_000,
+        "Estado": rng.choice(ufs, linhas).astype(object),
+        "Tipo Nota": tipo,
+        "Resultado": resultado,
+        "Motivo": motivo,
+        "Regional": rng.choice(regionais, linhas).astype(object),
+        "Data Criação": pd.Series(datas.to_pydatetime(), dtype=object),
+        "Descrição": rng.choice(["INSPEÇÃO DE ROTINA", "DENÚNCIA", "AUDITORIA", "RECLAMAÇÃO"], linhas).astype(object),
+        "Valor": np.round(rng.gamma(2.0, 80.0, linhas), 2),
+    })
+
+    n_sujo = int(linhas * sujeira)
+    if n_sujo:
+        for col, sujar in [
+            ("Estado", lambda v: f" {str(v).lower()} "),
+            ("Tipo Nota", lambda v: f"{str(v).lower()} "),
+            # vazio continua vazio (pandas 3: o None vira NaN no str — str(NaN) daria "Nan")
+            ("Resultado", lambda v: str(v).title() if pd.notna(v) else None),
+        ]:
+            idx = rng.choice(linhas, n_sujo, replace=False)
+            df.loc[idx, col] = [sujar(v) for v in df.loc[idx, col]]
+
+        idx = rng.choice(linhas, n_sujo, replace=False)
+        formatos = rng.choice(["%d/%m/%Y", "%d/%m/%Y %H:%M", "invalida"], n_sujo, p=[0.6, 0.3, 0.1])
+        df.loc[idx, "Data Criação"] = [
+            "00/00/0000" if fmt == "invalida" else v.strftime(fmt)
+            for v, fmt in zip(df.loc[idx, "Data Criação"], formatos)
+        ]
+    return df
+
+def exportar_bytes(df: pd.DataFrame, formato: str) -> bytes:
+    """Serializa como o Drive entregaria: XLSX ou CSV (; e cp1252, padrão Excel BR)."""
+    buf = BytesIO()
+    if formato == "xlsx":
+        df.to_excel(buf, index=False)
+    else:
+        df.to_csv(buf, index=False, sep=";", encoding="cp1252", date_format="%d/%m/%Y %H:%M:%S")
+    return buf.getvalue()
+
+# ======================================================
+# MEDIÇÃO
+# ======================================================
+def _medir(func, preparo=None, repeticoes=1, memoria=False):
+    """
+    Roda func(*preparo()) `repeticoes` vezes (preparo fora do cronômetro).
+    Retorna (último resultado, {"segundos": melhor, "media": média, "pico_mb": ...}).
+    """
+    tempos = []
+    res = None
+    for _ in range(repeticoes):
+        args = preparo() if preparo else ()
+        t0 = time.perf_counter()
+        res = func(*args)
+        tempos.append(time.perf_counter() - t0)
+
+    medida = {"segundos": min(tempos), "media": sum(tempos) / len(tempos), "pico_mb": None}
+    if memoria:
+        args = preparo() if preparo else ()
+        tracemalloc.start()
+        func(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        medida["pico_mb"] = pico / 2**20
+    return res, medida
+
+def medir_pipeline(raw: bytes, repeticoes: int = 3, memoria: bool = False):
+    """Cronometra cada etapa do dashboard para um arquivo (bytes). Retorna [(etapa, medida)]."""
+    etapas = []
+
+    def registrar(etapa, func, preparo=None, rep=repeticoes):
+        res, medida = _medir(func, preparo, rep, memoria)
+        etapas.append((etapa, medida))
+        return res
+
+    # carga (parse) e preparação — etapas pesadas: 1 repetição
+    bruto = registrar("parse", base_iw58._ler_arquivo, lambda: (BytesIO(raw),), rep=1)
+    df, colunas = registrar("preparar", base_iw58.preparar_base, lambda: (bruto.copy(),), rep=1)
+    df, relatorio = registrar("compactar", base_iw58.compactar_base, lambda: (df, colunas), rep=1)
+    etapas[-1][1].update({f"base_mb_{lado}": n / 2**20 for lado, n in relatorio.items()})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho_dados = os.path.join(tmp, "base.arrow")
+        caminho_meta = os.path.join(tmp, "base.json")
+        registrar("snapshot_gravar", base_iw58._gravar_snapshot,
+                  lambda: (df, {"colunas": colunas}, caminho_dados, caminho_meta), rep=1)
+        registrar("snapshot_ler", base_iw58._ler_snapshot, lambda: (caminho_dados,))
+
+    cubo = registrar("cubo", cubo_iw58.montar_cubo, lambda: (df, colunas))
+
+    # filtros (mesmo caminho do app.py: ano → calendário → UF → AM/AS)
+    ano = int(cubo["DIA"].dropna().dt.year.max())
+    uf = str(cubo["UF"].cat.categories[0])
+
+    def filtrar():
+        cubo_ano = base_iw58.fatiar_por_data(cubo, "DIA", date(ano, 1, 1), date(ano, 12, 31))
+        cubo_periodo = base_iw58.fatiar_por_data(cubo_ano, "DIA", date(ano, 3, 1), date(ano, 9, 30))
+        cubo_filtro = cubo_periodo[cubo_periodo["UF"] == uf]
+        return (cubo_periodo, cubo_filtro,
+                cubo_filtro[cubo_filtro["AMAS"] == "AM"], cubo_filtro[cubo_filtro["AMAS"] == "AS"])
+
+    cubo_periodo, cubo_filtro, cubo_am, cubo_as = registrar("filtro_periodo", filtrar)
+    base_imp_am = cubo_am[cubo_am["CLASSE"] == "IMPROCEDENTE"]
+
+    registrar("donut_resultado", donut_resultado, lambda: (cubo_am,))
+    registrar("barh_contagem", barh_contagem, lambda: (base_imp_am, "MOTIVO", "MOTIVOS", uf))
+    _, tabela = registrar("acumulado_mensal", acumulado_mensal_fig_e_tabela, lambda: (cubo_filtro,))
+    registrar("resumo_localidade", resumo_por_localidade_html, lambda: (cubo_periodo, "UF", uf))
+    registrar("gerar_pdf", gerar_pdf, lambda: (
+        tabela, str(ano), uf, cubo_iw58.total(cubo_filtro), cubo_iw58.total(cubo_am), cubo_iw58.total(cubo_as),
+    ))
+    return etapas
+
+# ======================================================
+# RELATÓRIO
+# ======================================================
+def _ambiente() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+    }
+
+def _comparar(resultados, caminho_anterior):
+    with open(caminho_anterior, "r", encoding="utf-8") as f:
+        anterior = json.load(f)
+    base = {(r["linhas"], r["formato"], r["etapa"]): r["segundos"] for r in anterior["resultados"]}
+    print(f"\nComparação com {caminho_anterior} (commit {anterior['ambiente'].get('commit')}):")
+    for r in resultados:
+        antes = base.get((r["linhas"], r["formato"], r["etapa"]))
+        if antes:
+            print(f"  {r['linhas']:>9,} {r['formato']:<4} {r['etapa']:<18} "
+                  f"{antes:9.4f}s → {r['segundos']:9.4f}s  ({r['segundos'] / antes:5.2f}x)")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark do pipeline do dashboard IW58")
+    ap.add_argument("--linhas", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    ap.add_argument("--formatos", nargs="+", choices=["xlsx", "csv"], default=["xlsx", "csv"])
+    ap.add_argument("--repeticoes", type=int, default=3, help="repetições das etapas leves (vale a melhor)")
+    ap.add_argument("--sujeira", type=float, default=0.02)
+    ap.add_argument("--memoria", action="store_true", help="mede pico de memória (tracemalloc) por etapa")
+    # padrão na pasta do snapshot (.cache_iw58/, fora do git), não na raiz do repositório
+    ap.add_argument("--saida", default=os.path.join(base_iw58.DIR_SNAPSHOT, "bench_iw58.json"))
+    ap.add_argument("--comparar", help="relatório JSON anterior para comparar")
+    args = ap.parse_args(argv)
+
+    resultados = []
+    for linhas in args.linhas:
+        t0 = time.perf_counter()
+        df_sint = gerar_base_sintetica(linhas, sujeira=args.sujeira)
+        print(f"# {linhas:,} linhas geradas em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        for formato in args.formatos:
+            if formato == "xlsx" and linhas > LIMITE_LINHAS_XLSX:
+                print(f"# {linhas:,} linhas: XLSX ignorado (limite do Excel)", file=sys.stderr)
+                continue
+            raw = exportar_bytes(df_sint, formato)
+            for etapa, medida in medir_pipeline(raw, args.repeticoes, args.memoria):
+                r = {"linhas": linhas, "formato": formato, "bytes": len(raw), "etapa": etapa, **medida}
+                resultados.append(r)
+                pico = f"{medida['pico_mb']:9.1f} MB" if medida["pico_mb"] is not None else ""
+                if "base_mb_antes" in medida:
+                    pico += f" base {medida['base_mb_antes']:.1f} → {medida['base_mb_depois']:.1f} MB"
+                print(f"{linhas:>9,} {formato:<4} {etapa:<18} {medida['segundos']:9.4f}s {pico}")
+        del df_sint
+
+    relatorio = {
+        "gerado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ambiente": _ambiente(),
+        # ru_maxrss: KB no Linux
+        "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "resultados": resultados,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"\nRelatório: {args.saida} (pico RSS {relatorio['pico_rss_mb']:.0f} MB)")
+
+    if args.comparar:
+        _comparar(resultados, args.comparar)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Cubo de agregação da base IW58 (contagens pré-agregadas).
+
+- Montado uma vez por versão da base (no worker de atualização, fora do rerun);
+  quando a base só cresceu, atualizado pelo delta (atualizar_cubo)
+- QTD de notas por DIA × UF × AMAS × CLASSE × REGIONAL × MOTIVO
+  (+ MES: mês do DIA já em código 1..12, 0 = sem data)
+- Todos os cards do dashboard respondem a partir de fatias do cubo: trocar
+  ano/semana/período/UF custa milissegundos, independente do nº de notas
+- MotorCubo / ConsultaCubo: motor padrão (pandas) do AtualizadorBase; o motor SQL
+  (sql_iw58) responde às mesmas consultas direto do banco
+- Cubo publicado em memória compartilhada (/dev/shm, arrays .npy): processos e sessões
+  usam views somente leitura do mesmo cubo — colunas numéricas e os códigos dos
+  categóricos (só as categorias, poucas, ficam em cada processo)
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import base_iw58
+
+# ======================================================
+# CONFIG
+# ======================================================
+DIMENSOES = ["DIA", "UF", "AMAS", "CLASSE", "REGIONAL", "MOTIVO"]
+# ⚠️ Pasta em memória compartilhada (tmpfs): cada versão do cubo é publicada uma vez e
+# todos os processos do servidor usam views dela. Vazio = cubo só na memória do processo
+DIR_COMPARTILHADO = os.environ.get("IW58_SHM_DIR", "/dev/shm/iw58" if os.path.isdir("/dev/shm") else "")
+
+# ======================================================
+# MONTAGEM
+# ======================================================
+def _dimensao(df, col):
+    # coluna ausente na base vira dimensão vazia (os cards tratam como "sem dados")
+    if col is None:
+        return pd.Categorical([None] * len(df))
+    return df[col].astype("category")
+
+def montar_cubo(df: pd.DataFrame, colunas: dict) -> pd.DataFrame:
+    """
+    Agrega a base preparada (base_iw58.preparar_base) no cubo.
+    - DIA: data sem hora (NaT mantido — linhas sem data continuam no total)
+    - Valores vazios também viram uma célula (dropna=False), como na base original
+    Retorna DataFrame [DIMENSOES..., QTD, MES] ordenado por DIA (NaT no fim), pronto
+    para base_iw58.fatiar_por_data.
+    """
+    chaves = pd.DataFrame({
+        "DIA": df[colunas["data"]].dt.normalize(),
+        "UF": df["_UF_"],
+        "AMAS": df["_AMAS_"],
+        "CLASSE": df["_CLASSE_"],
+        "REGIONAL": _dimensao(df, colunas.get("regional")),
+        "MOTIVO": _dimensao(df, colunas.get("motivo")),
+    })
+    cubo = (
+        chaves
+        .groupby(DIMENSOES, observed=True, dropna=False, sort=False)
+        .size()
+        .reset_index(name="QTD")
+    )
+    return ordenar_cubo(cubo)
+
+def ordenar_cubo(cubo: pd.DataFrame) -> pd.DataFrame:
+    """Ordena por DIA (NaT no fim) e acrescenta MES — formato esperado pelas consultas."""
+    cubo = cubo.sort_values("DIA", kind="stable", na_position="last").reset_index(drop=True)
+    cubo["MES"] = cubo["DIA"].dt.month.fillna(0).astype(np.int8)
+    return cubo
+
+def atualizar_cubo(cubo: pd.DataFrame, colunas: dict, mais: pd.DataFrame, menos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cubo da versão nova a partir do cubo anterior + delta da base (base_iw58.carregar_base).
+    - mais: linhas que entraram (somam); menos: linhas que saíram (subtraem)
+    - Células que zeraram saem do cubo; custo proporcional ao delta + nº de células
+    """
+    partes = [cubo[DIMENSOES + ["QTD"]]]
+    for linhas, sinal in ((mais, 1), (menos, -1)):
+        if len(linhas):
+            parte = montar_cubo(linhas, colunas)[DIMENSOES + ["QTD"]]
+            parte["QTD"] *= sinal
+            partes.append(parte)
+    if len(partes) == 1:
+        return cubo
+
+    # categorias do cubo anterior primeiro (valores novos vão para o fim)
+    dims = {
+        col: union_categoricals([p[col] for p in partes])
+        for col in DIMENSOES if col != "DIA"
+    }
+    juntos = pd.concat(partes, ignore_index=True)
+    for col, valores in dims.items():
+        juntos[col] = valores
+    novo = (
+        juntos
+        .groupby(DIMENSOES, observed=True, dropna=False, sort=False)["QTD"]
+        .sum()
+        .reset_index()
+    )
+    return ordenar_cubo(novo[novo["QTD"] != 0])
+
+# ======================================================
+# CONSULTAS (fatias)
+# ======================================================
+def total(cubo: pd.DataFrame) -> int:
+    return int(cubo["QTD"].sum())
+
+def somar_por(cubo: pd.DataFrame, col: str) -> pd.Series:
+    """QTD por valor de `col` (vazios fora), só valores presentes na fatia."""
+    return cubo.groupby(col, observed=True)["QTD"].sum()
+
+# ======================================================
+# MEMÓRIA COMPARTILHADA (/dev/shm)
+# ======================================================
+def publicar_cubo(cubo: pd.DataFrame, pasta: str):
+    """
+    Grava o cubo como um .npy por coluna (categóricos: códigos + categorias no meta.json).
+    Atômico: monta numa pasta temporária e renomeia; se outro processo publicou a
+    mesma versão antes, mantém a dele.
+    """
+    if os.path.isdir(pasta):
+        return
+    tmp = f"{pasta}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    categorias = {}
+    for col in cubo.columns:
+        s = cubo[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            categorias[col] = s.cat.categories.tolist()
+            s = s.cat.codes
+        np.save(os.path.join(tmp, f"{col}.npy"), s.to_numpy())
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"colunas": cubo.columns.tolist(), "categorias": categorias}, f, ensure_ascii=False, default=str)
+    try:
+        os.rename(tmp, pasta)
+    except OSError:  # outro processo publicou antes
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def abrir_cubo(pasta: str) -> pd.DataFrame:
+    """
+    Cubo publicado como DataFrame de views (memory-map, somente leitura).
+    - Categóricos: os códigos são o próprio memmap (from_codes sem validar — quem
+      gravou foi publicar_cubo; validar leria a coluna inteira em cada processo)
+    - ⚠️ s.cat.codes devolve uma cópia: no cubo inteiro, use s.array.codes (view)
+    """
+    with open(os.path.join(pasta, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    dados = {}
+    for col in meta["colunas"]:
+        valores = np.load(os.path.join(pasta, f"{col}.npy"), mmap_mode="r")
+        if col in meta["categorias"]:
+            valores = pd.Categorical.from_codes(
+                valores, dtype=pd.CategoricalDtype(meta["categorias"][col]), validate=False
+            )
+        dados[col] = valores
+    return pd.DataFrame(dados, copy=False)
+
+def raiz_compartilhada(fontes) -> str:
+    """
+    Pasta do cubo de um manifesto de fontes em DIR_COMPARTILHADO (vazio = sem memória
+    compartilhada): cada base tem o seu atual.json, dois apps com fontes diferentes
+    no mesmo servidor não restauram o cubo um do outro.
+    """
+    return os.path.join(DIR_COMPARTILHADO, f"base_{base_iw58.chave_fontes(fontes)}") if DIR_COMPARTILHADO else ""
+
+def _gravar_atual(raiz: str, pasta: str, info: dict):
+    """
+    Aponta raiz/atual.json para a versão publicada (cold start dos outros processos)
+    e apaga versões antigas — quem ainda as mapeia continua lendo até soltar.
+    """
+    anterior = _ler_atual(raiz).get("pasta")
+    tmp = os.path.join(raiz, f"atual.json.tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"pasta": pasta, "info": info}, f, ensure_ascii=False, default=str)
+    os.replace(tmp, os.path.join(raiz, "atual.json"))
+    for nome in os.listdir(raiz):
+        caminho = os.path.join(raiz, nome)
+        if nome.startswith("cubo_") and caminho not in (pasta, anterior) and ".tmp" not in nome:
+            shutil.rmtree(caminho, ignore_errors=True)
+
+def _ler_atual(raiz: str) -> dict:
+    try:
+        with open(os.path.join(raiz, "atual.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# ======================================================
+# MOTOR (pandas) — interface usada pelo app
+# ======================================================
+class ConsultaCubo:
+    """
+    Consultas do dashboard sobre o cubo em memória de uma versão da base.
+    - dias(): dias com nota (ordenados) — anos, semanas e limites do calendário
+    - fatia(ini, fim): cubo do período (datas inclusivas; sem limites = base inteira)
+    - ufs(): UFs presentes (abas do app), dos códigos do categórico
+    """
+
+    def __init__(self, cubo: pd.DataFrame):
+        self.cubo = cubo
+        self._dias = None
+        self._ufs = None
+
+    def dias(self) -> pd.DatetimeIndex:
+        if self._dias is None:
+            dia = self.cubo["DIA"]
+            self._dias = pd.DatetimeIndex(dia.iloc[:int(dia.notna().sum())].unique())
+        return self._dias
+
+    def fatia(self, ini=None, fim=None) -> pd.DataFrame:
+        if ini is None and fim is None:
+            return self.cubo
+        return base_iw58.fatiar_por_data(self.cubo, "DIA", ini, fim)
+
+    def ufs(self) -> list:
+        if self._ufs is None:
+            uf = self.cubo["UF"]
+            codigos = uf.array.codes  # view (cat.codes copiaria a coluna)
+            presentes = np.bincount(codigos[codigos >= 0], minlength=len(uf.cat.categories)) > 0
+            self._ufs = sorted(uf.cat.categories[presentes].tolist())
+        return self._ufs
+
+class MotorCubo:
+    """
+    Motor padrão do AtualizadorBase: cubo em pandas.
+    - raiz (raiz_compartilhada(fontes)): o cubo de cada versão é publicado uma vez e aberto
+      por memory-map — processos na mesma versão não remontam nem duplicam o cubo
+    - restaurar(): processo novo já começa com o último cubo publicado
+    - A base preparada não fica em memória (o app só consulta o cubo)
+    """
+    guardar_base = False
+
+    def __init__(self, raiz: str):
+        self.raiz = raiz
+
+    def _pasta(self, info: dict) -> str:
+        return os.path.join(self.raiz, f"cubo_{info['versao'][:16]}") if self.raiz else ""
+
+    def _publicar(self, cubo: pd.DataFrame, info: dict) -> ConsultaCubo:
+        pasta = self._pasta(info)
+        if not pasta:
+            return ConsultaCubo(cubo)
+        try:
+            os.makedirs(self.raiz, exist_ok=True)
+            publicar_cubo(cubo, pasta)
+            _gravar_atual(self.raiz, pasta, info)
+            return ConsultaCubo(abrir_cubo(pasta))
+        except OSError:  # sem espaço/permissão no tmpfs: fica só na memória do processo
+            return ConsultaCubo(cubo)
+
+    def montar(self, df: pd.DataFrame, info: dict) -> ConsultaCubo:
+        pasta = self._pasta(info)
+        if pasta and os.path.isdir(pasta):  # outro processo já publicou esta versão
+            return ConsultaCubo(abrir_cubo(pasta))
+        return self._publicar(montar_cubo(df, info["colunas"]), info)
+
+    def atualizar(self, consulta: ConsultaCubo, info: dict, mais, menos) -> ConsultaCubo:
+        return self._publicar(atualizar_cubo(consulta.cubo, info["colunas"], mais, menos), info)
+
+    def restaurar(self):
+        if not self.raiz:
+            return None
+        atual = _ler_atual(self.raiz)
+        if not atual or not os.path.isdir(atual["pasta"]):
+            return None
+        info = atual["info"]
+        info["status"] = "compartilhado"
+        return info, ConsultaCubo(abrir_cubo(atual["pasta"]))
@@ -0,0 +1,506 @@
+"""
+Gráficos e fragmentos HTML do dashboard IW58 (sem Streamlit).
+
+- Todas as funções recebem fatias do cubo (cubo_iw58) e devolvem figuras Plotly / HTML
+- Usado pelo app.py e por execuções headless (benchmark, relatórios)
+- montar_cards: tudo que os cards exibem para um período + UF (app e relatórios em lote);
+  pedir_cards agenda os mesmos cards e devolve Futures (a tela desenha cada um ao ficar pronto)
+- Cada tipo de gráfico tem um modelo (spec do Plotly: template, layout, traces)
+  montado uma vez por processo; a cada filtro só os dados agregados são trocados
+"""
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import base_iw58
+import cubo_iw58
+import metricas_iw58
+
+# ======================================================
+# CONSTANTES / CORES
+# ======================================================
+MESES_PT = {
+    1: "JANEIRO", 2: "FEVEREIRO", 3: "MARÇO", 4: "ABRIL",
+    5: "MAIO", 6: "JUNHO", 7: "JULHO", 8: "AGOSTO",
+    9: "SETEMBRO", 10: "OUTUBRO", 11: "NOVEMBRO", 12: "DEZEMBRO"
+}
+MESES_ORDEM = [MESES_PT[i] for i in range(1, 13)]
+
+COR_PROC = "#2e7d32"
+COR_IMP  = "#c62828"
+COR_OUT  = "#546e7a"
+COR_TOT  = "#fcba03"
+
+# ======================================================
+# TÍTULO
+# ======================================================
+def titulo_plotly(fig, titulo: str, uf: str):
+    uf_txt = uf if uf != "TOTAL" else "TODOS"
+    # title=dict(...) (e não title_x/title_font): funciona também nas figuras de _figura
+    fig.update_layout(title=dict(
+        text=f"{titulo} • {uf_txt}",
+        x=0.0,
+        font=dict(size=14, color="#FFFFFF", family="Arial Black"),
+    ))
+    return fig
+
+# ======================================================
+# MODELOS DE FIGURA (esqueleto montado uma vez por tipo de gráfico)
+# ======================================================
+_MODELOS = {}
+_LOCK_MODELOS = threading.Lock()
+
+def _modelo(tipo: str) -> dict:
+    """
+    Spec (fig.to_dict()) do modelo do gráfico `tipo`, montado na primeira chamada.
+    - px/go, template e validação do Plotly só rodam aqui: custam mais do que os
+      dados de um card (já agregados pelo cubo)
+    """
+    with _LOCK_MODELOS:
+        if tipo not in _MODELOS:
+            _MODELOS[tipo] = _MONTAR_MODELO[tipo]().to_dict()
+        return _MODELOS[tipo]
+
+def _figura(tipo: str, traces: list, layout: dict = None) -> go.Figure:
+    """
+    Figura nova a partir do modelo: copia o spec e troca só os dados.
+    - traces: o que muda em cada trace (mesma ordem do modelo)
+    - layout: chaves de layout trocadas inteiras (ex.: annotations)
+    - Sem revalidar o spec (o modelo já saiu validado do Plotly); o st.plotly_chart
+      valida de novo ao serializar
+    """
+    spec = copy.deepcopy(_modelo(tipo))
+    for trace, dados in zip(spec["data"], traces):
+        trace.update(dados)
+    spec["layout"].update(layout or {})
+    return go.Figure(spec, _validate=False)
+
+# ======================================================
+# GRÁFICOS AUXILIARES
+# ======================================================
+def _modelo_donut():
+    dados = pd.DataFrame({"Resultado": ["Procedente", "Improcedente"], "QTD": [0, 0]})
+    fig = px.pie(
+        dados, names="Resultado", values="QTD", hole=0.62,
+        template="plotly_white",
+        color="Resultado",
+        color_discrete_map={"Procedente": COR_PROC, "Improcedente": COR_IMP}
+    )
+    fig.update_layout(height=260, margin=dict(l=10, r=10, t=60, b=10), legend_title_text="")
+    fig.update_traces(textinfo="percent+value")
+    return fig
+
+def donut_resultado(df_base):
+    # CLASSE já resolve a precedência (IMPROCEDENTE não conta como PROCEDENTE)
+    vc = cubo_iw58.somar_por(df_base, "CLASSE")
+    proc = int(vc.get("PROCEDENTE", 0))
+    imp  = int(vc.get("IMPROCEDENTE", 0))
+    return _figura("donut", [{"values": np.array([proc, imp], dtype=np.int64)}])
+
+def _anotacao_total_barh(texto: str) -> dict:
+    # ✅ TOTAL DO GRÁFICO (único)
+    return dict(
+        xref="paper", yref="paper",
+        x=0.98, y=1.12,
+        text=texto,
+        showarrow=False,
+        font=dict(size=13, color=COR_TOT, family="Arial Black"),
+        align="right"
+    )
+
+def _modelo_barh():
+    fig = px.bar(
+        pd.DataFrame({"DIM": [""], "QTD": [0]}),
+        x="QTD",
+        y="DIM",
+        orientation="h",
+        text="QTD",
+        template="plotly_white"
+    )
+
+    fig.update_layout(
+        height=300,
+        margin=dict(l=10, r=10, t=70, b=10),
+        showlegend=False,
+    )
+
+    # 🔥 Oculta eixo X (escala) — mantém apenas os valores nas barras
+    fig.update_xaxes(visible=False, showticklabels=False, ticks="", showgrid=False, zeroline=False)
+
+    fig.update_traces(textposition="outside", cliponaxis=False)
+    fig.update_yaxes(title_text="")
+    fig.add_annotation(_anotacao_total_barh(""))
+    return fig
+
+def barh_contagem(df_base, col_dim, titulo, uf):
+    if col_dim is None or df_base.empty:
+        return None
+
+    dados = (
+        cubo_iw58.somar_por(df_base, col_dim)
+        .reset_index(name="QTD")
+        .sort_values("QTD")
+    )
+
+    if dados.empty:
+        return None
+
+    qtd = dados["QTD"].to_numpy()
+    total = int(qtd.sum())
+    total_fmt = f"{total:,}".replace(",", ".")
+
+    fig = _figura(
+        "barh",
+        [{
+            "x": qtd,
+            "y": dados[col_dim].to_numpy(dtype=object),
+            "text": qtd.astype(np.float64),
+            "hovertemplate": f"QTD=%{{text}}<br>{col_dim}=%{{y}}<extra></extra>",
+        }],
+        {"annotations": [_anotacao_total_barh(f"TOTAL: {total_fmt}")]},
+    )
+    return titulo_plotly(fig, titulo, uf)
+
+# ======================================================
+# ACUMULADO MENSAL (gráfico + tabelinha + boquinhas + total direito)
+# ======================================================
+CORES_CLASSE = {"PROCEDENTE": COR_PROC, "IMPROCEDENTE": COR_IMP, "OUTROS": COR_OUT}
+
+# =====================================================
+# CONTROLES (posição da tabelinha e espaçamentos)
+# =====================================================
+# ✅ (AJUSTE AQUI)
+# - Y_BASE: sobe/desce a tabelinha e as boquinhas
+# - DY: espaçamento entre as 3 linhas (você pediu 0.055)
+Y_BASE = -0.23
+DY = 0.055
+
+# ✅ (AJUSTE AQUI)
+# - X_LEG: mais negativo = mais para esquerda
+# - Y_LEG: sobe/desce (use junto com Y_BASE para alinhar perfeito)
+X_LEG = -0.08
+Y_LEG = Y_BASE  # mesma altura da linha verde
+
+def _fmt_int(v: int) -> str:
+    return f"{int(v):,}".replace(",", ".")
+
+def _legenda_mensal() -> list:
+    # =====================================================
+    # LEGENDA “boquinhas” (alinhada com a tabelinha)
+    # =====================================================
+    return [
+        dict(
+            xref="paper", yref="paper",
+            x=X_LEG, y=Y_LEG - (linha * DY),
+            text=(f"<span style='color:{cor};font-size:16px'>■</span> "
+                  f"<span style='color:white;font-size:14px'><b>{rotulo}</b></span>"),
+            showarrow=False, align="left",
+        )
+        for linha, (cor, rotulo) in enumerate([(COR_PROC, "PROCEDENTE"), (COR_IMP, "IMPROCEDENTE"), (COR_TOT, "TOTAL")])
+    ]
+
+def _modelo_mensal():
+    fig = go.Figure(
+        data=[
+            go.Bar(
+                x=MESES_ORDEM,
+                y=[0] * 12,
+                name=classe,
+                marker_color=CORES_CLASSE[classe],
+                hovertemplate=f"{classe}<br>MÊS=%{{x}}<br>QTD=%{{y}}<extra></extra>",
+            )
+            for classe in base_iw58.CLASSES
+        ],
+        layout=dict(template="plotly_dark", barmode="stack"),
+    )
+
+    fig.update_traces(textposition="outside", cliponaxis=False)
+    fig.update_xaxes(categoryorder="array", categoryarray=MESES_ORDEM)
+
+    # 🔥 Remove eixo Y (lado esquerdo)
+    fig.update_yaxes(visible=False, showgrid=False, zeroline=False, showticklabels=False, title_text="")
+
+    # =====================================================
+    # LINHAS-GUIA (estilo tabela) — 3 linhas horizontais
+    # =====================================================
+    line_style = dict(color="rgba(255,255,255,0.25)", width=1)
+    shapes = [
+        dict(type="line", xref="paper", yref="paper",
+             x0=0, x1=1, y0=Y_BASE - (k * DY), y1=Y_BASE - (k * DY), line=line_style)
+        for k in range(3)
+    ]
+
+    # =========================
+    # Layout (b grande para caber a “tabelinha”)
+    # =========================
+    fig.update_layout(
+        height=520,
+        showlegend=False,  # vamos usar “boquinhas”
+        margin=dict(l=120, r=170, t=50, b=190),
+        xaxis_title="",
+        yaxis_title="",
+        shapes=shapes,
+        annotations=_legenda_mensal(),
+    )
+    return fig
+
+def acumulado_mensal_fig_e_tabela(df_base, col_mes="MES"):
+    """
+    Gráfico empilhado mês × classe + tabelinha, a partir de uma fatia do cubo.
+    - col_mes: código do mês já pronto no cubo (1..12; 0 = sem data, fica de fora)
+    - Contagem 12×3 num único np.bincount (sem merge/pivot/iterrows)
+    - Layout, linhas-guia e boquinhas vêm do modelo; aqui só barras e números
+    """
+    mes = df_base[col_mes].to_numpy()
+    validas = mes > 0
+    if not validas.any():
+        return None, None
+
+    # =========================
+    # Contagem por mês/classe (12 × 3, sempre todos os meses e classes)
+    # =========================
+    classes = base_iw58.CLASSES  # PROCEDENTE, IMPROCEDENTE, OUTROS (ordem dos códigos)
+    cls = df_base["CLASSE"].cat.codes.to_numpy()[validas].astype(np.int64)
+    qtd = df_base["QTD"].to_numpy()[validas]
+    cont = np.bincount(
+        (mes[validas].astype(np.int64) - 1) * len(classes) + cls,
+        weights=qtd,
+        minlength=12 * len(classes),
+    ).reshape(12, len(classes)).astype(np.int64)
+
+    proc, imp = cont[:, 0], cont[:, 1]
+    total_mes = cont.sum(axis=1)
+
+    # =========================
+    # Percentuais (labels nas barras)
+    # =========================
+    denom = np.where(total_mes == 0, 1, total_mes)  # evita divisão por zero em meses zerados
+    pct = np.round(cont * 100 / denom[:, None]).astype(int)
+
+    # =========================
+    # Tabela (valores por mês)
+    # =========================
+    tabela_final = pd.DataFrame({
+        "MÊS": MESES_ORDEM,
+        "IMPROCEDENTE": imp,
+        "PROCEDENTE": proc,
+        "TOTAL": total_mes,
+    })
+
+    # =====================================================
+    # “TABELINHA” abaixo de cada mês (só números, cores)
+    # =====================================================
+    annotations = []
+    for linha, (valores, cor) in enumerate([(proc, COR_PROC), (imp, COR_IMP), (total_mes, COR_TOT)]):
+        for mes_nome, v in zip(MESES_ORDEM, valores):
+            annotations.append(dict(
+                x=mes_nome, xref="x",
+                yref="paper", y=Y_BASE - (linha * DY),
+                text=f"<span style='font-family:monospace;font-size:14px;color:{cor};'><b>{_fmt_int(v)}</b></span>",
+                showarrow=False, align="center",
+            ))
+    annotations += _legenda_mensal()
+
+    # =====================================================
+    # TOTAL GERAL (quadrado à direita) - 3 linhas (TOTAL / PROCEDENTE / IMPROCEDENTE)
+    # =====================================================
+    total_geral_fmt = _fmt_int(total_mes.sum())
+    total_proc_fmt  = _fmt_int(proc.sum())
+    total_imp_fmt   = _fmt_int(imp.sum())
+
+    annotations.append(dict(
+        xref="paper", yref="paper",
+        x=1.10, y=0.55,
+        text=(
+            "<span style='font-size:12px;color:#fcba03'><b>TOTAL</b></span><br>"
+            f"<span style='font-size:18px;color:#fcba03'><b>{total_geral_fmt}</b></span><br><br>"
+            f"<span style='font-size:12px;color:{COR_PROC}'><b>PROCEDENTE</b></span><br>"
+            f"<span style='font-size:16px;color:{COR_PROC}'><b>{total_proc_fmt}</b></span><br><br>"
+            f"<span style='font-size:12px;color:{COR_IMP}'><b>IMPROCEDENTE</b></span><br>"
+            f"<span style='font-size:16px;color:{COR_IMP}'><b>{total_imp_fmt}</b></span>"
+        ),
+        showarrow=False,
+        align="left",
+        bgcolor="rgba(0,0,0,0.45)",
+        bordercolor="#fcba03",
+        borderwidth=1,
+        borderpad=10,
+    ))
+
+    # =========================
+    # Gráfico principal (barras) — só os dados mudam
+    # =========================
+    fig = _figura(
+        "mensal",
+        [
+            {
+                "y": cont[:, k],
+                "text": [f"{p}%" for p in pct[:, k]] if classe != "OUTROS" else [""] * 12,
+            }
+            for k, classe in enumerate(classes)
+        ],
+        {"annotations": annotations},
+    )
+    return fig, tabela_final
+
+_MONTAR_MODELO = {
+    "donut": _modelo_donut,
+    "barh": _modelo_barh,
+    "mensal": _modelo_mensal,
+}
+
+# ======================================================
+# HTML (Notas por localidade)
+# ======================================================
+MAX_CACHE_LOCALIDADE = 64  # contagens/fragmentos guardados por processo (LRU)
+_CACHE_LOCALIDADE = OrderedDict()
+_LOCK_LOCALIDADE = threading.Lock()
+
+def _memo_localidade(chave, calcular):
+    # LRU do processo: sessões no mesmo período/UF reaproveitam o mesmo fragmento
+    if chave is None:
+        return calcular()
+    with _LOCK_LOCALIDADE:
+        if chave in _CACHE_LOCALIDADE:
+            _CACHE_LOCALIDADE.move_to_end(chave)
+            return _CACHE_LOCALIDADE[chave]
+    valor = calcular()
+    with _LOCK_LOCALIDADE:
+        _CACHE_LOCALIDADE[chave] = valor
+        while len(_CACHE_LOCALIDADE) > MAX_CACHE_LOCALIDADE:
+            _CACHE_LOCALIDADE.popitem(last=False)
+    return valor
+
+def contar_por_localidade(df_base, col_local):
+    """
+    (locais, qtd) da fatia, do maior para o menor (empates na ordem das categorias).
+    - Categórico (UF do cubo): np.bincount direto nos códigos, sem groupby nem strings
+    """
+    s = df_base[col_local]
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        vc = cubo_iw58.somar_por(df_base, col_local)
+        locais, qtd = vc.index.to_numpy(dtype=object), vc.to_numpy(dtype=np.int64)
+    else:
+        codigos = s.cat.codes.to_numpy()
+        validos = codigos >= 0
+        n = len(s.cat.categories)
+        qtd = np.bincount(codigos[validos], weights=df_base["QTD"].to_numpy()[validos], minlength=n).astype(np.int64)
+        presentes = np.bincount(codigos[validos], minlength=n) > 0
+        locais, qtd = s.cat.categories.to_numpy(dtype=object)[presentes], qtd[presentes]
+    ordem = np.argsort(-qtd, kind="stable")
+    return locais[ordem], qtd[ordem]
+
+def resumo_por_localidade_html(df_base, col_local, selecionado, top_n=12, chave=None):
+    """
+    Lista "Notas por localidade" (HTML) da fatia.
+    - col_local já normalizada (categórico em maiúsculas, ex.: UF do cubo)
+    - chave: identifica a fatia (ex.: versão da base + período). Com chave, a contagem
+      é memoizada por período e o HTML por (período, selecionado, top_n) — trocar de
+      UF só refaz o destaque da linha
+    """
+    if col_local is None or df_base.empty:
+        return ""
+
+    def montar():
+        locais, qtd = _memo_localidade(
+            None if chave is None else ("contagem", chave, col_local),
+            lambda: contar_por_localidade(df_base, col_local),
+        )
+        locais, qtd = locais.tolist(), qtd.tolist()
+        if len(locais) > top_n:
+            locais = locais[:top_n] + ["OUTROS"]
+            qtd = qtd[:top_n] + [sum(qtd[top_n:])]
+        sel = str(selecionado).upper()
+        return "\n".join(
+            f'<div class="{"loc-row active" if sel != "TOTAL" and loc == sel else "loc-row"}">'
+            f'<span>{loc}</span><span>{_fmt_int(n)}</span></div>'
+            for loc, n in zip(locais, qtd)
+        )
+
+    return _memo_localidade(
+        None if chave is None else ("html", chave, col_local, str(selecionado).upper(), top_n),
+        montar,
+    )
+
+# ======================================================
+# CARDS (agregados + figuras de um filtro)
+# ======================================================
+def _agora(func, *args, **kwargs) -> Future:
+    # mesmo contrato de executor.submit, rodando na hora (sem executor)
+    tarefa = Future()
+    try:
+        tarefa.set_result(func(*args, **kwargs))
+    except Exception as e:
+        tarefa.set_exception(e)
+    return tarefa
+
+def _mensal_com_titulo(cubo_filtro, uf_sel):
+    fig_mensal, tabela_mensal = acumulado_mensal_fig_e_tabela(cubo_filtro)
+    if fig_mensal is not None:
+        fig_mensal = titulo_plotly(fig_mensal, "ACUMULADO MENSAL DE NOTAS AM – AS", uf_sel)
+    return fig_mensal, tabela_mensal
+
+def pedir_cards(cubo_periodo, uf_sel, col_regional, col_motivo, executor=None, chave_periodo=None) -> dict:
+    """
+    Agenda tudo que os cards exibem para um período (fatia do cubo) + UF: {nome: Future}.
+    - col_regional/col_motivo: dimensões do cubo (None = coluna ausente na base)
+    - executor: cards independentes montados ao mesmo tempo (ex.: ThreadPoolExecutor);
+      sem executor, cada card é calculado na hora
+    - Ordem de envio = ordem na tela: os cards do topo pegam as threads primeiro e o
+      mensal (abaixo da dobra) por último — quem exibe espera só o card que desenha
+    - chave_periodo (versão + período): a lista por localidade é memoizada por ela no
+      processo — trocar de UF não reconta o período
+    - As figuras já saem com título aplicado e não são alteradas depois
+    - "mensal" devolve (figura, tabela); fig_am/fig_as devolvem None sem dados
+    - Cada card é medido como a etapa "card:<nome>" (metricas_iw58)
+    """
+    def submeter(nome, func, *args, **kwargs):
+        func = metricas_iw58.medir(f"card:{nome}", func)
+        return executor.submit(func, *args, **kwargs) if executor is not None else _agora(func, *args, **kwargs)
+
+    cubo_filtro = cubo_periodo if uf_sel == "TOTAL" else cubo_periodo[cubo_periodo["UF"] == uf_sel]
+    cubo_am = cubo_filtro[cubo_filtro["AMAS"] == "AM"]
+    cubo_as = cubo_filtro[cubo_filtro["AMAS"] == "AS"]
+    base_imp_am = cubo_am[cubo_am["CLASSE"] == "IMPROCEDENTE"]
+    base_imp_as = cubo_as[cubo_as["CLASSE"] == "IMPROCEDENTE"]
+
+    return {
+        "total": _agora(cubo_iw58.total, cubo_filtro),
+        "am": _agora(cubo_iw58.total, cubo_am),
+        "as": _agora(cubo_iw58.total, cubo_as),
+        "localidade_html": submeter(
+            "localidade_html", resumo_por_localidade_html, cubo_periodo, "UF", uf_sel, top_n=12, chave=chave_periodo),
+        "fig_am": submeter(
+            "fig_am", lambda: titulo_plotly(donut_resultado(cubo_am), "ACUMULADO ANUAL – AM", uf_sel))
+            if not cubo_am.empty else _agora(lambda: None),
+        "fig_as": submeter(
+            "fig_as", lambda: titulo_plotly(donut_resultado(cubo_as), "ACUMULADO ANUAL – AS", uf_sel))
+            if not cubo_as.empty else _agora(lambda: None),
+        "fig_regional_am": submeter(
+            "fig_regional_am", barh_contagem, base_imp_am, col_regional, "IMPROCEDÊNCIAS POR REGIONAL – NOTA AM", uf_sel),
+        "fig_motivo_am": submeter(
+            "fig_motivo_am", barh_contagem, base_imp_am, col_motivo, "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AM", uf_sel),
+        "fig_motivo_as": submeter(
+            "fig_motivo_as", barh_contagem, base_imp_as, col_motivo, "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AS", uf_sel),
+        "mensal": submeter("fig_mensal", _mensal_com_titulo, cubo_filtro, uf_sel),
+    }
+
+def resolver_cards(pendentes: dict) -> dict:
+    """Espera os cards de pedir_cards e devolve os valores (mensal → fig_mensal + tabela_mensal)."""
+    cards = {nome: tarefa.result() for nome, tarefa in pendentes.items()}
+    cards["fig_mensal"], cards["tabela_mensal"] = cards.pop("mensal")
+    return cards
+
+def montar_cards(cubo_periodo, uf_sel, col_regional, col_motivo, executor=None, chave_periodo=None) -> dict:
+    """
+    Tudo que os cards exibem para um período + UF, já calculado (pedir_cards + resolver_cards).
+    - Chaves: total, am, as, localidade_html, fig_am, fig_as, fig_regional_am,
+      fig_motivo_am, fig_motivo_as, fig_mensal, tabela_mensal
+    """
+    return resolver_cards(pedir_cards(cubo_periodo, uf_sel, col_regional, col_motivo, executor, chave_periodo))
@@ -0,0 +1,220 @@
+"""
+Relatórios PDF em lote do dashboard IW58 (headless, sem servidor Streamlit).
+
+Uso:
+    python lote_iw58.py URL_OU_MANIFESTO.json
+    python lote_iw58.py URL --modo semana --ultimos 4 --saida relatorios/
+    python lote_iw58.py URL --periodos 2025 2025-03 2025-S10 --ufs BA SE --processos 8
+
+- Mesma carga do app (base_iw58.carregar_base: snapshot local, 304, deltas) e mesmos
+  períodos (periodo_iw58: ano / mês / semana seg–sex ISO) e cards (graficos_iw58.montar_cards)
+- Matriz UF × período gerada num pool de processos; o cubo é montado uma vez e
+  publicado em memória compartilhada (cubo_iw58.publicar_cubo): cada processo abre
+  views do mesmo cubo, sem reprocessar nem copiar a base
+- Um PDF por UF × período (relatorio_iw58.gerar_pdf, com os gráficos via kaleido)
+  + manifesto JSON com arquivos, totais e tempos de cada relatório
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import base_iw58
+import cubo_iw58
+from periodo_iw58 import periodo, ultimos_periodos
+from graficos_iw58 import montar_cards
+from relatorio_iw58 import gerar_pdf, figuras_dos_cards
+
+# ======================================================
+# CONFIG
+# ======================================================
+PROCESSOS_PADRAO = min(8, os.cpu_count() or 1)
+MODOS = ["semana", "mes", "ano"]
+
+# ======================================================
+# WORKER (um por processo do pool)
+# ======================================================
+_WORKER = {}
+
+def _iniciar_worker(pasta_cubo: str, colunas: dict, versao: str, com_graficos: bool):
+    # abre o cubo publicado (memory-map) uma vez por processo
+    _WORKER.update(
+        consulta=cubo_iw58.ConsultaCubo(cubo_iw58.abrir_cubo(pasta_cubo)),
+        col_regional="REGIONAL" if colunas.get("regional") else None,
+        col_motivo="MOTIVO" if colunas.get("motivo") else None,
+        versao=versao,
+        com_graficos=com_graficos,
+    )
+
+def _gerar_relatorio(uf: str, per: dict, saida: str) -> dict:
+    """Um PDF (UF × período). Retorna a entrada do manifesto."""
+    t0 = time.perf_counter()
+    consulta = _WORKER["consulta"]
+    cubo_periodo = consulta.fatia(per["ini"], per["fim"])
+    chave_periodo = (_WORKER["versao"], per["nome"])
+    cards = montar_cards(cubo_periodo, uf, _WORKER["col_regional"], _WORKER["col_motivo"], chave_periodo=chave_periodo)
+    t_cards = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    pdf = gerar_pdf(
+        df_tabela=cards["tabela_mensal"],
+        ano_ref=f"{per['nome']} ({per['ini'].strftime('%d/%m/%Y')} a {per['fim'].strftime('%d/%m/%Y')})",
+        uf_sel=uf,
+        total=cards["total"],
+        am=cards["am"],
+        az=cards["as"],
+        figuras=figuras_dos_cards(cards) if _WORKER["com_graficos"] else None,
+    ).getvalue()
+    t_pdf = time.perf_counter() - t1
+
+    arquivo = os.path.join(saida, f"IW58_{per['nome']}_{uf}.pdf")
+    with open(arquivo, "wb") as f:
+        f.write(pdf)
+    return {
+        "uf": uf,
+        "periodo": per["nome"],
+        "ini": per["ini"].isoformat(),
+        "fim": per["fim"].isoformat(),
+        "arquivo": os.path.basename(arquivo),
+        "bytes": len(pdf),
+        "total": cards["total"],
+        "am": cards["am"],
+        "as": cards["as"],
+        "t_cards": t_cards,
+        "t_pdf": t_pdf,
+        "pid": os.getpid(),
+    }
+
+# ======================================================
+# LOTE
+# ======================================================
+def _ler_fontes(itens: list) -> list:
+    # cada item: link ou .json com o manifesto de fontes (mesmo formato de FONTES_BASE)
+    fontes = []
+    for item in itens:
+        if item.lower().endswith(".json") and os.path.exists(item):
+            with open(item, encoding="utf-8") as f:
+                conteudo = json.load(f)
+            fontes.extend(conteudo if isinstance(conteudo, list) else [conteudo])
+        else:
+            fontes.append(item)
+    return fontes
+
+def gerar_lote(fontes, periodos=None, modo="semana", ultimos=1, ufs=None, com_total=True,
+               processos=PROCESSOS_PADRAO, saida="relatorios", com_graficos=True) -> dict:
+    """
+    Gera a matriz UF × período e grava saida/manifesto.json. Retorna o manifesto.
+    - periodos: textos AAAA / AAAA-MM / AAAA-Snn; sem eles, os `ultimos` períodos do `modo`
+    - ufs: sem elas, todas as UFs da base (+ "TOTAL" se com_total)
+    """
+    t0 = time.perf_counter()
+    os.makedirs(saida, exist_ok=True)
+
+    # carga única (snapshot local quando o arquivo não mudou) + cubo publicado
+    df, info = base_iw58.carregar_base(fontes)
+    t_carga = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    # cubo publicado numa pasta só do lote (memória compartilhada, ou pasta temporária
+    # sem /dev/shm) e apagado no fim — não mexe no atual.json/cubos do dashboard
+    consulta = cubo_iw58.ConsultaCubo(cubo_iw58.montar_cubo(df, info["colunas"]))
+    pasta_lote = None
+    if cubo_iw58.DIR_COMPARTILHADO:
+        pasta_lote = os.path.join(cubo_iw58.DIR_COMPARTILHADO, f"lote_{os.getpid()}")
+        try:
+            os.makedirs(pasta_lote, exist_ok=True)
+            cubo_iw58.publicar_cubo(consulta.cubo, os.path.join(pasta_lote, "cubo"))
+        except OSError:  # sem espaço/permissão no tmpfs
+            shutil.rmtree(pasta_lote, ignore_errors=True)
+            pasta_lote = None
+    if pasta_lote is None:
+        pasta_lote = tempfile.mkdtemp(prefix="iw58_lote_")
+        cubo_iw58.publicar_cubo(consulta.cubo, os.path.join(pasta_lote, "cubo"))
+    pasta_cubo = os.path.join(pasta_lote, "cubo")
+    del df
+    t_cubo = time.perf_counter() - t1
+
+    lista_periodos = [periodo(p) for p in periodos] if periodos else ultimos_periodos(consulta.dias(), modo, ultimos)
+    lista_ufs = list(ufs) if ufs else (["TOTAL"] if com_total else []) + consulta.ufs()
+    tarefas = [(uf, per) for per in lista_periodos for uf in lista_ufs]
+    print(f"# base {info['linhas']:,} linhas ({info['status']}) • {len(lista_ufs)} UFs × "
+          f"{len(lista_periodos)} períodos = {len(tarefas)} relatórios • {processos} processos", file=sys.stderr)
+
+    relatorios, erros = [], []
+    t2 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(processos, len(tarefas))),
+        initializer=_iniciar_worker,
+        initargs=(pasta_cubo, info["colunas"], info["versao"], com_graficos),
+    ) as pool:
+        futuros = {pool.submit(_gerar_relatorio, uf, per, saida): (uf, per) for uf, per in tarefas}
+        for futuro in as_completed(futuros):
+            uf, per = futuros[futuro]
+            try:
+                r = futuro.result()
+                relatorios.append(r)
+                print(f"{per['nome']:<9} {uf:<6} {r['total']:>9,} notas  cards {r['t_cards']:.2f}s  "
+                      f"pdf {r['t_pdf']:.2f}s", file=sys.stderr)
+            except Exception as e:
+                erros.append({"uf": uf, "periodo": per["nome"], "erro": f"{type(e).__name__}: {e}"})
+                print(f"{per['nome']:<9} {uf:<6} ERRO {e}", file=sys.stderr)
+    t_lote = time.perf_counter() - t2
+
+    shutil.rmtree(pasta_lote, ignore_errors=True)
+
+    relatorios.sort(key=lambda r: (r["periodo"], r["uf"] != "TOTAL", r["uf"]))
+    manifesto = {
+        "gerado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "base": {k: info.get(k) for k in ("versao", "status", "linhas", "bytes", "t_download", "t_parse", "datas")},
+        "periodos": [{**p, "ini": p["ini"].isoformat(), "fim": p["fim"].isoformat()} for p in lista_periodos],
+        "ufs": lista_ufs,
+        "processos": processos,
+        "com_graficos": com_graficos,
+        "tempos": {
+            "carga": t_carga,
+            "cubo": t_cubo,
+            "relatorios": t_lote,
+            "total": time.perf_counter() - t0,
+        },
+        "relatorios": relatorios,
+        "erros": erros,
+    }
+    with open(os.path.join(saida, "manifesto.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    return manifesto
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Relatórios PDF em lote do dashboard IW58 (UF × período)")
+    ap.add_argument("fontes", nargs="+", help="link(s) da base ou .json com o manifesto de fontes")
+    ap.add_argument("--periodos", nargs="+", help="AAAA, AAAA-MM ou AAAA-Snn (semana seg–sex)")
+    ap.add_argument("--modo", choices=MODOS, default="semana", help="sem --periodos: tipo de período")
+    ap.add_argument("--ultimos", type=int, default=1, help="sem --periodos: quantos períodos (os mais recentes)")
+    ap.add_argument("--ufs", nargs="+", help="padrão: todas as UFs da base")
+    ap.add_argument("--sem-total", action="store_true", help="não gera o relatório TOTAL (todas as UFs)")
+    ap.add_argument("--sem-graficos", action="store_true", help="PDF só com totais e tabela (sem kaleido)")
+    ap.add_argument("--processos", type=int, default=PROCESSOS_PADRAO)
+    ap.add_argument("--saida", default="relatorios")
+    args = ap.parse_args(argv)
+
+    manifesto = gerar_lote(
+        _ler_fontes(args.fontes),
+        periodos=args.periodos,
+        modo=args.modo,
+        ultimos=args.ultimos,
+        ufs=args.ufs,
+        com_total=not args.sem_total,
+        processos=args.processos,
+        saida=args.saida,
+        com_graficos=not args.sem_graficos,
+    )
+    tempos = manifesto["tempos"]
+    print(f"\n{len(manifesto['relatorios'])} relatórios em {tempos['total']:.1f}s "
+          f"(carga {tempos['carga']:.1f}s • cubo {tempos['cubo']:.1f}s • PDFs {tempos['relatorios']:.1f}s) "
+          f"• {len(manifesto['erros'])} erros • manifesto: {os.path.join(args.saida, 'manifesto.json')}")
+    return 1 if manifesto["erros"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Métricas de desempenho do dashboard IW58 (tempo, linhas e memória por etapa).
+
+- etapa(nome): context manager que mede uma etapa (wall time + variação de RSS do
+  processo); o chamador pode informar as linhas processadas (m["linhas"] = n)
+- medir(nome): o mesmo como decorador / wrapper de função (ex.: cards no pool)
+- Agregado por etapa no processo (execuções, soma, máximo, última) + últimos eventos
+- Cada evento também vai para o logger "iw58.metricas" como JSON (nível INFO;
+  só aparece se o deploy configurar logging)
+- texto_prometheus(): formato de exposição do Prometheus; servir_prometheus(porta)
+  abre um /metrics (http.server, thread daemon) para o monitoramento
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======================================================
+# CONFIG
+# ======================================================
+MAX_EVENTOS = 500  # últimos eventos guardados (painel admin)
+LOG = logging.getLogger("iw58.metricas")
+
+_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _rss() -> int:
+    """RSS atual do processo em bytes (Linux: /proc/self/statm); None se indisponível."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGINA
+    except (OSError, ValueError, IndexError):
+        return None
+
+# ======================================================
+# REGISTRO
+# ======================================================
+class Metricas:
+    """
+    Registro das etapas (thread-safe, um por processo: METRICAS).
+    - resumo(): por etapa — execucoes, segundos (soma/máx/último), linhas e memória
+      da última execução
+    - eventos(): últimos MAX_EVENTOS eventos, mais recente primeiro
+    """
+
+    def __init__(self, max_eventos: int = MAX_EVENTOS):
+        self._lock = threading.Lock()
+        self._etapas = {}
+        self._eventos = deque(maxlen=max_eventos)
+        self.inicio = time.time()
+
+    def registrar(self, nome: str, segundos: float, linhas: int = None, memoria: int = None, **extra):
+        evento = {
+            "etapa": nome,
+            "segundos": segundos,
+            "linhas": linhas,
+            "memoria": memoria,  # variação de RSS (bytes) durante a etapa
+            "em": time.time(),
+            **extra,
+        }
+        with self._lock:
+            e = self._etapas.setdefault(nome, {
+                "execucoes": 0, "segundos": 0.0, "maximo": 0.0,
+                "ultimo": 0.0, "linhas": None, "memoria": None, "erros": 0,
+            })
+            e["execucoes"] += 1
+            e["segundos"] += segundos
+            e["maximo"] = max(e["maximo"], segundos)
+            e["ultimo"] = segundos
+            e["linhas"] = linhas
+            e["memoria"] = memoria
+            e["erros"] += 1 if extra.get("erro") else 0
+            self._eventos.append(evento)
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info(json.dumps(evento, ensure_ascii=False, default=str))
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {nome: dict(e) for nome, e in self._etapas.items()}
+
+    def eventos(self) -> list:
+        with self._lock:
+            return list(reversed(self._eventos))
+
+    def limpar(self):
+        with self._lock:
+            self._etapas.clear()
+            self._eventos.clear()
+            self.inicio = time.time()
+
+METRICAS = Metricas()
+
+@contextmanager
+def etapa(nome: str, linhas: int = None, registro: Metricas = None):
+    """
+    Mede o bloco como a etapa `nome`.
+    - O dict devolvido aceita "linhas" (e outros campos) preenchidos dentro do bloco
+    - Exceção: registrada com erro=<tipo> e propagada
+    """
+    medida = {"linhas": linhas}
+    rss0 = _rss()
+    t0 = time.perf_counter()
+    try:
+        yield medida
+    except BaseException as e:
+        medida["erro"] = type(e).__name__
+        raise
+    finally:
+        segundos = time.perf_counter() - t0
+        rss1 = _rss()
+        memoria = rss1 - rss0 if rss0 is not None and rss1 is not None else None
+        (registro or METRICAS).registrar(nome, segundos, memoria=memoria, **medida)
+
+def medir(nome: str, func=None):
+    """etapa() como decorador (medir("x")) ou wrapper (medir("x", func))."""
+    def decorar(f):
+        @wraps(f)
+        def medida(*args, **kwargs):
+            with etapa(nome):
+                return f(*args, **kwargs)
+        return medida
+    return decorar(func) if func is not None else decorar
+
+# ======================================================
+# PROMETHEUS
+# ======================================================
+def _rotulo(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def texto_prometheus(registro: Metricas = None, extras: dict = None) -> str:
+    """
+    Métricas no formato de exposição do Prometheus (text/plain; version=0.0.4).
+    - extras: gauges avulsos {nome: valor} (ex.: linhas da base, idade da versão)
+    """
+    registro = registro or METRICAS
+    resumo = registro.resumo()
+    series = [
+        ("iw58_etapa_execucoes_total", "counter", "Execuções da etapa", "execucoes"),
+        ("iw58_etapa_segundos_total", "counter", "Tempo acumulado da etapa (s)", "segundos"),
+        ("iw58_etapa_erros_total", "counter", "Execuções da etapa que falharam", "erros"),
+        ("iw58_etapa_segundos_max", "gauge", "Maior tempo da etapa (s)", "maximo"),
+        ("iw58_etapa_segundos_ultimo", "gauge", "Tempo da última execução da etapa (s)", "ultimo"),
+        ("iw58_etapa_linhas_ultimo", "gauge", "Linhas processadas na última execução", "linhas"),
+        ("iw58_etapa_memoria_bytes_ultimo", "gauge", "Variação de RSS na última execução (bytes)", "memoria"),
+    ]
+    linhas = []
+    for metrica, tipo, ajuda, campo in series:
+        linhas += [f"# HELP {metrica} {ajuda}", f"# TYPE {metrica} {tipo}"]
+        for nome, e in sorted(resumo.items()):
+            if e[campo] is not None:
+                linhas.append(f'{metrica}{{etapa="{_rotulo(nome)}"}} {e[campo]}')
+    rss = _rss()
+    if rss is not None:
+        linhas += ["# TYPE iw58_processo_rss_bytes gauge", f"iw58_processo_rss_bytes {rss}"]
+    for nome, valor in (extras or {}).items():
+        if valor is not None:
+            linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+    return "\n".join(linhas) + "\n"
+
+def servir_prometheus(porta: int, host: str = "127.0.0.1", extras=None) -> ThreadingHTTPServer:
+    """
+    Abre GET /metrics em host:porta (thread daemon) com texto_prometheus().
+    - extras: função sem argumentos que devolve os gauges avulsos (lida a cada scrape)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = texto_prometheus(extras=extras() if extras else None).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):  # sem log de acesso no stderr do Streamlit
+            pass
+
+    servidor = ThreadingHTTPServer((host, porta), Handler)
+    threading.Thread(target=servidor.serve_forever, name="iw58-metricas", daemon=True).start()
+    return servidor
@@ -0,0 +1,88 @@
+"""
+Períodos do dashboard IW58 (ano / mês / semana), os mesmos no app.py e no lote_iw58.py.
+
+- Ano e mês: limites do calendário
+- Semana: semana ISO inteira, segunda a sexta, identificada pelo ano ISO — a semana que
+  cruza a virada do ano (ex.: 30/12/2024 a 03/01/2025 = 2025-S01) não é cortada, para
+  que nenhum dia com nota fique fora de todas as semanas
+- No seletor do app, a semana de outro ano ISO aparece como "S01/2025" (ano 2024)
+"""
+import re
+from datetime import date, timedelta
+
+# ======================================================
+# LIMITES
+# ======================================================
+def limites_ano(ano: int) -> tuple:
+    """(01/01, 31/12) do ano."""
+    return date(ano, 1, 1), date(ano, 12, 31)
+
+def limites_semana(ano_iso: int, semana: int) -> tuple:
+    """(segunda, sexta) da semana ISO; ValueError se a semana não existe no ano ISO."""
+    return date.fromisocalendar(ano_iso, semana, 1), date.fromisocalendar(ano_iso, semana, 5)
+
+def recortar_ano(ini: date, fim: date, ano: int) -> tuple:
+    """Filtro por calendário: sempre dentro do ano selecionado."""
+    ano_ini, ano_fim = limites_ano(ano)
+    return max(ini, ano_ini), min(fim, ano_fim)
+
+# ======================================================
+# PERÍODO (texto AAAA / AAAA-MM / AAAA-Snn)
+# ======================================================
+def periodo(texto: str) -> dict:
+    """
+    Período a partir do texto (limites inclusivos):
+    - "2025": ano inteiro
+    - "2025-03": mês
+    - "2025-S10" (ou "2025-W10"): semana ISO 10 do ano ISO 2025, segunda a sexta
+    """
+    m = re.fullmatch(r"(\d{4})(?:-(?:(\d{1,2})|[SsWw](\d{1,2})))?", texto.strip())
+    if not m:
+        raise ValueError(f"Período inválido: {texto!r} (use AAAA, AAAA-MM ou AAAA-Snn)")
+    ano, mes, semana = int(m.group(1)), m.group(2), m.group(3)
+    if semana:
+        w = int(semana)
+        ini, fim = limites_semana(ano, w)
+        nome = f"{ano}-S{w:02d}"
+    elif mes:
+        mes = int(mes)
+        ini = date(ano, mes, 1)
+        fim = date(ano + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
+        nome = f"{ano}-{mes:02d}"
+    else:
+        ini, fim = limites_ano(ano)
+        nome = str(ano)
+    return {"nome": nome, "ano": ano, "ini": ini, "fim": fim}
+
+def ultimos_periodos(dias, modo: str, n: int) -> list:
+    """Os n últimos períodos (semana/mês/ano) com nota na base — dias: consulta.dias()."""
+    if not len(dias):
+        return []
+    if modo == "semana":
+        iso = dias.isocalendar()
+        chaves = sorted(set(zip(iso.year.astype(int), iso.week.astype(int))))
+        textos = [f"{a}-S{w:02d}" for a, w in chaves]
+    elif modo == "mes":
+        textos = sorted({f"{a}-{m:02d}" for a, m in zip(dias.year, dias.month)})
+    else:
+        textos = sorted({str(a) for a in dias.year})
+    return [periodo(t) for t in textos[-n:]]
+
+# ======================================================
+# SEMANAS DO SELETOR (app)
+# ======================================================
+def semanas_do_ano(dias_ano, ano: int) -> list:
+    """
+    Rótulos das semanas com nota no ano (dias_ano: dias do ano, ordenados).
+    - "S10": semana do próprio ano ISO; "S01/2025": semana do ano ISO vizinho
+    """
+    if not len(dias_ano):
+        return []
+    iso = dias_ano.isocalendar()
+    chaves = sorted(set(zip(iso.year.astype(int), iso.week.astype(int))))
+    return [f"S{w:02d}" if a == ano else f"S{w:02d}/{a}" for a, w in chaves]
+
+def periodo_semana(ano: int, rotulo: str) -> dict:
+    """Período do rótulo do seletor ("S10" no ano ou "S01/2025")."""
+    semana, _, ano_iso = rotulo.partition("/")
+    return periodo(f"{ano_iso or ano}-{semana}")
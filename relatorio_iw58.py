@@ -0,0 +1,300 @@
+"""
+Relatório PDF do dashboard IW58 (ReportLab, sem Streamlit).
+
+- gerar_pdf: documento de um filtro (totais + gráficos do dashboard + tabela mensal)
+- RenderizadorFiguras: figuras Plotly → PNG num único Chromium (kaleido) aberto uma
+  vez por processo; as figuras de um relatório saem num lote só, em abas paralelas
+- FilaRelatorios: geração sob demanda em segundo plano, com cache por chave
+  (versão da base + filtro) — o ReportLab fica fora do rerun do dashboard
+- kaleido 1.x precisa de um Chrome/Chromium no servidor: packages.txt instala o
+  chromium (Streamlit Cloud / devcontainer); sem ele o PDF sai sem os gráficos
+"""
+import asyncio
+import importlib.util
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+import metricas_iw58
+
+# kaleido (opcional): sem ele (ou sem Chrome) o PDF sai só com totais e tabela (PdfParcial)
+TEM_KALEIDO = importlib.util.find_spec("kaleido") is not None
+
+# ======================================================
+# CONFIG
+# ======================================================
+MAX_RELATORIOS = 32          # relatórios guardados por processo (LRU)
+MAX_RELATORIOS_PARALELOS = 2  # threads gerando relatórios ao mesmo tempo
+MAX_IMAGENS = 32             # lotes de imagens guardados por processo (LRU)
+ABAS_KALEIDO = 4             # abas do Chromium renderizando ao mesmo tempo
+TIMEOUT_KALEIDO = 90         # segundos (abrir o Chromium / renderizar um lote)
+LARGURA_MAX_IMAGEM = 1200    # px da figura que ocupa a largura toda da página
+ESCALA_IMAGEM = 2            # PNG em 2x (nítido na impressão)
+# figuras dos cards que vão para o PDF: (chave em cards, título, largura em px — 1200 = página toda)
+FIGURAS_RELATORIO = [
+    ("fig_am", "ACUMULADO ANUAL – AM", 600),
+    ("fig_as", "ACUMULADO ANUAL – AS", 600),
+    ("fig_regional_am", "IMPROCEDÊNCIAS POR REGIONAL – NOTA AM", 600),
+    ("fig_motivo_am", "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AM", 600),
+    ("fig_motivo_as", "MOTIVOS DE IMPROCEDÊNCIAS – NOTA AS", 1200),
+    ("fig_mensal", "ACUMULADO MENSAL DE NOTAS AM – AS", 1200),
+]
+
+def figuras_dos_cards(cards: dict) -> list:
+    """[(titulo, fig, largura_px)] dos cards (graficos_iw58.montar_cards) com gráfico."""
+    return [(titulo, cards[nome], largura) for nome, titulo, largura in FIGURAS_RELATORIO if cards[nome] is not None]
+
+# ======================================================
+# IMAGENS (kaleido)
+# ======================================================
+class RenderizadorFiguras:
+    """
+    Converte figuras Plotly em PNG com um único kaleido (Chromium) por processo.
+    - Aberto na primeira exportação e reaproveitado (nada de um processo por figura)
+    - renderizar(figuras, chave): o lote inteiro num write_fig_from_object
+      (ABAS_KALEIDO abas em paralelo); com chave, o lote fica em cache (LRU)
+    - Sem kaleido/Chrome: devolve [] e guarda o motivo em `erro`
+    """
+
+    def __init__(self, abas: int = ABAS_KALEIDO, limite: int = MAX_IMAGENS):
+        self.abas = abas
+        self.limite = limite
+        self.erro = None
+        self._loop = None
+        self._kaleido = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        # loop asyncio próprio numa thread: o kaleido fica aberto entre os relatórios
+        import kaleido
+
+        navegador = kaleido.Kaleido(n=self.abas)  # sem Chrome: ChromeNotFoundError aqui
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="kaleido", daemon=True).start()
+        try:
+            asyncio.run_coroutine_threadsafe(navegador.open(), loop).result(TIMEOUT_KALEIDO)
+        except Exception:
+            loop.call_soon_threadsafe(loop.stop)
+            raise
+        self._loop, self._kaleido = loop, navegador
+
+    def _rodar(self, corotina):
+        return asyncio.run_coroutine_threadsafe(corotina, self._loop).result(TIMEOUT_KALEIDO)
+
+    def renderizar(self, figuras: list, chave=None) -> list:
+        """
+        figuras: [(titulo, fig, largura_px)] → [(titulo, png, largura_px, altura_px)]
+        - altura_px: a do layout da figura (a mesma do dashboard)
+        """
+        if not figuras or not TEM_KALEIDO:
+            return []
+        with self._lock:  # um lote por vez no Chromium (as abas já paralelizam o lote)
+            if chave is not None and chave in self._cache:
+                self._cache.move_to_end(chave)
+                return self._cache[chave]
+            try:
+                if self._kaleido is None:
+                    with metricas_iw58.etapa("kaleido_iniciar"):
+                        self._iniciar()
+                with metricas_iw58.etapa("kaleido", linhas=len(figuras)):
+                    imagens = self._renderizar_lote(figuras)
+            except Exception as e:  # sem Chrome, timeout, figura inválida
+                self.erro = f"{type(e).__name__}: {e}"
+                return []
+            self.erro = None
+            if chave is not None:
+                self._cache[chave] = imagens
+                while len(self._cache) > self.limite:
+                    self._cache.popitem(last=False)
+            return imagens
+
+    def _renderizar_lote(self, figuras: list) -> list:
+        with tempfile.TemporaryDirectory() as tmp:
+            lote = []
+            for i, (titulo, fig, largura) in enumerate(figuras):
+                altura = fig.layout.height or 450
+                lote.append((titulo, largura, altura, dict(
+                    fig=fig,
+                    path=os.path.join(tmp, f"{i}.png"),
+                    opts=dict(format="png", width=largura, height=altura, scale=ESCALA_IMAGEM),
+                )))
+            self._rodar(self._kaleido.write_fig_from_object([spec for *_, spec in lote], cancel_on_error=True))
+            imagens = []
+            for titulo, largura, altura, spec in lote:
+                with open(spec["path"], "rb") as f:
+                    imagens.append((titulo, f.read(), largura, altura))
+            return imagens
+
+    def fechar(self):
+        with self._lock:
+            if self._kaleido is not None:
+                try:
+                    self._rodar(self._kaleido.close())
+                finally:
+                    self._loop.call_soon_threadsafe(self._loop.stop)
+                    self._loop, self._kaleido = None, None
+
+RENDERIZADOR = RenderizadorFiguras()
+
+def _bloco_figuras(imagens: list, largura_util: float, styles) -> list:
+    """
+    Flowables das figuras: largura proporcional a largura_px (LARGURA_MAX_IMAGEM = página
+    inteira); figuras de meia largura saem lado a lado.
+    """
+    escala = largura_util / LARGURA_MAX_IMAGEM
+    celulas = [
+        (largura, [
+            Paragraph(f"<b>{titulo}</b>", styles["Heading4"]),
+            Image(BytesIO(png), width=largura * escala, height=altura * escala),
+        ])
+        for titulo, png, largura, altura in imagens
+    ]
+
+    elementos, par = [], []
+
+    def fechar_par():
+        if par:
+            linha = Table([par + [""] * (2 - len(par))], colWidths=[largura_util / 2] * 2)
+            linha.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")]))
+            elementos.append(linha)
+            par.clear()
+
+    for largura, celula in celulas:
+        if largura * 2 <= LARGURA_MAX_IMAGEM:
+            par.append(celula)
+            if len(par) == 2:
+                fechar_par()
+        else:
+            fechar_par()
+            elementos.extend(celula)
+    fechar_par()
+    return elementos
+
+# ======================================================
+# PDF (relatório)
+# ======================================================
+@metricas_iw58.medir("gerar_pdf")
+def gerar_pdf(df_tabela, ano_ref, uf_sel, total, am, az, figuras=None, chave_figuras=None):
+    """
+    PDF do dashboard de um filtro.
+    - figuras: [(titulo, fig, largura_px)] renderizadas pelo RENDERIZADOR (kaleido);
+      chave_figuras (versão + filtro) reaproveita as imagens já geradas
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+    styles = getSampleStyleSheet()
+    elementos = []
+    elementos.append(Paragraph(f"<b>DASHBOARD NOTAS AM x AS – {ano_ref}</b>", styles["Title"]))
+    elementos.append(Spacer(1, 12))
+    elementos.append(Paragraph(f"<b>UF selecionada:</b> {uf_sel}", styles["Normal"]))
+    elementos.append(Spacer(1, 12))
+
+    elementos.append(Paragraph(
+        f"<b>Total de Notas:</b> {total}<br/>"
+        f"<b>AM:</b> {am} &nbsp;&nbsp; <b>AS:</b> {az}",
+        styles["Normal"]
+    ))
+    elementos.append(Spacer(1, 14))
+
+    imagens = []
+    if figuras:
+        imagens = RENDERIZADOR.renderizar(figuras, chave=chave_figuras)
+        if imagens:
+            elementos.extend(_bloco_figuras(imagens, doc.width, styles))
+        else:
+            elementos.append(Paragraph(
+                f"<i>Gráficos indisponíveis no PDF ({escape(RENDERIZADOR.erro or 'kaleido não instalado')[:200]}).</i>",
+                styles["Normal"]
+            ))
+        elementos.append(Spacer(1, 14))
+
+    if df_tabela is not None and not df_tabela.empty:
+        data = [df_tabela.columns.tolist()] + df_tabela.values.tolist()
+        tabela = Table(data, repeatRows=1)
+        tabela.setStyle(TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+            ("ALIGN", (1,1), (-1,-1), "CENTER"),
+            ("FONT", (0,0), (-1,0), "Helvetica-Bold"),
+            ("BOTTOMPADDING", (0,0), (-1,0), 8),
+            ("TOPPADDING", (0,0), (-1,0), 8),
+        ]))
+        elementos.append(Paragraph("<b>Resumo Mensal</b>", styles["Heading2"]))
+        elementos.append(Spacer(1, 8))
+        elementos.append(tabela)
+
+    doc.build(elementos)
+    buffer.seek(0)
+    # pediu gráficos e não vieram: a FilaRelatorios não guarda este PDF
+    buffer.sem_graficos = (RENDERIZADOR.erro or "kaleido não instalado") if figuras and not imagens else None
+    return buffer
+
+# ======================================================
+# FILA (geração em segundo plano + cache)
+# ======================================================
+class PdfParcial(bytes):
+    """PDF que saiu sem os gráficos (sem kaleido/Chrome, timeout): motivo em .motivo."""
+    motivo = None
+
+class FilaRelatorios:
+    """
+    Gera relatórios sob demanda em threads próprias, uma vez por chave.
+    - pedir(chave, gerar, *args): agenda gerar(*args) (se a chave ainda não foi pedida)
+      e devolve o Future — resultado em bytes (BytesIO vira bytes)
+    - tarefa(chave): Future já pedido (pronto ou em andamento) ou None
+    - LRU de `limite` chaves; pedido que falhou, ou PDF sem os gráficos (PdfParcial),
+      sai do cache quando termina: quem pediu recebe, o próximo pedido tenta de novo
+    """
+
+    def __init__(self, limite: int = MAX_RELATORIOS, max_paralelos: int = MAX_RELATORIOS_PARALELOS):
+        self.limite = limite
+        self._pool = ThreadPoolExecutor(max_workers=max_paralelos, thread_name_prefix="relatorio")
+        self._tarefas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tarefa(self, chave):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                self._tarefas.move_to_end(chave)
+            return tarefa
+
+    def pedir(self, chave, gerar, *args, **kwargs):
+        with self._lock:
+            if chave in self._tarefas:
+                self._tarefas.move_to_end(chave)
+                return self._tarefas[chave]
+            tarefa = self._pool.submit(self._gerar, gerar, args, kwargs)
+            self._tarefas[chave] = tarefa
+            while len(self._tarefas) > self.limite:
+                self._tarefas.popitem(last=False)
+        tarefa.add_done_callback(lambda t: self._descartar_se_falhou(chave, t))
+        return tarefa
+
+    @staticmethod
+    def _gerar(gerar, args, kwargs) -> bytes:
+        res = gerar(*args, **kwargs)
+        if not isinstance(res, BytesIO):
+            return res
+        if getattr(res, "sem_graficos", None):
+            parcial = PdfParcial(res.getvalue())
+            parcial.motivo = res.sem_graficos
+            return parcial
+        return res.getvalue()
+
+    def _descartar_se_falhou(self, chave, tarefa):
+        if tarefa.exception() is None and not isinstance(tarefa.result(), PdfParcial):
+            return
+        with self._lock:
+            if self._tarefas.get(chave) is tarefa:
+                del self._tarefas[chave]
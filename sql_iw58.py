@@ -0,0 +1,317 @@
+"""
+Motor SQL (SQLite) da base IW58 — alternativa ao cubo em memória (cubo_iw58).
+
+- Uma linha por nota na tabela `notas`, com índices em DIA, UF e AMAS/CLASSE
+  (tipo e resultado já classificados por base_iw58.preparar_base)
+- Filtros do dashboard (ano, semana, calendário) e a agregação dos cards viram SQL
+  (WHERE dia ... GROUP BY): cada processo só guarda o resultado das consultas,
+  não a base inteira
+- A UF não vai para o WHERE: a fatia do período já vem agregada (dia × UF × AM/AS ×
+  classe × regional × motivo, poucos milhares de linhas) e serve a todas as abas de UF
+  e ao resumo por localidade, que precisa de todas as UFs — a troca de UF filtra esse
+  resultado em pandas, sem nova consulta ao banco
+- Deltas: as notas que saíram são apagadas pela chave (_CHAVE_), que inclui a fonte
+- Um arquivo de banco por versão da base (como as pastas do cubo_iw58), em disco
+  (DIR_SNAPSHOT): um arquivo publicado nunca é alterado nem substituído — quem
+  consulta a versão anterior continua lendo o arquivo dela. Um ponteiro (.atual.json)
+  indica a versão vigente: no cold start o dashboard já responde do banco, sem ler
+  snapshot nem reprocessar nada
+- Mesma interface de cubo_iw58.MotorCubo / ConsultaCubo (escolha no app: IW58_MOTOR=sqlite)
+"""
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import base_iw58
+from cubo_iw58 import DIMENSOES, ordenar_cubo
+
+# ======================================================
+# CONFIG
+# ======================================================
+# ⚠️ Suba este número sempre que mudar o esquema (força remontar o banco)
+VERSAO_BANCO = 2
+
+ESQUEMA = """
+CREATE TABLE notas (
+    chave    INTEGER,   -- _CHAVE_ (base_iw58._impressao_linhas), para aplicar deltas
+    dia      TEXT,      -- AAAA-MM-DD (NULL = sem data)
+    uf       TEXT,
+    amas     TEXT,
+    classe   TEXT,
+    regional TEXT,
+    motivo   TEXT
+);
+CREATE TABLE meta (nome TEXT PRIMARY KEY, valor TEXT);
+"""
+# ix_notas_dia cobre a consulta dos cards (período → GROUP BY sem ler a tabela)
+INDICES = """
+CREATE INDEX ix_notas_dia ON notas (dia, uf, amas, classe, regional, motivo);
+CREATE INDEX ix_notas_uf ON notas (uf, dia);
+CREATE INDEX ix_notas_amas_classe ON notas (amas, classe, dia);
+CREATE INDEX ix_notas_chave ON notas (chave);
+"""
+INSERIR = "INSERT INTO notas VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def caminho_banco(fontes) -> str:
+    """
+    Prefixo dos bancos de um manifesto de fontes (mesma ideia do snapshot por fonte).
+    - Cada versão: <prefixo>_<versão>.sqlite; versão vigente: <prefixo>.atual.json
+    """
+    return os.path.join(base_iw58.DIR_SNAPSHOT, f"iw58_{base_iw58.chave_fontes(fontes)}")
+
+# ======================================================
+# CONVERSÃO (DataFrame ↔ linhas)
+# ======================================================
+def _valores(s) -> list:
+    # lista Python com None no lugar de NaN/NaT (o que o sqlite3 entende)
+    s = pd.Series(s)
+    return s.astype(object).where(s.notna(), None).tolist()
+
+def _linhas(df: pd.DataFrame, colunas: dict):
+    """Linhas de `notas` a partir da base preparada (ou de um delta dela)."""
+    vazio = [None] * len(df)
+    dia = df[colunas["data"]].dt.strftime("%Y-%m-%d") if colunas.get("data") else vazio
+    return zip(
+        df["_CHAVE_"].to_numpy().view(np.int64).tolist(),
+        _valores(dia),
+        _valores(df["_UF_"]) if "_UF_" in df else vazio,
+        _valores(df["_AMAS_"]) if "_AMAS_" in df else vazio,
+        _valores(df["_CLASSE_"]) if "_CLASSE_" in df else vazio,
+        _valores(df[colunas["regional"]]) if colunas.get("regional") else vazio,
+        _valores(df[colunas["motivo"]]) if colunas.get("motivo") else vazio,
+    )
+
+def _categorias(df: pd.DataFrame, anteriores: dict = None) -> dict:
+    """
+    Ordem das categorias de UF/AMAS/CLASSE (a mesma do cubo em pandas), para as
+    fatias do banco produzirem os mesmos gráficos; valores novos vão para o fim.
+    """
+    categorias = {col: list(vals) for col, vals in (anteriores or {}).items()}
+    for col, origem in (("UF", "_UF_"), ("AMAS", "_AMAS_"), ("CLASSE", "_CLASSE_")):
+        if origem in df and isinstance(df[origem].dtype, pd.CategoricalDtype):
+            atuais = categorias.setdefault(col, [])
+            atuais += [v for v in df[origem].cat.categories.tolist() if v not in atuais]
+    return categorias
+
+def _gravar_meta(con, info: dict, categorias: dict):
+    meta = {
+        "formato": str(VERSAO_BANCO),
+        "info": json.dumps(info, ensure_ascii=False, default=str),
+        "categorias": json.dumps(categorias, ensure_ascii=False),
+    }
+    con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+
+# ======================================================
+# CONSULTAS
+# ======================================================
+class ConsultaSQL:
+    """
+    Consultas do dashboard direto no banco (mesma interface de cubo_iw58.ConsultaCubo).
+    Uma conexão somente leitura por objeto, compartilhada entre sessões (com lock).
+    - A conexão abre já no construtor: o arquivo da versão fica preso a ela mesmo que
+      o motor apague a versão depois (ver _gravar_atual)
+    """
+
+    def __init__(self, caminho: str, categorias: dict):
+        self.caminho = caminho
+        self.categorias = categorias
+        self._con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._dias = None
+        self._ufs = None
+
+    def _executar(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._con.execute(sql, params).fetchall()
+
+    def dias(self) -> pd.DatetimeIndex:
+        if self._dias is None:
+            linhas = self._executar("SELECT DISTINCT dia FROM notas WHERE dia IS NOT NULL ORDER BY dia")
+            self._dias = pd.DatetimeIndex(pd.to_datetime([d for (d,) in linhas], format="%Y-%m-%d"))
+        return self._dias
+
+    def ufs(self) -> list:
+        if self._ufs is None:
+            self._ufs = sorted(uf for (uf,) in self._executar("SELECT DISTINCT uf FROM notas WHERE uf IS NOT NULL"))
+        return self._ufs
+
+    def fatia(self, ini=None, fim=None) -> pd.DataFrame:
+        """
+        Cubo do período (mesmo formato de cubo_iw58.montar_cubo), agregado no banco.
+        - ini/fim: datas inclusivas; fim None inclui as notas sem data (como fatiar_por_data)
+        - Todas as UFs (ver cabeçalho do módulo): a aba de UF filtra o resultado agregado
+        """
+        filtros, params = [], []
+        if ini is not None:
+            filtros.append("dia >= ?")
+            params.append(pd.Timestamp(ini).strftime("%Y-%m-%d"))
+        if fim is not None:
+            filtros.append("dia <= ?")
+            params.append(pd.Timestamp(fim).strftime("%Y-%m-%d"))
+        where = " AND ".join(filtros)
+        if ini is not None and fim is None:
+            where = f"({where}) OR dia IS NULL"
+        linhas = self._executar(
+            "SELECT dia, uf, amas, classe, regional, motivo, COUNT(*) FROM notas"
+            + (f" WHERE {where}" if where else "")
+            + " GROUP BY dia, uf, amas, classe, regional, motivo",
+            params,
+        )
+
+        cubo = pd.DataFrame(linhas, columns=DIMENSOES + ["QTD"])
+        cubo["DIA"] = pd.to_datetime(cubo["DIA"], format="%Y-%m-%d")
+        cubo["QTD"] = cubo["QTD"].astype(np.int64)
+        for col in DIMENSOES[1:]:
+            if col in self.categorias:
+                categorias = self.categorias[col]
+                extras = sorted(set(cubo[col].dropna()) - set(categorias))
+                cubo[col] = pd.Categorical(cubo[col], categories=categorias + extras)
+            else:
+                cubo[col] = cubo[col].astype("category")
+        return ordenar_cubo(cubo)
+
+# ======================================================
+# VERSÕES (um arquivo por versão + ponteiro)
+# ======================================================
+def _publicar(tmp: str, caminho: str) -> bool:
+    """
+    Publica o banco montado em `tmp` como `caminho` sem nunca sobrescrever um banco
+    existente (os.link falha se outro processo já publicou a mesma versão).
+    Retorna False quando a versão já existia (o tmp é descartado).
+    """
+    try:
+        os.link(tmp, caminho)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:  # sistema de arquivos sem hard link: rename atômico se ainda não existe
+        if os.path.exists(caminho):
+            return False
+        os.rename(tmp, caminho)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _ler_atual(prefixo: str) -> dict:
+    try:
+        with open(f"{prefixo}.atual.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _gravar_atual(prefixo: str, caminho: str):
+    """
+    Aponta <prefixo>.atual.json para a versão publicada e apaga versões antigas
+    (mantém a vigente e a anterior). Quem ainda está conectado a um arquivo apagado
+    continua lendo até fechar (a conexão segura o arquivo).
+    """
+    anterior = _ler_atual(prefixo).get("caminho")
+    tmp = f"{prefixo}.atual.json.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"caminho": caminho}, f)
+    os.replace(tmp, f"{prefixo}.atual.json")
+    pasta, nome_prefixo = os.path.split(prefixo)
+    for nome in os.listdir(pasta):
+        arquivo = os.path.join(pasta, nome)
+        versao_antiga = nome.startswith(f"{nome_prefixo}_") and ".tmp" not in nome
+        legado = nome.startswith(f"{nome_prefixo}.sqlite")  # banco único (+ -wal/-shm) de antes
+        if (versao_antiga or legado) and arquivo not in (caminho, anterior):
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
+
+# ======================================================
+# MOTOR (SQLite)
+# ======================================================
+class MotorSQL:
+    """
+    Motor do AtualizadorBase que guarda a base num banco SQLite local.
+    - montar: banco da versão montado ao lado (.tmp<pid>) e publicado sem sobrescrever nada
+    - atualizar: cópia do banco anterior (backup do SQLite) + delta numa transação,
+      publicada como o banco da versão nova — o banco anterior não muda
+    - restaurar: versão vigente (ponteiro .atual.json) — cold start
+    - Sem WAL: o arquivo só é escrito antes de publicado; depois, só leitura (mode=ro)
+    """
+    guardar_base = False  # a base fica no banco, não na memória do processo
+
+    def __init__(self, prefixo: str):
+        self.prefixo = prefixo
+
+    def _caminho(self, info: dict) -> str:
+        # o formato entra no nome: banco de um esquema/chave antigo nunca é reaproveitado
+        return f"{self.prefixo}_{info['versao'][:16]}_v{VERSAO_BANCO}.sqlite"
+
+    def _abrir(self, caminho: str) -> ConsultaSQL:
+        con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT nome, valor FROM meta"))
+        finally:
+            con.close()
+        return ConsultaSQL(caminho, json.loads(meta["categorias"]))
+
+    def _gravar(self, info: dict, preencher) -> ConsultaSQL:
+        """Monta o banco da versão num .tmp com preencher(con) e publica."""
+        caminho = self._caminho(info)
+        if not os.path.exists(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            tmp = f"{caminho}.tmp{os.getpid()}"
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            con = sqlite3.connect(tmp)
+            try:
+                preencher(con)
+            finally:
+                con.close()
+            _publicar(tmp, caminho)
+        _gravar_atual(self.prefixo, caminho)
+        return self._abrir(caminho)
+
+    def montar(self, df: pd.DataFrame, info: dict) -> ConsultaSQL:
+        def preencher(con):
+            con.executescript(ESQUEMA)
+            con.executemany(INSERIR, _linhas(df, info["colunas"]))
+            con.executescript(INDICES)
+            _gravar_meta(con, info, _categorias(df))
+            con.commit()
+
+        return self._gravar(info, preencher)
+
+    def atualizar(self, consulta: ConsultaSQL, info: dict, mais, menos) -> ConsultaSQL:
+        categorias = _categorias(mais, consulta.categorias)
+
+        def preencher(con):
+            with consulta._lock:
+                consulta._con.backup(con)  # cópia consistente da versão anterior
+            with con:  # uma transação: ou entra o delta inteiro, ou nada
+                con.executemany(
+                    "DELETE FROM notas WHERE chave = ?",
+                    ((c,) for c in menos["_CHAVE_"].to_numpy().view(np.int64).tolist()),
+                )
+                con.executemany(INSERIR, _linhas(mais, info["colunas"]))
+                _gravar_meta(con, info, categorias)
+
+        return self._gravar(info, preencher)
+
+    def restaurar(self):
+        caminho = _ler_atual(self.prefixo).get("caminho")
+        if not caminho or not os.path.exists(caminho):
+            return None
+        try:
+            con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+            try:
+                meta = dict(con.execute("SELECT nome, valor FROM meta"))
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return None
+        if meta.get("formato") != str(VERSAO_BANCO):
+            return None
+        info = json.loads(meta["info"])
+        info["status"] = "banco"
+        return info, ConsultaSQL(caminho, json.loads(meta["categorias"]))
@@ -0,0 +1,58 @@
+"""
+Fixtures dos testes do dashboard IW58.
+
+- servidor: http.server local servindo uma pasta temporária (as fontes da base), com
+  Last-Modified — o mesmo caminho de download/304 do Drive
+- cache: DIR_SNAPSHOT numa pasta temporária (snapshots e bancos SQLite do teste)
+"""
+import functools
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base_iw58  # noqa: E402
+from bench_iw58 import exportar_bytes  # noqa: E402
+
+class _Silencioso(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class Servidor:
+    """Fontes servidas por HTTP; publicar() grava o arquivo com um mtime sempre maior."""
+
+    def __init__(self, pasta: str, url: str):
+        self.pasta = pasta
+        self.url = url
+        self._mtime = 1_700_000_000
+
+    def publicar(self, nome: str, df, formato: str = "xlsx") -> str:
+        caminho = os.path.join(self.pasta, f"{nome}.{formato}")
+        with open(caminho, "wb") as f:
+            f.write(exportar_bytes(df, formato))
+        # Last-Modified tem resolução de segundos: cada versão ganha 10 s a mais
+        self._mtime += 10
+        os.utime(caminho, (self._mtime, self._mtime))
+        return f"{self.url}/{nome}.{formato}"
+
+@pytest.fixture
+def servidor(tmp_path):
+    pasta = tmp_path / "www"
+    pasta.mkdir()
+    http = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Silencioso, directory=str(pasta)))
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    try:
+        yield Servidor(str(pasta), f"http://127.0.0.1:{http.server_address[1]}")
+    finally:
+        http.shutdown()
+        http.server_close()
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    pasta = tmp_path / "cache"
+    monkeypatch.setattr(base_iw58, "DIR_SNAPSHOT", str(pasta))
+    return pasta
@@ -0,0 +1,64 @@
+"""
+Leitura da coluna DATA (base_iw58.inferir_formato_data / _converter_datas).
+"""
+import numpy as np
+import pandas as pd
+
+import base_iw58
+from base_iw58 import SERIAL_EXCEL
+
+def _converter(valores, dtype=None):
+    datas = {}
+    conv, invalidas = base_iw58._converter_datas(pd.Series(valores, dtype=dtype), datas)
+    return conv, invalidas, datas
+
+def test_formato_dominante_dia_mes():
+    # 03/04 é 3 de abril (dia primeiro), não 4 de março
+    conv, invalidas, datas = _converter(["03/04/2025", "15/04/2025", "30/12/2024"], dtype="str")
+    assert datas["formato"] == "%d/%m/%Y"
+    assert conv.tolist() == [pd.Timestamp("2025-04-03"), pd.Timestamp("2025-04-15"), pd.Timestamp("2024-12-30")]
+    assert not invalidas.any()
+
+def test_formatos_misturados_e_invalidas():
+    valores = ["03/04/2025", "2025-04-05 08:30:00", "00/00/0000", "", None, "ontem"]
+    conv, invalidas, datas = _converter(valores, dtype="str")
+    assert conv[0] == pd.Timestamp("2025-04-03")
+    assert conv[1] == pd.Timestamp("2025-04-05 08:30")
+    # preenchidas e ilegíveis contam; vazio / nulo não
+    assert invalidas.tolist() == [False, False, True, False, False, True]
+    assert datas["invalidas"] == 2
+    assert set(datas["exemplos"]) == {"00/00/0000", "ontem"}
+
+def test_serial_excel_numerico():
+    conv, invalidas, datas = _converter([45000, 45001.5, np.nan])
+    assert datas["formato"] == SERIAL_EXCEL
+    assert conv[0] == pd.Timestamp("2023-03-15")
+    assert conv[1] == pd.Timestamp("2023-03-16 12:00")
+    assert pd.isna(conv[2]) and not invalidas.any()
+
+def test_texto_numerico_nao_vira_serial():
+    # pandas 3: texto é str, não object — "45000" não pode virar 15/03/2023
+    conv, invalidas, datas = _converter(["45000", "45001"], dtype="str")
+    assert datas["formato"] != SERIAL_EXCEL
+    assert conv.isna().all()
+    assert invalidas.tolist() == [True, True]
+
+def test_object_misturado_so_numeros_sao_seriais():
+    conv, invalidas, _ = _converter([45000, "03/04/2025", True], dtype=object)
+    assert conv[0] == pd.Timestamp("2023-03-15")
+    assert conv[1] == pd.Timestamp("2025-04-03")
+    assert invalidas.tolist() == [False, False, True]
+
+def test_formato_preferido_e_testado_primeiro():
+    # o formato já visto na fonte é o 1º testado; coluna sem valores mantém o da fonte
+    s = pd.Series(["2025-02-01", "2025-03-01"], dtype="str")
+    assert base_iw58.inferir_formato_data(s, preferido="%Y-%m-%d") == "%Y-%m-%d"
+    assert base_iw58.inferir_formato_data(pd.Series([], dtype="str"), preferido="%d/%m/%Y") == "%d/%m/%Y"
+
+def test_resultado_nao_depende_das_outras_linhas():
+    # o delta converte só as linhas novas: cada valor tem de dar o mesmo que na base inteira
+    valores = ["03/04/2025", "2025-04-05 08:30:00", "05/04/2025 10:00", "00/00/0000"]
+    inteira, _, _ = _converter(valores, dtype="str")
+    for i, valor in enumerate(valores):
+        sozinho, _, _ = _converter([valor], dtype="str")
+        assert sozinho[0] == inteira[i] or (pd.isna(sozinho[0]) and pd.isna(inteira[i]))
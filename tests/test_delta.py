@@ -0,0 +1,107 @@
+"""
+Atualização por delta (base_iw58 + motores) == reconstrução completa.
+
+Para cada motor (cubo em pandas e SQLite), uma ou várias fontes: a 1ª versão é
+montada, as fontes mudam (notas novas / alteradas) e o motor é atualizado pelo
+delta; o resultado tem de ser o mesmo cubo de uma carga do zero da versão nova.
+"""
+import pytest
+
+import base_iw58
+import cubo_iw58
+import sql_iw58
+from bench_iw58 import gerar_base_sintetica
+from cubo_iw58 import DIMENSOES
+
+def _motor(nome: str, fontes):
+    if nome == "sql":
+        return sql_iw58.MotorSQL(sql_iw58.caminho_banco(fontes))
+    return cubo_iw58.MotorCubo("")  # sem memória compartilhada: cubo só no processo
+
+def _contagens(cubo) -> dict:
+    """Cubo → {(dia, uf, amas, classe, regional, motivo): qtd}, sem as combinações zeradas."""
+    chaves = cubo[DIMENSOES].astype(object).fillna("")
+    chaves["DIA"] = cubo["DIA"].dt.strftime("%Y-%m-%d").fillna("")
+    qtd = cubo["QTD"].groupby([chaves[c] for c in DIMENSOES]).sum()
+    return {k: int(v) for k, v in qtd.items() if v}
+
+def _reconstruir(fontes, pasta, monkeypatch) -> dict:
+    # carga do zero num cache vazio (nenhum snapshot, nenhum delta)
+    monkeypatch.setattr(base_iw58, "DIR_SNAPSHOT", str(pasta))
+    df, info = base_iw58.carregar_base(fontes)
+    return _contagens(cubo_iw58.montar_cubo(df, info["colunas"]))
+
+def _alterar(df, n: int):
+    """Copia de df com n notas PROCEDENTE passando a IMPROCEDENTE (nota alterada)."""
+    df = df.copy()
+    idx = df.index[df["Resultado"] == "PROCEDENTE"][:n]
+    df.loc[idx, "Resultado"] = "IMPROCEDENTE"
+    return df
+
+def _atualizar_e_comparar(motor_nome, publicar, tmp_path, monkeypatch):
+    """publicar(versao) grava as fontes e devolve a lista de URLs."""
+    fontes = publicar(1)
+    motor = _motor(motor_nome, fontes)
+    deltas = []
+    atualizar = motor.atualizar
+    motor.atualizar = lambda *a: deltas.append(a) or atualizar(*a)
+
+    atualizador = base_iw58.AtualizadorBase(fontes, intervalo=3600, motor=motor)
+    v1 = atualizador.obter(timeout=120)
+    publicar(2)
+    atualizador.agendar(esperar=120)
+    v2 = atualizador.obter()
+
+    assert atualizador.erro is None
+    assert v2.info["versao"] != v1.info["versao"]
+    assert deltas, "a versão nova deveria ter vindo por delta"
+    esperado = _reconstruir(fontes, tmp_path / "cache_completo", monkeypatch)
+    assert _contagens(v2.consulta.fatia()) == esperado
+    assert cubo_iw58.total(v2.consulta.fatia()) == sum(esperado.values())
+
+@pytest.fixture(scope="module")
+def base():
+    return gerar_base_sintetica(3000, seed=7)
+
+@pytest.mark.parametrize("motor_nome", ["cubo", "sql"])
+@pytest.mark.parametrize("formato", ["xlsx", "csv"])
+def test_delta_uma_fonte(motor_nome, formato, base, servidor, cache, tmp_path, monkeypatch):
+    def publicar(versao):
+        # v1: 2500 notas; v2: +500 notas novas e 20 alteradas
+        df = base.iloc[:2500] if versao == 1 else _alterar(base, 20)
+        return [servidor.publicar("base", df, formato)]
+
+    _atualizar_e_comparar(motor_nome, publicar, tmp_path, monkeypatch)
+
+@pytest.mark.parametrize("motor_nome", ["cubo", "sql"])
+def test_delta_varias_fontes_com_notas_repetidas(motor_nome, base, servidor, cache, tmp_path, monkeypatch):
+    # fonte B repete 500 notas da fonte A; na v2 só B muda (10 notas alteradas):
+    # o delta de B não pode apagar as notas iguais de A
+    def publicar(versao):
+        b = base.iloc[:500] if versao == 1 else _alterar(base.iloc[:500], 10)
+        return [servidor.publicar("a", base.iloc[:2500]), servidor.publicar("b", b)]
+
+    _atualizar_e_comparar(motor_nome, publicar, tmp_path, monkeypatch)
+
+@pytest.mark.parametrize("motor_nome", ["cubo", "sql"])
+def test_delta_varias_fontes_todas_mudam(motor_nome, base, servidor, cache, tmp_path, monkeypatch):
+    # A cresce, B (CSV) ganha notas e tem notas alteradas
+    def publicar(versao):
+        a = base.iloc[:1500] if versao == 1 else base.iloc[:1800]
+        b = base.iloc[2000:2600] if versao == 1 else _alterar(base.iloc[2000:], 15)
+        return [servidor.publicar("a", a), servidor.publicar("b", b, "csv")]
+
+    _atualizar_e_comparar(motor_nome, publicar, tmp_path, monkeypatch)
+
+@pytest.mark.parametrize("motor_nome", ["cubo", "sql"])
+def test_nota_removida_reconstroi(motor_nome, base, servidor, cache, tmp_path, monkeypatch):
+    # nota que some do arquivo não é acréscimo: o motor remonta a versão inteira
+    url = servidor.publicar("base", base.iloc[:2500])
+    motor = _motor(motor_nome, [url])
+    atualizador = base_iw58.AtualizadorBase([url], intervalo=3600, motor=motor)
+    atualizador.obter(timeout=120)
+    servidor.publicar("base", base.iloc[:2500].drop(index=base.index[7]))
+    atualizador.agendar(esperar=120)
+
+    esperado = _reconstruir([url], tmp_path / "cache_completo", monkeypatch)
+    assert _contagens(atualizador.obter().consulta.fatia()) == esperado
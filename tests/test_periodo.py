@@ -0,0 +1,58 @@
+"""
+Períodos do app e do lote (periodo_iw58).
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from periodo_iw58 import periodo, periodo_semana, recortar_ano, semanas_do_ano, ultimos_periodos
+
+def _dias(*datas):
+    return pd.DatetimeIndex(pd.to_datetime(list(datas)))
+
+def test_periodo_ano_mes_semana():
+    assert periodo("2025") == {"nome": "2025", "ano": 2025, "ini": date(2025, 1, 1), "fim": date(2025, 12, 31)}
+    assert periodo("2024-02")["fim"] == date(2024, 2, 29)
+    assert periodo("2025-12")["fim"] == date(2025, 12, 31)
+    sem = periodo("2025-S10")
+    assert (sem["nome"], sem["ini"], sem["fim"]) == ("2025-S10", date(2025, 3, 3), date(2025, 3, 7))
+    assert periodo("2025-w10") == sem
+
+@pytest.mark.parametrize("texto", ["25", "2025-13-01", "2025-S", "semana 10", "2025-S54"])
+def test_periodo_invalido(texto):
+    with pytest.raises(ValueError):
+        periodo(texto)
+
+def test_semana_que_cruza_o_ano_nao_e_cortada():
+    # 30/12/2024 é da semana ISO 2025-S01: a semana inteira (seg–sex) entra
+    sem = periodo("2025-S01")
+    assert (sem["ini"], sem["fim"]) == (date(2024, 12, 30), date(2025, 1, 3))
+
+def test_ultimas_semanas_cobrem_a_virada_do_ano():
+    dias = _dias("2024-12-20", "2024-12-27", "2024-12-30", "2024-12-31")
+    ultimas = ultimos_periodos(dias, "semana", 2)
+    assert [p["nome"] for p in ultimas] == ["2024-S52", "2025-S01"]
+    # todo dia com nota cai em algum dos relatórios
+    for dia in dias[1:]:
+        assert any(p["ini"] <= dia.date() <= p["fim"] for p in ultimas)
+
+def test_ultimos_meses_e_anos():
+    dias = _dias("2024-11-05", "2024-12-30", "2025-01-02")
+    assert [p["nome"] for p in ultimos_periodos(dias, "mes", 2)] == ["2024-12", "2025-01"]
+    assert [p["nome"] for p in ultimos_periodos(dias, "ano", 5)] == ["2024", "2025"]
+    assert ultimos_periodos(_dias(), "semana", 3) == []
+
+def test_semanas_do_seletor_separam_o_ano_iso():
+    # ano 2024: S01 de janeiro e a semana de 30/12 (2025-S01) não podem se confundir
+    dias = _dias("2024-01-02", "2024-12-27", "2024-12-30")
+    rotulos = semanas_do_ano(dias, 2024)
+    assert rotulos == ["S01", "S52", "S01/2025"]
+    assert periodo_semana(2024, "S01")["ini"] == date(2024, 1, 1)
+    assert periodo_semana(2024, "S01/2025") == periodo("2025-S01")
+    # 01/01/2021 é da semana 53 de 2020
+    assert semanas_do_ano(_dias("2021-01-01", "2021-01-04"), 2021) == ["S53/2020", "S01"]
+
+def test_recortar_ano():
+    assert recortar_ano(date(2024, 12, 1), date(2025, 2, 1), 2024) == (date(2024, 12, 1), date(2024, 12, 31))
+    assert recortar_ano(date(2024, 12, 1), date(2025, 2, 1), 2025) == (date(2025, 1, 1), date(2025, 2, 1))